@@ -1,4 +1,14 @@
 from gdax.authenticated_client import AuthenticatedClient
 from gdax.public_client import PublicClient
 from gdax.websocket_client import WebsocketClient
+try:
+    from gdax.async_websocket_client import AsyncWebsocketClient
+except SyntaxError:
+    # async/await needs Python 3.5+; the rest of the package still works on older Pythons
+    pass
 from gdax.order_book import OrderBook
+from gdax.level2_order_book import Level2OrderBook
+from gdax.order_book_manager import OrderBookManager
+from gdax.order_book_pool import OrderBookPool
+from gdax.top_of_book import TopOfBookReader, TopOfBookWriter
+from gdax.book_publisher import ConflatingPublisher
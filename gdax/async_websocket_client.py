@@ -0,0 +1,236 @@
+#
+# gdax/async_websocket_client.py
+#
+# Websocket feed client on asyncio: receiving, keepalive pings, timers and order I/O are
+# tasks on one event loop, so none of them waits for market data to arrive
+
+from __future__ import print_function
+import asyncio
+import functools
+import json
+import time
+from threading import Thread, current_thread
+
+from gdax.gdax_auth import get_auth_headers
+from gdax.feed_decoder import FeedDecoder
+
+
+class AsyncWebsocketClient(object):
+    ''' asyncio counterpart of WebsocketClient, with the same on_open/on_message/on_error/on_close hooks.
+
+    The hooks run on the event loop and must not block it: start coroutines with create_task,
+    periodic work with call_every, and synchronous calls such as AuthenticatedClient orders with
+    run_blocking, which runs them in the loop's executor. Needs the optional `websockets` package.
+
+    Either await run() from your own loop, or call start() to run it on a new loop in a thread.
+    `decoder` turns frames into messages as in WebsocketClient.
+    '''
+
+    def __init__(self, url="wss://ws-feed.gdax.com", products=None, message_type="subscribe", mongo_collection=None,
+                 should_print=True, auth=False, api_key="", api_secret="", api_passphrase="", channels=None,
+                 keepalive=30, decoder=None):
+        self.url = url
+        self.products = products
+        self.channels = channels
+        self.type = message_type
+        self.stop = False
+        self.error = None
+        self.ws = None
+        self.loop = None
+        self.thread = None
+        self.auth = auth
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.api_passphrase = api_passphrase
+        self.should_print = should_print
+        self.mongo_collection = mongo_collection
+        self.keepalive = keepalive
+        self.decoder = decoder or FeedDecoder()
+        self._receiver = None
+        self._tasks = set()
+
+    async def run(self):
+        ''' Connects, subscribes and dispatches messages until close() or an error. '''
+        self.loop = asyncio.get_event_loop()
+        self.stop = False
+        self.on_open()
+        try:
+            await self._connect()
+        except Exception as e:
+            self.on_error(e)
+            return
+        try:
+            if self.keepalive:
+                self.create_task(self._keepalive())
+            self._receiver = self.loop.create_task(self._listen())
+            try:
+                await self._receiver
+            except asyncio.CancelledError:
+                pass
+        finally:
+            self._receiver = None
+            for task in list(self._tasks):
+                task.cancel()
+            await self._disconnect()
+
+    def start(self):
+        ''' Runs the client on a new event loop in its own thread, like WebsocketClient.start. '''
+        def _go():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.run())
+            finally:
+                loop.close()
+
+        self.stop = False
+        self.thread = Thread(target=_go)
+        self.thread.start()
+
+    def close(self):
+        ''' Stops receiving and disconnects. Safe to call from any thread, including from the hooks. '''
+        self.stop = True
+        receiver = self._receiver
+        if receiver is not None:
+            self.loop.call_soon_threadsafe(receiver.cancel)
+        if self.thread is not None and current_thread() is not self.thread:
+            self.thread.join()
+
+    async def _connect(self):
+        import websockets
+
+        if self.products is None:
+            self.products = ["BTC-USD"]
+        elif not isinstance(self.products, list):
+            self.products = [self.products]
+
+        if self.url[-1] == "/":
+            self.url = self.url[:-1]
+
+        if self.channels is None:
+            sub_params = {'type': 'subscribe', 'product_ids': self.products}
+        else:
+            sub_params = {'type': 'subscribe', 'product_ids': self.products, 'channels': self.channels}
+
+        if self.auth:
+            timestamp = str(time.time())
+            message = timestamp + 'GET' + '/users/self'
+            sub_params.update(get_auth_headers(timestamp, message, self.api_key,  self.api_secret, self.api_passphrase))
+
+        # Keepalive pings are our own task, see _keepalive; full-channel bursts can exceed the default frame limit
+        self.ws = await websockets.connect(self.url, ping_interval=None, max_size=None)
+        await self.ws.send(json.dumps(sub_params))
+
+        if self.type == "heartbeat":
+            sub_params = {"type": "heartbeat", "on": True}
+        else:
+            sub_params = {"type": "heartbeat", "on": False}
+        await self.ws.send(json.dumps(sub_params))
+
+    async def _listen(self):
+        while not self.stop:
+            data = None
+            try:
+                data = await self.ws.recv()
+                msg = self.decoder(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.on_error(e, data)
+            else:
+                self.on_message(msg)
+
+    async def _keepalive(self):
+        while not self.stop:
+            await asyncio.sleep(self.keepalive)
+            try:
+                await self.ws.ping(b"keepalive")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.on_error(e)
+
+    async def _disconnect(self):
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            if self.ws:
+                if self.type == "heartbeat":
+                    await self.ws.send(json.dumps({"type": "heartbeat", "on": False}))
+                await self.ws.close()
+        except ConnectionClosed:
+            pass
+
+        self.on_close()
+
+    def create_task(self, coro):
+        ''' Schedules a coroutine on the client's loop; it is cancelled when the client stops. '''
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def call_every(self, interval, callback, *args):
+        ''' Calls `callback(*args)` on the loop every `interval` seconds until the client stops. '''
+        async def _timer():
+            while not self.stop:
+                await asyncio.sleep(interval)
+                callback(*args)
+
+        return self.create_task(_timer())
+
+    def run_blocking(self, func, *args, **kwargs):
+        ''' Runs a blocking call in the loop's executor and returns an awaitable of its result. '''
+        return self.loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def on_open(self):
+        if self.should_print:
+            print("-- Subscribed! --\n")
+
+    def on_close(self):
+        if self.should_print:
+            print("\n-- Socket Closed --")
+
+    def on_message(self, msg):
+        if self.should_print:
+            print(msg)
+        if self.mongo_collection:  # dump JSON to given mongo collection
+            self.mongo_collection.insert_one(msg)
+
+    def on_error(self, e, data=None):
+        self.error = e
+        self.stop = True
+        print('{} - data: {}'.format(e, data))
+
+
+if __name__ == "__main__":
+    import sys
+
+
+    class MyWebsocketClient(AsyncWebsocketClient):
+        def on_open(self):
+            self.products = ["BTC-USD", "ETH-USD"]
+            self.message_count = 0
+            self.call_every(1, self.report)
+            print("Let's count the messages!")
+
+        def on_message(self, msg):
+            self.message_count += 1
+
+        def report(self):
+            print("MessageCount =", self.message_count)
+
+        def on_close(self):
+            print("-- Goodbye! --")
+
+
+    wsClient = MyWebsocketClient()
+    try:
+        asyncio.new_event_loop().run_until_complete(wsClient.run())
+    except KeyboardInterrupt:
+        pass
+
+    if wsClient.error:
+        sys.exit(1)
+    else:
+        sys.exit(0)
@@ -0,0 +1,73 @@
+# gdax/bench_decoder.py
+# original author: Jian
+#
+# Times FeedDecoder on full-channel frames with every JSON parser installed, with and
+# without skipping 'received' messages. Frames are re-encoded from a recorded session
+# (see Scheduler RECORDER) when given, otherwise synthetic.
+
+import json
+import time
+import uuid
+import logging
+
+from bench_order_book import make_session, read_session
+from feed_decoder import FeedDecoder, PARSERS
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_frames(messages):
+    """Returns the messages as compact feed frames. Synthetic sessions have no 'received'
+    messages, so one is added before every 'open', as on the full channel."""
+    frames = []
+    for msg in messages:
+        if msg['type'] == 'open' and 'time' not in msg:
+            frames.append(json.dumps({
+                'type': 'received', 'order_id': msg['order_id'], 'order_type': 'limit',
+                'size': msg['remaining_size'], 'price': msg['price'], 'side': msg['side'],
+                'client_oid': str(uuid.UUID(int=msg['sequence'])), 'product_id': 'BTC-USD',
+                'sequence': msg['sequence'], 'time': '2017-11-21T12:34:56.123456Z',
+            }, separators=(',', ':')))
+        frames.append(json.dumps(msg, separators=(',', ':')))
+    return frames
+
+
+def bench(frames, parser, skip_types=(), repeat=3):
+    decoder = FeedDecoder(parser, skip_types)
+    elapsed = None
+    for i in range(repeat):
+        start = time.time()
+        for frame in frames:
+            decoder(frame)
+        run = time.time() - start
+        elapsed = run if elapsed is None else min(elapsed, run)
+    logger.info("%-7s skip=%-14s %.2fus/frame  %d frames/sec" % (
+        parser, ','.join(decoder.skip_types) or '-', 1e6 * elapsed / len(frames), len(frames) / elapsed))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Feed Decoder Benchmark')
+    parser.add_argument('-i', '--in_file', dest='in_file',
+                        help='Recorded session from the Scheduler RECORDER, synthetic if omitted')
+    parser.add_argument('-m', '--num_messages', dest='num_messages', type=int, default=200000,
+                        help='Number of synthetic messages')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        level='INFO',
+    )
+
+    if args.in_file:
+        snapshot, messages = read_session(args.in_file)
+    else:
+        snapshot, messages = make_session(num_levels=100, orders_per_level=5, touch_orders=20,
+                                          num_messages=args.num_messages)
+    frames = make_frames(messages)
+    logger.info("%d frames, %.0f bytes on average" % (len(frames), float(sum(map(len, frames))) / len(frames)))
+    for name, loads in PARSERS:
+        bench(frames, name)
+    bench(frames, 'json', ('received',))
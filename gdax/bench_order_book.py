@@ -0,0 +1,199 @@
+# gdax/bench_order_book.py
+# original author: Jian
+#
+# Replays a level-3 snapshot plus full-channel messages through OrderBook and
+# reports throughput. Uses a recorded session (see Scheduler RECORDER) when given,
+# otherwise a synthetic BTC-USD-like book with deep queues at the touch.
+
+import ast
+import collections
+import random
+import time
+import tracemalloc
+import uuid
+import logging
+
+from my.my_order_book import OrderBook
+from price_levels import LEVEL_BACKENDS
+
+
+logger = logging.getLogger(__name__)
+
+# Increments used for fixed-point mode when no product listing is at hand
+BTC_USD = {'id': 'BTC-USD', 'quote_increment': '0.01', 'base_increment': '0.00000001'}
+
+
+def read_session(in_filename):
+    """Returns (snapshot, messages) from a file written by the Scheduler recorder."""
+    snapshot = None
+    messages = []
+    with open(in_filename, 'r') as in_file:
+        for l in in_file:
+            # the recorder writes each event as a dict literal
+            event = ast.literal_eval(l)
+            if event['msg_type'] == 'snapshot':
+                if snapshot is not None:
+                    break
+                snapshot = event['recv_msg']
+            elif snapshot is not None:
+                messages.append(event['recv_msg'])
+    return snapshot, messages
+
+
+def make_session(num_levels=2000, orders_per_level=40, touch_orders=400, num_messages=200000, seed=1):
+    """Builds a synthetic level-3 snapshot and a consistent stream of open/done/change/match messages.
+
+    The levels closest to the touch hold `touch_orders` orders, the rest `orders_per_level`.
+    Matches always hit the head of the best level's queue, as they do on the exchange.
+    """
+    rnd = random.Random(seed)
+    tick = 0.01
+    mid = 10000.0
+    sequence = 1000
+    queues = {'buy': {}, 'sell': {}}
+    snapshot = {'sequence': sequence, 'bids': [], 'asks': []}
+
+    def price_str(side, level):
+        offset = (level + 1) * tick
+        return '%.2f' % (mid - offset if side == 'buy' else mid + offset)
+
+    for side, key in (('buy', 'bids'), ('sell', 'asks')):
+        for level in range(num_levels):
+            price = price_str(side, level)
+            queue = queues[side].setdefault(level, collections.deque())
+            for i in range(touch_orders if level < 5 else orders_per_level):
+                order_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+                size = '%.8f' % rnd.uniform(0.001, 2.0)
+                queue.append([order_id, size])
+                snapshot[key].append([price, size, order_id])
+
+    messages = []
+    while len(messages) < num_messages:
+        side = rnd.choice(('buy', 'sell'))
+        level = min(int(rnd.expovariate(0.2)), num_levels - 1)
+        price = price_str(side, level)
+        queue = queues[side].setdefault(level, collections.deque())
+        roll = rnd.random()
+        if roll < 0.4 or not queue:
+            order_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+            size = '%.8f' % rnd.uniform(0.001, 2.0)
+            queue.append([order_id, size])
+            messages.append({'type': 'open', 'sequence': sequence + 1, 'side': side, 'price': price,
+                             'order_id': order_id, 'remaining_size': size})
+        elif roll < 0.8:
+            order = queue[rnd.randrange(len(queue))]
+            queue.remove(order)
+            messages.append({'type': 'done', 'sequence': sequence + 1, 'side': side, 'price': price,
+                             'order_id': order[0], 'reason': 'canceled', 'remaining_size': order[1]})
+        elif roll < 0.9:
+            order = queue[rnd.randrange(len(queue))]
+            new_size = '%.8f' % (float(order[1]) / 2)
+            messages.append({'type': 'change', 'sequence': sequence + 1, 'side': side, 'price': price,
+                             'order_id': order[0], 'old_size': order[1], 'new_size': new_size})
+            order[1] = new_size
+        else:
+            best = min(l for l, q in queues[side].items() if q)
+            order = queues[side][best].popleft()
+            messages.append({'type': 'match', 'sequence': sequence + 1, 'side': side,
+                             'price': price_str(side, best), 'maker_order_id': order[0],
+                             'taker_order_id': str(uuid.UUID(int=rnd.getrandbits(128))), 'size': order[1]})
+        sequence += 1
+    return snapshot, messages
+
+
+def bench(snapshot, messages, product=None, depth_index=False, levels='rbtree'):
+    order_book = OrderBook(product=product, depth_index=depth_index, levels=levels)
+
+    start = time.time()
+    order_book.reset_book(snapshot)
+    reset_sec = time.time() - start
+
+    start = time.time()
+    for message in messages:
+        order_book.on_message(message)
+    replay_sec = time.time() - start
+
+    num_orders = len(snapshot['bids']) + len(snapshot['asks'])
+    print("snapshot orders=%d reset=%.3fs" % (num_orders, reset_sec))
+    print("messages=%d replay=%.3fs rate=%.0f msgs/sec" % (len(messages), replay_sec, len(messages) / replay_sec))
+    return order_book
+
+
+def bench_reset(snapshot, product=None, repeat=5, levels='rbtree'):
+    """Prints the best of `repeat` reset_book timings, the cost paid on every reconnect and gap."""
+    order_book = OrderBook(product=product, levels=levels)
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        order_book.reset_book(snapshot)
+        timings.append(time.time() - start)
+
+    num_orders = len(snapshot['bids']) + len(snapshot['asks'])
+    reset_sec = min(timings)
+    print("snapshot orders=%d reset=%.3fs rate=%.0f orders/sec" % (num_orders, reset_sec, num_orders / reset_sec))
+    return order_book
+
+
+def bench_memory(snapshot, product=None, levels='rbtree'):
+    """Prints the bytes the book allocates per resting order while loading the snapshot.
+
+    Order id strings come from the snapshot and are excluded, as the feed allocates them either way.
+    """
+    tracemalloc.start()
+    order_book = OrderBook(product=product, levels=levels)
+    order_book.reset_book(snapshot)
+    book_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    num_orders = len(snapshot['bids']) + len(snapshot['asks'])
+    print("book=%.1fMB bytes/order=%.0f" % (book_bytes / 1e6, float(book_bytes) / num_orders))
+    return order_book
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='OrderBook Benchmark')
+    parser.add_argument('-i', '--in_file', dest='in_file',
+                        help='Recorded session from the Scheduler RECORDER, synthetic if omitted')
+    parser.add_argument('-m', '--num_messages', dest='num_messages', type=int, default=200000,
+                        help='Number of synthetic messages')
+    parser.add_argument('-f', '--fixed_point', dest='fixed_point', action='store_true',
+                        help='Also run the book in fixed-point mode with BTC-USD increments, with and without depth index')
+    parser.add_argument('-l', '--levels', dest='levels', action='store_true',
+                        help='Compare every price level backend instead')
+    parser.add_argument('-r', '--reset_only', dest='reset_only', action='store_true',
+                        help='Only time rebuilding the book from the snapshot')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        level='INFO',
+    )
+
+    if args.in_file:
+        snapshot, messages = read_session(args.in_file)
+    else:
+        snapshot, messages = make_session(num_messages=args.num_messages)
+    if args.levels:
+        product = BTC_USD if args.fixed_point else None
+        for levels in sorted(LEVEL_BACKENDS):
+            print("-- %s --" % levels)
+            bench(snapshot, messages, product, levels=levels)
+            bench_memory(snapshot, product, levels=levels)
+    elif args.reset_only:
+        print("-- Decimal --")
+        bench_reset(snapshot)
+        if args.fixed_point:
+            print("-- fixed-point --")
+            bench_reset(snapshot, BTC_USD)
+    else:
+        print("-- Decimal --")
+        bench(snapshot, messages)
+        bench_memory(snapshot)
+        if args.fixed_point:
+            print("-- fixed-point --")
+            bench(snapshot, messages, BTC_USD)
+            bench_memory(snapshot, BTC_USD)
+            print("-- fixed-point with depth index --")
+            bench(snapshot, messages, BTC_USD, depth_index=True)
@@ -0,0 +1,154 @@
+# gdax/bench_websocket.py
+# original author: Jian
+#
+# Serves full-channel messages from a local websocket server at a fixed rate and reports
+# the per-message latency, from the server sending a frame to on_message seeing it, of the
+# threaded WebsocketClient and the asyncio AsyncWebsocketClient. Run it from gdax/ with the
+# repository root on PYTHONPATH; the server and the asyncio client need `websockets`.
+
+import asyncio
+import json
+from multiprocessing import Pipe, Process
+import threading
+import time
+import logging
+
+from bench_order_book import make_session, read_session
+from gdax.async_websocket_client import AsyncWebsocketClient
+from gdax.websocket_client import WebsocketClient
+
+
+logger = logging.getLogger(__name__)
+
+
+class FeedServer(object):
+    """Replays `frames` (encoded messages) to each client that connects, `rate` per second.
+
+    The server runs in its own process so that it does not compete with the client for the GIL.
+    Send and receive times are compared across the two processes with time.time().
+    """
+
+    def __init__(self, frames, rate=10000, batch=10):
+        self.frames = frames
+        self.rate = rate
+        self.batch = batch
+        self.port = None
+        self._process = None
+
+    def start(self):
+        parent_conn, child_conn = Pipe()
+        self._process = Process(target=self._run, args=(child_conn,))
+        self._process.daemon = True
+        self._process.start()
+        self.port = parent_conn.recv()
+
+    def close(self):
+        self._process.terminate()
+        self._process.join()
+
+    def _run(self, conn):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._listen(conn))
+        loop.run_forever()
+
+    async def _listen(self, conn):
+        import websockets
+
+        self._server = await websockets.serve(self._handler, '127.0.0.1', 0, max_size=None)
+        conn.send(list(self._server.sockets)[0].getsockname()[1])
+
+    async def _handler(self, ws):
+        # subscribe and heartbeat requests
+        await ws.recv()
+        await ws.recv()
+        interval = float(self.batch) / self.rate
+        start = time.time()
+        for i in range(0, len(self.frames), self.batch):
+            delay = start + i / self.batch * interval - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            for frame in self.frames[i:i + self.batch]:
+                # stamp the send time into the pre-encoded message
+                await ws.send('{"bench_time": %.6f, %s' % (time.time(), frame[1:]))
+        await ws.send('{"type": "bench_done"}')
+        await ws.wait_closed()
+
+
+class ThreadedLatencyClient(WebsocketClient):
+    def on_open(self):
+        self.latencies = []
+        self.done = threading.Event()
+
+    def on_message(self, msg):
+        if msg['type'] == 'bench_done':
+            self.stop = True
+            self.done.set()
+        else:
+            self.latencies.append(time.time() - msg['bench_time'])
+
+
+class AsyncLatencyClient(AsyncWebsocketClient):
+    def on_open(self):
+        self.latencies = []
+
+    def on_message(self, msg):
+        if msg['type'] == 'bench_done':
+            self.close()
+        else:
+            self.latencies.append(time.time() - msg['bench_time'])
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    logger.info("%-9s %d msgs  mean=%.1fus  p50=%.1fus  p99=%.1fus  max=%.1fus" % (
+        name, n, 1e6 * sum(latencies) / n, 1e6 * latencies[n // 2], 1e6 * latencies[int(n * 0.99)],
+        1e6 * latencies[-1]))
+
+
+def bench(messages, rate=10000, buffer_size=None):
+    frames = [json.dumps(msg) for msg in messages]
+    server = FeedServer(frames, rate)
+    server.start()
+    url = 'ws://127.0.0.1:{}'.format(server.port)
+
+    client = ThreadedLatencyClient(url=url, should_print=False, buffer_size=buffer_size)
+    client.start()
+    client.done.wait()
+    client.close()
+    summarize('threaded', client.latencies)
+    if buffer_size:
+        logger.info("buffer    %s" % client.get_buffer_stats())
+
+    client = AsyncLatencyClient(url=url, should_print=False)
+    asyncio.new_event_loop().run_until_complete(client.run())
+    summarize('asyncio', client.latencies)
+    server.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Websocket Client Latency Benchmark')
+    parser.add_argument('-i', '--in_file', dest='in_file',
+                        help='Session recorded by Scheduler RECORDER; synthetic messages if omitted')
+    parser.add_argument('-m', '--num_messages', dest='num_messages', type=int, default=50000,
+                        help='Number of synthetic messages')
+    parser.add_argument('-r', '--rate', dest='rate', type=int, default=10000,
+                        help='Messages per second sent by the server')
+    parser.add_argument('-b', '--buffer_size', dest='buffer_size', type=int,
+                        help='Run the threaded client with a receive ring buffer of that many frames')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        level='INFO',
+    )
+
+    if args.in_file:
+        snapshot, messages = read_session(args.in_file)
+    else:
+        snapshot, messages = make_session(num_levels=100, orders_per_level=5, touch_orders=20,
+                                          num_messages=args.num_messages)
+    bench(messages, args.rate, args.buffer_size)
@@ -0,0 +1,119 @@
+#
+# gdax/book_checkpoint.py
+#
+# Compact binary checkpoints of a full level-3 book, for warm restarts and replay jobs
+
+from decimal import Decimal
+import struct
+import zlib
+
+
+# magic, format version, flags, sequence; then the zlib-compressed body and a CRC32 of it. The
+# body starts with the product id and, in fixed-point mode, its quote and base increments, then
+# holds the levels
+_HEADER = struct.Struct('<4sHHq')
+_MAGIC = b'GDXB'
+_VERSION = 2
+_FIXED_POINT = 1
+# number of levels of a side, and of orders of a level
+_COUNT = struct.Struct('<I')
+_INT = struct.Struct('<q')
+_CRC = struct.Struct('<I')
+
+
+def _pack_block(text):
+    data = text.encode('utf-8')
+    return _COUNT.pack(len(data)) + data
+
+
+def _read_block(data, offset):
+    length = _COUNT.unpack_from(data, offset)[0]
+    offset += _COUNT.size
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def write_checkpoint(out_file, sequence, bids, asks, product_id, increments=None):
+    ''' Writes a checkpoint of a book of `product_id` to the binary file `out_file`.
+
+    `bids` and `asks` are (price, PriceLevel) pairs. A fixed-point book passes its (quote, base)
+    `increments`: prices and sizes are then its integers and stored as int64, otherwise Decimals
+    stored as text. Each level's order ids and sizes are stored as one block, so loading splits a
+    block rather than decoding every order.
+    '''
+    fixed_point = increments is not None
+    chunks = [_pack_block('\n'.join([product_id] + [str(increment) for increment in increments or ()]))]
+    for levels in (bids, asks):
+        levels = list(levels)
+        chunks.append(_COUNT.pack(len(levels)))
+        for price, level in levels:
+            orders = list(level.orders.values())
+            chunks.append(_COUNT.pack(len(orders)))
+            chunks.append(_pack_block('\n'.join([order.id for order in orders])))
+            if fixed_point:
+                chunks.append(struct.pack('<{}q'.format(len(orders) + 1), price, *[order.size for order in orders]))
+            else:
+                chunks.append(_pack_block(','.join([str(price)] + [str(order.size) for order in orders])))
+    data = b''.join(chunks)
+    out_file.write(_HEADER.pack(_MAGIC, _VERSION, _FIXED_POINT if fixed_point else 0, sequence))
+    # Level 1 already halves the hex order ids, and inflating is much faster than the load itself
+    out_file.write(zlib.compress(data, 1))
+    out_file.write(_CRC.pack(zlib.crc32(data) & 0xffffffff))
+
+
+def read_checkpoint(in_file):
+    ''' Reads a checkpoint written by write_checkpoint from the binary file `in_file`.
+
+    Returns (sequence, product_id, increments, levels), where `increments` is None unless the book
+    was in fixed-point mode, and `levels` yields (side, price, orders) for every level, `orders`
+    being a list of (order_id, size) in queue order.
+    '''
+    data = in_file.read()
+    if len(data) < _HEADER.size + _CRC.size:
+        raise ValueError('Checkpoint is truncated')
+    magic, version, flags, sequence = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError('Not a version {} book checkpoint'.format(_VERSION))
+    try:
+        body = zlib.decompress(data[_HEADER.size:-_CRC.size])
+    except zlib.error:
+        raise ValueError('Checkpoint is corrupt')
+    if _CRC.unpack_from(data, len(data) - _CRC.size)[0] != zlib.crc32(body) & 0xffffffff:
+        raise ValueError('Checkpoint is corrupt')
+    fixed_point = bool(flags & _FIXED_POINT)
+    text, offset = _read_block(body, 0)
+    fields = text.split('\n')
+    increments = tuple(fields[1:]) if fixed_point else None
+    return sequence, fields[0], increments, _read_levels(body, offset, fixed_point)
+
+
+def check_checkpoint(in_file, product_id, increments=None):
+    ''' Reads a checkpoint as read_checkpoint does for a book of `product_id` with `increments`
+    (None in Decimal mode), and returns (sequence, levels). Raises ValueError if it was written by
+    a book of another product or number mode, whose integers would mean other prices and sizes. '''
+    sequence, checkpoint_product, checkpoint_increments, levels = read_checkpoint(in_file)
+    if (checkpoint_increments is None) != (increments is None):
+        raise ValueError('Checkpoint was written by a book {} fixed-point mode'.format(
+            'not in' if checkpoint_increments is None else 'in'))
+    if checkpoint_product != product_id:
+        raise ValueError('Checkpoint is of {}, not {}'.format(checkpoint_product, product_id))
+    if increments is not None and [Decimal(x) for x in checkpoint_increments] != [Decimal(x) for x in increments]:
+        raise ValueError('Checkpoint was written with increments {}, not {}'.format(
+            '/'.join(checkpoint_increments), '/'.join(str(x) for x in increments)))
+    return sequence, levels
+
+
+def _read_levels(data, offset, fixed_point):
+    for side in ('buy', 'sell'):
+        num_levels = _COUNT.unpack_from(data, offset)[0]
+        offset += _COUNT.size
+        for i in range(num_levels):
+            num_orders = _COUNT.unpack_from(data, offset)[0]
+            text, offset = _read_block(data, offset + _COUNT.size)
+            order_ids = text.split('\n')
+            if fixed_point:
+                values = struct.unpack_from('<{}q'.format(num_orders + 1), data, offset)
+                offset += _INT.size * (num_orders + 1)
+            else:
+                text, offset = _read_block(data, offset)
+                values = [Decimal(value) for value in text.split(',')]
+            yield side, values[0], list(zip(order_ids, values[1:]))
@@ -0,0 +1,468 @@
+#
+# gdax/book_common.py
+#
+# Order records, number conversions and the read side shared by the level-3 books
+# (order_book.OrderBook and my.my_order_book.OrderBook)
+
+from collections import deque
+from decimal import Decimal
+from itertools import dropwhile, groupby, islice, takewhile
+from operator import itemgetter
+from threading import Event, RLock, current_thread
+import heapq
+import time
+
+
+def fixed_point_converters(increment):
+    ''' Returns (parse, format) functions between non-negative decimal values and integer multiples
+    of `increment`, which must be a power of ten (e.g. a product's quote_increment '0.01').
+    '''
+    places = max(0, -Decimal(increment).normalize().as_tuple().exponent)
+    scale = 10 ** places
+
+    def parse(value):
+        # float() parses in C, and rounding back to whole increments is exact below 2**51 of them
+        units = float(value) * scale
+        if units < 2251799813685248:
+            return int(units + 0.5)
+        return int(Decimal(value).scaleb(places))
+
+    def format(value):
+        return Decimal(value).scaleb(-places)
+
+    return parse, format
+
+
+def identity(value):
+    return value
+
+
+def product_increments(product):
+    ''' Returns the (quote, base) increments of an entry of PublicClient.get_products(). '''
+    # Older product listings have no base_increment; the feed quotes sizes to 8 places
+    return product['quote_increment'], product.get('base_increment', '0.00000001')
+
+
+def book_converters(product=None):
+    ''' Returns (to_price, from_price, to_size, from_size): Decimal in and out without a `product`,
+    otherwise fixed-point integers in its increments, see fixed_point_converters. '''
+    if product is None:
+        return Decimal, identity, Decimal, identity
+    quote_increment, base_increment = product_increments(product)
+    to_price, from_price = fixed_point_converters(quote_increment)
+    to_size, from_size = fixed_point_converters(base_increment)
+    return to_price, from_price, to_size, from_size
+
+
+def meet_min_diff_price(low_price, high_price, min_diff_price):
+    ''' Whether two prices are more than `min_diff_price` apart; the cut-off of get_aggr_bids/asks. '''
+    if low_price is None or high_price is None or min_diff_price is None:
+        return False
+    return high_price - low_price > min_diff_price
+
+
+def meet_max_size(total_size, max_size):
+    ''' Whether the size aggregated so far is past `max_size`; the other get_aggr_bids/asks cut-off. '''
+    if total_size is None or max_size is None:
+        return False
+    return total_size > max_size
+
+
+class Order(object):
+    ''' A resting order. Slotted because a full level-3 book holds tens of thousands of them. '''
+    __slots__ = ('id', 'side', 'price', 'size', 'level')
+
+    def __init__(self, order_id, side, price, size, level=None):
+        self.id = order_id
+        # Share the two side literals instead of keeping each message's copy alive
+        self.side = 'buy' if side == 'buy' else 'sell'
+        self.price = price
+        self.size = size
+        self.level = level
+
+
+class PriceLevel(object):
+    ''' The resting orders at one price, keyed by order_id in queue order, with their running total size. '''
+    __slots__ = ('orders', 'size')
+
+    def __init__(self):
+        self.orders = {}
+        self.size = 0
+
+    def __len__(self):
+        return len(self.orders)
+
+
+class BookSnapshot(object):
+    ''' A consistent, read-only view of the book at `sequence` that any thread may use.
+
+    `bids` and `asks` map price -> tuple of (price, size, order_id) in queue order. Levels
+    that did not change between two snapshots are shared instead of copied.
+    '''
+    __slots__ = ('sequence', 'bids', 'asks', '_bid_prices', '_ask_prices')
+
+    def __init__(self, sequence, bids, asks):
+        self.sequence = sequence
+        self.bids = bids
+        self.asks = asks
+        self._bid_prices = None
+        self._ask_prices = None
+
+    def bid_prices(self, depth=None):
+        ''' Bid prices, best first; only the best `depth` of them if given. '''
+        if self._bid_prices is None:
+            if depth is not None and depth < len(self.bids):
+                return heapq.nlargest(depth, self.bids)
+            self._bid_prices = sorted(self.bids, reverse=True)
+        return self._bid_prices if depth is None else self._bid_prices[:depth]
+
+    def ask_prices(self, depth=None):
+        ''' Ask prices, best first; only the best `depth` of them if given. '''
+        if self._ask_prices is None:
+            if depth is not None and depth < len(self.asks):
+                return heapq.nsmallest(depth, self.asks)
+            self._ask_prices = sorted(self.asks)
+        return self._ask_prices if depth is None else self._ask_prices[:depth]
+
+    def bids_top(self, depth):
+        ''' Returns (price, size, num_orders) for the best `depth` bid levels, best first. '''
+        return self._summarize(self.bids, self.bid_prices(depth))
+
+    def asks_top(self, depth):
+        ''' Returns (price, size, num_orders) for the best `depth` ask levels, best first. '''
+        return self._summarize(self.asks, self.ask_prices(depth))
+
+    def bids_in_range(self, low, high):
+        ''' Returns (price, size, num_orders) for bid levels with low <= price <= high, best first. '''
+        low, high = Decimal(low), Decimal(high)
+        prices = dropwhile(lambda price: price > high, self.bid_prices())
+        return self._summarize(self.bids, takewhile(lambda price: price >= low, prices))
+
+    def asks_in_range(self, low, high):
+        ''' Returns (price, size, num_orders) for ask levels with low <= price <= high, best first. '''
+        low, high = Decimal(low), Decimal(high)
+        prices = dropwhile(lambda price: price < low, self.ask_prices())
+        return self._summarize(self.asks, takewhile(lambda price: price <= high, prices))
+
+    @staticmethod
+    def _summarize(levels, prices):
+        return [(price, sum(order[1] for order in levels[price]), len(levels[price])) for price in prices]
+
+
+class OrderBookMixin(object):
+    ''' Book state, loading, snapshots and read queries of a level-3 book.
+
+    Books call _init_book from their constructor and keep _bids/_asks (price -> PriceLevel trees
+    from price_levels), _orders, the cached touch and _sequence up to date as messages arrive,
+    holding _feed_lock while they apply a message or install a book.
+    '''
+
+    # Seconds between a waiting reader's attempts to take the feed lock
+    _SNAPSHOT_POLL = 0.01
+
+    def _init_book(self, levels, product=None):
+        ''' `levels` is a price_levels backend; `product` enables fixed-point mode, see book_converters. '''
+        self._levels = levels
+        self._asks = self._levels()
+        self._bids = self._levels()
+        # Trees map price -> PriceLevel, and _orders indexes every resting order
+        # so done/change/match never scan a level
+        self._orders = {}
+        # Best bid/ask price and level, kept up to date as levels come and go
+        self._bid_price = self._bid_level = None
+        self._ask_price = self._ask_level = None
+        self._bbo = None
+        # Published BookSnapshot, and the prices changed since (None until snapshots are used,
+        # or after a reset, meaning the next snapshot is built from scratch)
+        self._snapshot = None
+        self._dirty = None
+        self._snapshot_waiters = deque()
+        self._feed_thread = None
+        # Held by the feed thread while it changes the book. A reader thread that gets it, i.e.
+        # finds the feed idle between messages, publishes the snapshot it needs itself
+        self._feed_lock = RLock()
+        self._product = product
+        self._to_price, self._from_price, self._to_size, self._from_size = book_converters(product)
+        self._sequence = -1
+        self._current_ticker = None
+
+    def _increments(self):
+        ''' The book's (quote, base) increments in fixed-point mode, None in Decimal mode. '''
+        return None if self._product is None else product_increments(self._product)
+
+    def _checkpoint_levels(self, levels, index):
+        ''' Returns the bid and ask levels of a checkpoint's (side, price, orders) records. '''
+        sides = {'buy': {}, 'sell': {}}
+        for side, price, level_orders in levels:
+            level = sides[side][price] = PriceLevel()
+            orders = level.orders
+            size = 0
+            for order_id, order_size in level_orders:
+                order = Order(order_id, side, price, order_size, level)
+                orders[order_id] = order
+                index[order_id] = order
+                size += order_size
+            level.size = size
+        return self._levels(sides['buy']), self._levels(sides['sell'])
+
+    def _load_levels(self, rows, side, index):
+        ''' Builds one side of the book in a single pass over snapshot rows of [price, size, order_id].
+
+        The exchange sends the rows grouped by price, so each price is parsed once and each level
+        is inserted into the tree once instead of being looked up for every order.
+        '''
+        to_price, to_size = self._to_price, self._to_size
+        levels = {}
+        for price, level_rows in groupby(rows, itemgetter(0)):
+            price = to_price(price)
+            level = levels.get(price)
+            if level is None:
+                level = levels[price] = PriceLevel()
+            orders = level.orders
+            size = level.size
+            for row in level_rows:
+                order = Order(row[2], side, price, to_size(row[1]), level)
+                orders[order.id] = order
+                index[order.id] = order
+                size += order.size
+            level.size = size
+        return self._levels(levels)
+
+    def _build_book(self, snapshot):
+        ''' Returns (sequence, bids, asks, orders) built from a level-3 snapshot dict, or from the
+        (key, value) pairs of PublicClient.get_product_order_book_stream, without touching the live
+        book. Raises ValueError for anything but a level-3 snapshot, e.g. the error body of a
+        rate-limited request. '''
+        sequence = bids = asks = error = None
+        orders = {}
+        for key, value in snapshot.items() if isinstance(snapshot, dict) else snapshot:
+            if key == 'bids':
+                bids = self._load_levels(value, 'buy', orders)
+            elif key == 'asks':
+                asks = self._load_levels(value, 'sell', orders)
+            elif key == 'sequence':
+                sequence = value
+            elif key == 'message':
+                error = value
+        if sequence is None or bids is None or asks is None:
+            raise ValueError('Not a level-3 snapshot: {}'.format(error or 'sequence, bids or asks missing'))
+        return sequence, bids, asks, orders
+
+    def _update_best(self, side):
+        ''' Re-reads the best level of one side from the tree, e.g. after the cached one emptied. '''
+        if side == 'buy':
+            self._bid_price, self._bid_level = self._bids.max_item() if self._bids else (None, None)
+        else:
+            self._ask_price, self._ask_level = self._asks.min_item() if self._asks else (None, None)
+
+    def _check_bbo(self):
+        ''' Fires on_bbo_change if the best prices or their sizes moved since the last check. '''
+        bbo = (self._bid_price, self._bid_level and self._bid_level.size,
+               self._ask_price, self._ask_level and self._ask_level.size)
+        if bbo != self._bbo:
+            self._bbo = bbo
+            self.on_bbo_change(*self.get_bbo())
+
+    def get_current_ticker(self):
+        return self._current_ticker
+
+    def on_bbo_change(self, bid, bid_size, ask, ask_size):
+        ''' Called after a message moved the best bid/ask price or size. Override to react to the touch. '''
+        pass
+
+    def get_bbo(self):
+        ''' Returns (bid, bid_size, ask, ask_size) as of the last message applied; None for an empty
+        side. Safe from any thread: it only reads the touch tuple that _check_bbo replaces whole. '''
+        bbo = self._bbo
+        if bbo is None:
+            return None, None, None, None
+        bid, bid_size, ask, ask_size = bbo
+        if bid is not None:
+            bid, bid_size = self._from_price(bid), self._from_size(bid_size)
+        if ask is not None:
+            ask, ask_size = self._from_price(ask), self._from_size(ask_size)
+        return bid, bid_size, ask, ask_size
+
+    def get_current_book(self, depth=None):
+        ''' Returns every order of the book, or only those of the best `depth` levels per side. '''
+        snapshot = self.get_snapshot(timeout=None)
+        result = {
+            'sequence': -1 if snapshot is None else snapshot.sequence,
+            'asks': [],
+            'bids': [],
+        }
+        if snapshot is None:
+            return result
+        for price in snapshot.ask_prices(depth):
+            result['asks'].extend(list(order) for order in snapshot.asks[price])
+        for price in reversed(snapshot.bid_prices(depth)):
+            result['bids'].extend(list(order) for order in snapshot.bids[price])
+        return result
+
+    def get_bids_top(self, depth):
+        ''' Returns (price, size, num_orders) for the best `depth` bid levels, best first. '''
+        snapshot = self._reader_snapshot()
+        if snapshot is not None:
+            return snapshot.bids_top(depth)
+        return self._summarize_levels(islice(self._bids.items(reverse=True), depth))
+
+    def get_asks_top(self, depth):
+        ''' Returns (price, size, num_orders) for the best `depth` ask levels, best first. '''
+        snapshot = self._reader_snapshot()
+        if snapshot is not None:
+            return snapshot.asks_top(depth)
+        return self._summarize_levels(islice(self._asks.items(), depth))
+
+    def get_bids_in_range(self, low, high):
+        ''' Returns (price, size, num_orders) for bid levels with low <= price <= high, best first. '''
+        snapshot = self._reader_snapshot()
+        if snapshot is not None:
+            return snapshot.bids_in_range(low, high)
+        return self._summarize_levels(
+            self._walk_levels(self._bids, self._price_floor(high), self._price_ceiling(low), reverse=True))
+
+    def get_asks_in_range(self, low, high):
+        ''' Returns (price, size, num_orders) for ask levels with low <= price <= high, best first. '''
+        snapshot = self._reader_snapshot()
+        if snapshot is not None:
+            return snapshot.asks_in_range(low, high)
+        return self._summarize_levels(self._walk_levels(self._asks, self._price_ceiling(low), self._price_floor(high)))
+
+    def _reader_snapshot(self):
+        ''' The snapshot a query answers from on any thread but the feed thread, which may be
+        changing the trees meanwhile; None on the feed thread, which walks the trees itself. '''
+        feed_thread = self._message_thread()
+        if feed_thread is None or current_thread() is feed_thread:
+            return None
+        return self.get_snapshot(timeout=None)
+
+    def _price_floor(self, price):
+        ''' Converts a range bound to the highest book price not above it (fixed-point mode rounds). '''
+        key = self._to_price(price)
+        return key - 1 if self._from_price(key) > Decimal(price) else key
+
+    def _price_ceiling(self, price):
+        ''' Converts a range bound to the lowest book price not below it. '''
+        key = self._to_price(price)
+        return key + 1 if self._from_price(key) < Decimal(price) else key
+
+    def _summarize_levels(self, items):
+        from_price = self._from_price
+        from_size = self._from_size
+        return [(from_price(price), from_size(level.size), len(level)) for price, level in items]
+
+    @staticmethod
+    def _walk_levels(tree, start, stop, reverse=False):
+        ''' Yields (price, level) from `start` to `stop` inclusive, visiting only the levels in between. '''
+        try:
+            if reverse:
+                price, level = tree.floor_item(start)
+                while price >= stop:
+                    yield price, level
+                    price, level = tree.prev_item(price)
+            else:
+                price, level = tree.ceiling_item(start)
+                while price <= stop:
+                    yield price, level
+                    price, level = tree.succ_item(price)
+        except KeyError:
+            # walked off the end of the tree
+            return
+
+    def _message_thread(self):
+        ''' The thread that applies messages to the book, None while nothing fed it. '''
+        return self._feed_thread
+
+    def get_snapshot(self, timeout=1.0):
+        ''' Returns a BookSnapshot at least as recent as the book was when called, from any thread.
+
+        While the feed thread is idle between messages, or gone, the calling thread publishes the
+        snapshot itself. While it applies a message, the caller waits for it to publish one at the
+        end of that message, for up to `timeout` seconds (None waits as long as it takes), and
+        gets None if it is still busy by then rather than an outdated snapshot. '''
+        feed_thread = self._message_thread()
+        if feed_thread is None or current_thread() is feed_thread:
+            with self._feed_lock:
+                return self.publish_snapshot()
+        event = Event()
+        self._snapshot_waiters.append(event)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self._feed_lock.acquire(False):
+                try:
+                    return self.publish_snapshot()
+                finally:
+                    self._feed_lock.release()
+            wait = self._SNAPSHOT_POLL
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    return None
+            # the lock is tried again in case the feed went idle without seeing this waiter
+            if event.wait(wait):
+                return self._snapshot
+
+    def publish_snapshot(self):
+        ''' Publishes a BookSnapshot of the current state. Only call it from the feed thread, or
+        with _feed_lock held.
+
+        Only the price levels changed since the previous snapshot are rebuilt. '''
+        previous = self._snapshot
+        dirty = self._dirty
+        if previous is None or dirty is None:
+            snapshot = BookSnapshot(self._sequence,
+                                    self._snapshot_levels({}, self._bids, self._bids.keys()),
+                                    self._snapshot_levels({}, self._asks, self._asks.keys()))
+        elif previous.sequence == self._sequence and not dirty['buy'] and not dirty['sell']:
+            snapshot = previous
+        else:
+            snapshot = BookSnapshot(self._sequence,
+                                    self._snapshot_levels(previous.bids, self._bids, dirty['buy']),
+                                    self._snapshot_levels(previous.asks, self._asks, dirty['sell']))
+        self._dirty = {'buy': set(), 'sell': set()}
+        self._snapshot = snapshot
+        waiters = self._snapshot_waiters
+        while waiters:
+            waiters.popleft().set()
+        return snapshot
+
+    def _snapshot_levels(self, levels, tree, prices):
+        ''' Returns a copy of `levels` with the given prices re-read from `tree`. '''
+        if not prices:
+            return levels
+        levels = dict(levels)
+        from_price = self._from_price
+        from_size = self._from_size
+        for price in prices:
+            level = tree.get(price)
+            price_out = from_price(price)
+            if level is None:
+                levels.pop(price_out, None)
+            else:
+                levels[price_out] = tuple((price_out, from_size(order.size), order.id)
+                                          for order in level.orders.values())
+        return levels
+
+    def get_ask(self):
+        return None if self._ask_price is None else self._from_price(self._ask_price)
+
+    def get_asks(self, price):
+        return self._asks.get(price)
+
+    def remove_asks(self, price):
+        self._asks.remove(price)
+
+    def set_asks(self, price, asks):
+        self._asks.insert(price, asks)
+
+    def get_bid(self):
+        return None if self._bid_price is None else self._from_price(self._bid_price)
+
+    def get_bids(self, price):
+        return self._bids.get(price)
+
+    def remove_bids(self, price):
+        self._bids.remove(price)
+
+    def set_bids(self, price, bids):
+        self._bids.insert(price, bids)
@@ -0,0 +1,60 @@
+#
+# gdax/book_publisher.py
+#
+# Conflated level-2 updates of an OrderBook for downstream subscribers
+
+import time
+
+
+class ConflatingPublisher(object):
+    ''' Sends the per-level changes of an OrderBook to `callback` at a bounded rate.
+
+    Changes accumulate in the book between flushes, so a level that changed many times is sent
+    once with its latest total size. A flush happens at the first message boundary after
+    `interval` seconds, or after `max_messages` book messages, whichever comes first.
+
+    Each flush calls `callback` with a level2-channel style message, which Level2OrderBook can
+    consume directly::
+        {
+            'type': 'l2update',
+            'product_id': 'BTC-USD',
+            'sequence': 3,
+            'changes': [['buy', price, size], ...]
+        }
+
+    The first flush carries every level of the book, so a subscriber starting from an empty
+    book is brought up to date. The callback runs on the book's feed thread and should hand
+    the message off rather than block.
+    '''
+
+    def __init__(self, book, callback, interval=0.1, max_messages=None):
+        self.book = book
+        self.callback = callback
+        self.interval = interval
+        self.max_messages = max_messages
+        self._messages = 0
+        self._last_flush = time.time()
+        book.set_level_publisher(self)
+
+    def close(self):
+        self.book.set_level_publisher(None)
+
+    def on_book_message(self, book):
+        ''' Called by the book after every message it applied. '''
+        self._messages += 1
+        if ((self.max_messages is not None and self._messages >= self.max_messages) or
+                time.time() - self._last_flush >= self.interval):
+            self.flush()
+
+    def flush(self):
+        ''' Sends the changes accumulated since the previous flush, if any. Feed thread only. '''
+        self._messages = 0
+        self._last_flush = time.time()
+        changes = self.book.pop_level_changes()
+        if changes:
+            self.callback({
+                'type': 'l2update',
+                'product_id': self.book.product_id,
+                'sequence': self.book.sequence,
+                'changes': changes,
+            })
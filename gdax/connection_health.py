@@ -0,0 +1,200 @@
+#
+# gdax/connection_health.py
+#
+# Keepalive pings, ping round trips, feed latency and stall detection of a websocket connection,
+# and the backoff between reconnects
+
+import calendar
+import math
+import random
+import time
+from threading import Event, Thread, current_thread
+
+from websocket import ABNF, WebSocketConnectionClosedException
+
+
+def backoff_delay(attempt, initial=0.1, maximum=30.0):
+    ''' Returns the seconds to wait before reconnect `attempt` (0 for the first): drawn uniformly
+    between 0 and `initial` doubled per attempt, up to `maximum`. The jitter keeps clients that
+    lost the same connection from all coming back at once. '''
+    return random.uniform(0, min(maximum, initial * 2 ** min(attempt, 30)))
+
+
+class LatencyHistogram(object):
+    ''' Counts latencies (seconds) in logarithmic buckets, ten per decade from 1us to 1000s, so
+    recording is O(1) and percentiles are accurate to about 25%. Latencies of 1us or less,
+    including negative ones from clock skew, share the lowest bucket. '''
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    BUCKETS_PER_DECADE = 10
+    # 10 ** (OFFSET / BUCKETS_PER_DECADE) seconds is the upper edge of the lowest bucket
+    OFFSET = 60
+    NUM_BUCKETS = 91
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        if value > 1e-6:
+            i = min(int(math.floor(math.log10(value) * self.BUCKETS_PER_DECADE)) + self.OFFSET,
+                    self.NUM_BUCKETS - 1)
+        else:
+            i = 0
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        ''' Returns the upper edge of the bucket holding the `q`-th percentile (0-100), or None if empty. '''
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(10 ** (float(i + 1 - self.OFFSET) / self.BUCKETS_PER_DECADE), self.max)
+        return self.max
+
+    def summary(self):
+        ''' Returns count, mean, min, p50, p90, p99 and max, in seconds. '''
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class ConnectionHealth(object):
+    ''' Watches one websocket connection: pings every `ping_interval` seconds on its own thread,
+    records the round trip of every pong, the delay from each message's exchange `time` to its
+    receipt, and calls `on_stall(silence)` when nothing was received for `stall_timeout` seconds.
+
+    Read frames through recv() so that pongs and receive times are seen, and pass each decoded
+    message to on_message. The exchange-to-receive latency includes the offset between the
+    exchange's clock and ours, so watch its trend rather than its level.
+    '''
+
+    def __init__(self, ping_interval=30, stall_timeout=None, on_stall=None):
+        self.ping_interval = ping_interval
+        self.stall_timeout = stall_timeout
+        self.on_stall = on_stall
+        self.rtt = LatencyHistogram()
+        self.latency = LatencyHistogram()
+        self.last_receive = None
+        self.last_rtt = None
+        self.stalls = 0
+        self._stalled = False
+        self._ws = None
+        self._thread = None
+        self._stop = Event()
+        # Whole seconds of the last exchange time parsed, and their epoch
+        self._time_prefix = None
+        self._time_epoch = None
+
+    def start(self, ws):
+        ''' Starts watching the connection `ws`. '''
+        self.stop()
+        self._ws = ws
+        self.last_receive = time.time()
+        self._stalled = False
+        self._stop = Event()
+        self._thread = Thread(target=self._watch, name='ConnectionHealth')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            # on_stall may stop the watch from the watching thread itself
+            if self._thread is not current_thread():
+                self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        checks = [interval for interval in (self.ping_interval, self.stall_timeout) if interval]
+        if not checks:
+            return
+        check_interval = min(checks) / 2.0
+        last_ping = time.time()
+        while not self._stop.wait(check_interval):
+            now = time.time()
+            if self.ping_interval and now - last_ping >= self.ping_interval:
+                last_ping = now
+                try:
+                    # the payload comes back in the pong, which gives the round trip
+                    self._ws.ping('{:.6f}'.format(now))
+                except Exception:
+                    # the receiving side sees the broken connection too and handles it
+                    pass
+            silence = now - self.last_receive
+            if self.stall_timeout and silence >= self.stall_timeout:
+                if not self._stalled:
+                    self._stalled = True
+                    self.stalls += 1
+                    if self.on_stall is not None:
+                        self.on_stall(silence)
+            else:
+                self._stalled = False
+
+    def recv(self, ws):
+        ''' Returns the next text frame of `ws`, recording the pongs before it. Raises
+        WebSocketConnectionClosedException when the server closes the connection. '''
+        while True:
+            opcode, data = ws.recv_data(control_frame=True)
+            now = time.time()
+            self.last_receive = now
+            if opcode == ABNF.OPCODE_TEXT:
+                return data.decode('utf-8') if isinstance(data, bytes) else data
+            elif opcode == ABNF.OPCODE_PONG:
+                self.on_pong(data, now)
+            elif opcode == ABNF.OPCODE_CLOSE:
+                raise WebSocketConnectionClosedException('Connection closed by the server')
+
+    def on_pong(self, payload, now=None):
+        try:
+            sent = float(payload)
+        except ValueError:
+            # not one of our pings
+            return
+        self.last_rtt = (now or time.time()) - sent
+        self.rtt.record(self.last_rtt)
+
+    def on_message(self, msg, received=None):
+        ''' Records the exchange-to-receive latency of a decoded message, if it carries a time. '''
+        exchange_time = msg.get('time')
+        if exchange_time:
+            self.latency.record((received or self.last_receive) - self.parse_time(exchange_time))
+
+    def parse_time(self, value):
+        ''' Returns the epoch of an exchange time such as '2017-11-21T12:34:56.123456Z'. '''
+        prefix = value[:19]
+        if prefix != self._time_prefix:
+            # messages arrive in time order, so the date part only changes once a second
+            self._time_epoch = calendar.timegm(time.strptime(prefix, '%Y-%m-%dT%H:%M:%S'))
+            self._time_prefix = prefix
+        fraction = value[19:].rstrip('Z')
+        return self._time_epoch + float(fraction) if fraction else self._time_epoch
+
+    def get_stats(self):
+        ''' Returns the seconds since the last frame, the stall count, the last ping round trip,
+        and summaries of the round trip and exchange-to-receive latency histograms. '''
+        return {
+            'silence': None if self.last_receive is None else time.time() - self.last_receive,
+            'stalls': self.stalls,
+            'last_rtt': self.last_rtt,
+            'rtt': self.rtt.summary(),
+            'latency': self.latency.summary(),
+        }
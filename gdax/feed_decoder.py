@@ -0,0 +1,75 @@
+#
+# gdax/feed_decoder.py
+#
+# Decodes websocket feed frames with the fastest JSON parser installed
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# JSON parsers that FeedDecoder can use, fastest first. Each takes a str frame and raises a
+# ValueError on malformed JSON.
+PARSERS = [('json', json.loads)]
+if ujson is not None:
+    PARSERS.insert(0, ('ujson', ujson.loads))
+if orjson is not None:
+    PARSERS.insert(0, ('orjson', orjson.loads))
+
+
+def json_parser(name=None):
+    ''' Returns (name, loads) of the parser registered as `name`, or of the fastest installed. '''
+    for parser in PARSERS:
+        if name is None or parser[0] == name:
+            return parser
+    raise ValueError('JSON parser {!r} is not installed, expected one of {}'.format(
+        name, ', '.join(parser[0] for parser in PARSERS)))
+
+
+class FeedDecoder(object):
+    ''' Turns feed frames into message dicts, with `parser` ('orjson', 'ujson' or 'json') or by
+    default the fastest one installed.
+
+    With `skip_types`, frames of those message types are not decoded in full: only their type
+    and the header fields sequence, product_id and time are extracted, which is all a book needs
+    of e.g. 'received' messages. Finding fields in Python only beats a full decode by the stdlib
+    parser, so skipping is off with the others. It relies on the feed's compact JSON with the
+    type first; any other frame is decoded in full.
+    '''
+
+    def __init__(self, parser=None, skip_types=()):
+        self.parser, self.loads = json_parser(parser)
+        self.skip_types = tuple(skip_types) if self.loads is json.loads else ()
+        self._skip_prefixes = tuple('{{"type":"{}"'.format(msg_type) for msg_type in self.skip_types)
+
+    def __call__(self, frame):
+        if self._skip_prefixes and frame.startswith(self._skip_prefixes):
+            message = self._decode_header(frame)
+            if message is not None:
+                return message
+        return self.loads(frame)
+
+    def _decode_header(self, frame):
+        message = {'type': frame[9:frame.index('"', 9)]}
+        start = frame.find('"sequence":')
+        if start >= 0:
+            start += 11
+            end = frame.find(',', start)
+            try:
+                message['sequence'] = int(frame[start:end] if end >= 0 else frame[start:frame.rindex('}')])
+            except ValueError:
+                return None
+        start = frame.find('"product_id":"')
+        if start >= 0:
+            message['product_id'] = frame[start + 14:frame.index('"', start + 14)]
+        start = frame.find('"time":"')
+        if start >= 0:
+            message['time'] = frame[start + 8:frame.index('"', start + 8)]
+        return message
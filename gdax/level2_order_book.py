@@ -0,0 +1,205 @@
+#
+# gdax/level2_order_book.py
+#
+# Aggregated (price level) order book updated from the gdax level2 channel
+
+from bintrees import RBTree
+from itertools import islice
+import pickle
+
+from gdax.book_common import book_converters, meet_max_size, meet_min_diff_price
+from gdax.public_client import PublicClient
+from gdax.websocket_client import WebsocketClient
+
+
+class Level2OrderBook(WebsocketClient):
+    ''' Keeps the total size at each price from `snapshot` and `l2update` messages.
+
+    For consumers that only need price levels, this is much lighter than OrderBook, which
+    tracks every order of the full channel. The level2 channel carries no order counts, so
+    aggregated levels have no num_orders.
+    '''
+
+    def __init__(self, product_id='BTC-USD', log_to=None, fixed_point=False):
+        ''' With `fixed_point`, prices and sizes are kept as integers in the product's quote/base
+        increments, as in OrderBook. '''
+        super(Level2OrderBook, self).__init__(products=[product_id], channels=['level2'])
+        # Trees map price -> total size
+        self._asks = RBTree()
+        self._bids = RBTree()
+        self._bid_price = self._bid_size = None
+        self._ask_price = self._ask_size = None
+        self._bbo = None
+        product = None
+        if fixed_point:
+            product = next(p for p in PublicClient().get_products() if p['id'] == product_id)
+        self._to_price, self._from_price, self._to_size, self._from_size = book_converters(product)
+        self._log_to = log_to
+        if self._log_to:
+            assert hasattr(self._log_to, 'write')
+
+    @property
+    def product_id(self):
+        ''' Currently Level2OrderBook only supports a single product even though it is stored as a list of products. '''
+        return self.products[0]
+
+    def on_open(self):
+        print("-- Subscribed to Level2OrderBook! --\n")
+
+    def on_close(self):
+        print("\n-- Level2OrderBook Socket Closed! --")
+
+    def on_message(self, message):
+        if self._log_to:
+            pickle.dump(message, self._log_to)
+
+        msg_type = message['type']
+        if msg_type == 'l2update':
+            self.apply_changes(message['changes'])
+        elif msg_type == 'snapshot':
+            self.reset_book(message)
+
+    def reset_book(self, snapshot):
+        ''' Rebuilds the book from a level2 snapshot of [price, size] rows per side. '''
+        to_price, to_size = self._to_price, self._to_size
+        self._bids = RBTree((to_price(price), to_size(size)) for price, size in snapshot['bids'])
+        self._asks = RBTree((to_price(price), to_size(size)) for price, size in snapshot['asks'])
+        self._update_best('buy')
+        self._update_best('sell')
+        self._check_bbo()
+
+    def apply_changes(self, changes):
+        ''' Applies the [side, price, new_size] changes of an l2update; a zero size removes the level. '''
+        to_price, to_size = self._to_price, self._to_size
+        bid_moved = ask_moved = False
+        for side, price, size in changes:
+            price = to_price(price)
+            size = to_size(size)
+            if side == 'buy':
+                tree = self._bids
+                bid_moved = bid_moved or self._bid_price is None or price >= self._bid_price
+            else:
+                tree = self._asks
+                ask_moved = ask_moved or self._ask_price is None or price <= self._ask_price
+            if size:
+                tree.insert(price, size)
+            else:
+                tree.discard(price)
+        if bid_moved:
+            self._update_best('buy')
+        if ask_moved:
+            self._update_best('sell')
+        self._check_bbo()
+
+    def _update_best(self, side):
+        if side == 'buy':
+            self._bid_price, self._bid_size = self._bids.max_item() if self._bids else (None, None)
+        else:
+            self._ask_price, self._ask_size = self._asks.min_item() if self._asks else (None, None)
+
+    def _check_bbo(self):
+        ''' Fires on_bbo_change if the best prices or their sizes moved since the last check. '''
+        bbo = (self._bid_price, self._bid_size, self._ask_price, self._ask_size)
+        if bbo != self._bbo:
+            self._bbo = bbo
+            self.on_bbo_change(*self.get_bbo())
+
+    def on_bbo_change(self, bid, bid_size, ask, ask_size):
+        ''' Called after a message moved the best bid/ask price or size. Override to react to the touch. '''
+        pass
+
+    def get_bbo(self):
+        ''' Returns (bid, bid_size, ask, ask_size) as of the last message applied; None for an empty
+        side. Safe from any thread: it only reads the touch tuple that _check_bbo replaces whole. '''
+        bbo = self._bbo
+        if bbo is None:
+            return None, None, None, None
+        bid, bid_size, ask, ask_size = bbo
+        if bid is not None:
+            bid, bid_size = self._from_price(bid), self._from_size(bid_size)
+        if ask is not None:
+            ask, ask_size = self._from_price(ask), self._from_size(ask_size)
+        return bid, bid_size, ask, ask_size
+
+    def get_current_book(self, depth=None):
+        ''' Returns [price, size] for every level, or only the best `depth` levels per side. '''
+        return {
+            'asks': [list(level) for level in self._convert_levels(islice(self._asks.items(), depth))],
+            'bids': [list(level) for level in self._convert_levels(islice(self._bids.items(reverse=True), depth))],
+        }
+
+    def get_bids_top(self, depth):
+        ''' Returns (price, size) for the best `depth` bid levels, best first. '''
+        return self._convert_levels(islice(self._bids.items(reverse=True), depth))
+
+    def get_asks_top(self, depth):
+        ''' Returns (price, size) for the best `depth` ask levels, best first. '''
+        return self._convert_levels(islice(self._asks.items(), depth))
+
+    def _convert_levels(self, items):
+        from_price = self._from_price
+        from_size = self._from_size
+        return [(from_price(price), from_size(size)) for price, size in items]
+
+    def get_ask(self):
+        return None if self._ask_price is None else self._from_price(self._ask_price)
+
+    def get_asks(self, price):
+        return self._asks.get(price)
+
+    def get_bid(self):
+        return None if self._bid_price is None else self._from_price(self._bid_price)
+
+    def get_bids(self, price):
+        return self._bids.get(price)
+
+    def get_aggr_bids(self, min_diff_price=None, max_size=None):
+        return self._get_aggr(self._bids.items(reverse=True), self._bid_price, min_diff_price, max_size)
+
+    def get_aggr_asks(self, min_diff_price=None, max_size=None):
+        return self._get_aggr(self._asks.items(), self._ask_price, min_diff_price, max_size)
+
+    def _get_aggr(self, items, best, min_diff_price, max_size):
+        ''' Walks levels from the touch until both `min_diff_price` away and past `max_size`. '''
+        if min_diff_price is not None:
+            min_diff_price = self._to_price(min_diff_price)
+        if max_size is not None:
+            max_size = self._to_size(max_size)
+        total_size = 0
+        aggr = list()
+        for price, size in items:
+            if (meet_min_diff_price(min(price, best), max(price, best), min_diff_price) and
+                    meet_max_size(total_size, max_size)):
+                break
+            aggr.append({'price': self._from_price(price), 'size': self._from_size(size)})
+            total_size += size
+        return aggr
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import datetime as dt
+
+
+    class Level2OrderBookConsole(Level2OrderBook):
+        ''' Logs real-time changes to the bid-ask spread to the console '''
+
+        def on_bbo_change(self, bid, bid_size, ask, ask_size):
+            if bid is None or ask is None:
+                return
+            print('{} {} bid: {:.3f} @ {:.2f}\task: {:.3f} @ {:.2f}'.format(
+                dt.datetime.now(), self.product_id, bid_size, bid, ask_size, ask))
+
+    order_book = Level2OrderBookConsole()
+    order_book.start()
+    try:
+        while True:
+            time.sleep(10)
+    except KeyboardInterrupt:
+        order_book.close()
+
+    if order_book.error:
+        sys.exit(1)
+    else:
+        sys.exit(0)
@@ -4,20 +4,184 @@
 #
 # Live order book updated from the msg
 
-from bintrees import RBTree
+from collections import deque
 from decimal import Decimal
+from itertools import islice
+from threading import current_thread
 import logging
+import time
+
+from book_checkpoint import check_checkpoint, write_checkpoint
+from book_common import Order, OrderBookMixin, PriceLevel, identity, meet_max_size, meet_min_diff_price
+from price_levels import level_backend
 
 
 logger = logging.getLogger(__name__)
 
-class OrderBook(object):
-    def __init__(self, product_id='BTC-USD', feed=None, log_to=None):
+
+class DepthIndex(object):
+    """Cumulative size and notional over one side of a fixed-point book, as a sparse Fenwick tree.
+
+    Positions grow away from the touch (asks by tick, bids by 2**bits - tick), so a prefix sum
+    is everything from the best level through a price, and sweeps are a binary-lifting search.
+    Each node holds [size, notional]. Updates are only netted per price until the next query,
+    which then applies each touched price once in O(bits); the queries themselves are O(bits).
+    """
+    __slots__ = ('_n', '_mirror', '_nodes', '_pending')
+
+    def __init__(self, mirror, bits=32):
+        self._n = 1 << bits
+        self._mirror = mirror
+        self._nodes = {}
+        self._pending = {}
+
+    def _position(self, price):
+        return self._n - price if self._mirror else price
+
+    def add(self, price, size):
+        pending = self._pending
+        pending[price] = pending.get(price, 0) + size
+
+    def _flush(self):
+        n = self._n
+        nodes = self._nodes
+        for price, size in self._pending.items():
+            if not size:
+                continue
+            notional = size * price
+            i = self._position(price)
+            while i <= n:
+                node = nodes.get(i)
+                if node is None:
+                    nodes[i] = [size, notional]
+                else:
+                    node[0] += size
+                    node[1] += notional
+                i += i & -i
+        self._pending = {}
+
+    def prefix(self, price):
+        """Returns (size, notional) resting from the touch through `price` inclusive."""
+        if self._pending:
+            self._flush()
+        nodes = self._nodes
+        size = notional = 0
+        i = min(max(self._position(price), 0), self._n)
+        while i > 0:
+            node = nodes.get(i)
+            if node is not None:
+                size += node[0]
+                notional += node[1]
+            i &= i - 1
+        return size, notional
+
+    def sweep(self, size):
+        """Returns (notional, last_price) to take `size` from the touch, or None if the side is too thin."""
+        if self._pending:
+            self._flush()
+        n = self._n
+        nodes = self._nodes
+        position = notional = 0
+        remaining = size
+        step = n
+        while step:
+            i = position + step
+            if i <= n:
+                node = nodes.get(i)
+                if node is None:
+                    position = i
+                elif node[0] < remaining:
+                    position = i
+                    remaining -= node[0]
+                    notional += node[1]
+            step >>= 1
+        position += 1
+        if position > n:
+            return None
+        last_price = self._position(position)
+        return notional + remaining * last_price, last_price
+
+
+class OrderFlow(object):
+    """Counts and sizes of adds, cancels and trades per side over the last `window` seconds.
+
+    Events land in `buckets` equal time slices, and running totals are kept next to them: a
+    slice that falls out of the window is subtracted once, so recording and reading are O(1)
+    amortised. The window therefore moves in steps of window / buckets.
+    """
+    __slots__ = ('window', '_width', '_buckets', '_clock', '_slices', '_slice', '_counts', '_sizes')
+
+    EVENTS = ('add', 'cancel', 'trade')
+
+    def __init__(self, window=60.0, buckets=60, clock=time.time):
+        self.window = window
+        self._width = float(window) / buckets
+        self._buckets = buckets
+        self._clock = clock
+        # (slice number, counts, sizes) per slice with events, oldest first
+        self._slices = deque()
+        self._slice = None
+        self._counts = dict(((side, event), 0) for side in ('buy', 'sell') for event in self.EVENTS)
+        self._sizes = dict(self._counts)
+
+    def _advance(self):
+        number = int(self._clock() // self._width)
+        if self._slice is None or self._slice[0] != number:
+            oldest = number - self._buckets + 1
+            slices = self._slices
+            while slices and slices[0][0] < oldest:
+                _, counts, sizes = slices.popleft()
+                for key, count in counts.items():
+                    self._counts[key] -= count
+                    self._sizes[key] -= sizes[key]
+            self._slice = (number, {}, {})
+            slices.append(self._slice)
+        return self._slice
+
+    def record(self, side, event, size):
+        key = (side, event)
+        _, counts, sizes = self._advance()
+        counts[key] = counts.get(key, 0) + 1
+        sizes[key] = sizes.get(key, 0) + size
+        self._counts[key] += 1
+        self._sizes[key] += size
+
+    def totals(self):
+        """Returns ({(side, event): count}, {(side, event): size}) over the window."""
+        self._advance()
+        return dict(self._counts), dict(self._sizes)
+
+
+class OrderBook(OrderBookMixin):
+    def __init__(self, product_id='BTC-USD', feed=None, log_to=None, product=None, depth_index=False,
+                 levels='rbtree', imbalance_levels=None, flow_window=None, flow_clock=time.time):
+        """Passing `product` (an entry of PublicClient.get_products()) enables fixed-point mode:
+        prices and sizes are kept as integers in its quote/base increments and only converted to
+        Decimal at the API boundary. The raw price levels (get_bids/get_asks/...) then hold those integers.
+
+        `depth_index` additionally maintains a DepthIndex per side for the logarithmic-time
+        sweep-cost, VWAP and depth-within-band queries. It needs fixed-point mode.
+
+        `levels` picks the price -> level container of each side from price_levels.LEVEL_BACKENDS:
+        'rbtree', 'sorted_list' or 'skip_list'.
+
+        `imbalance_levels` maintains the resting size of the best N levels per side as messages
+        arrive, for get_imbalance and get_top_depth. `flow_window` (seconds) counts adds, cancels
+        and trades per side over a rolling window, see get_flow_rates; `flow_clock` is its time
+        source, e.g. the message times when replaying.
+        """
+        if depth_index and product is None:
+            raise ValueError("depth_index requires fixed-point mode, pass product")
         self._product_id = product_id
-        self._asks = RBTree()
-        self._bids = RBTree()
-        self._sequence = -1
-        self._current_ticker = None
+        self._init_book(level_backend(levels), product)
+        self._depth_index = depth_index
+        self._depth = self._new_depth()
+        # Size of the best N levels per side, and the worst price among them (None while a side
+        # has fewer than N levels, so that every level counts)
+        self._top_levels = imbalance_levels
+        self._top_size = {'buy': 0, 'sell': 0}
+        self._top_edge = {'buy': None, 'sell': None}
+        self._flow = OrderFlow(flow_window, clock=flow_clock) if flow_window else None
         self._feed = feed
 
     @property
@@ -26,25 +190,53 @@ class OrderBook(object):
         return self.product_id
 
     def reset_book(self, snapshot):
-        self._asks = RBTree()
-        self._bids = RBTree()
-        for bid in snapshot['bids']:
-            self._add({
-                'id': bid[2],
-                'side': 'buy',
-                'price': Decimal(bid[0]),
-                'size': Decimal(bid[1])
-            })
-        for ask in snapshot['asks']:
-            self._add({
-                'id': ask[2],
-                'side': 'sell',
-                'price': Decimal(ask[0]),
-                'size': Decimal(ask[1])
-            })
-        self._sequence = snapshot['sequence']
+        """ Rebuilds the book from a level-3 snapshot dict, or from the (key, value) pairs of
+        PublicClient.get_product_order_book_stream as they are parsed. Raises ValueError for
+        anything but a level-3 snapshot, e.g. a rate-limit error body, and keeps the book as it was. """
+        book = self._build_book(snapshot)
+        with self._feed_lock:
+            self._install_book(book)
+
+    def _install_book(self, book):
+        self._sequence, self._bids, self._asks, self._orders = book
+        self._dirty = None
+        self._feed_thread = current_thread()
+        # The depth index is built per level once the book is loaded
+        self._depth = self._new_depth()
+        if self._depth:
+            for price, level in self._bids.items():
+                self._depth['buy'].add(price, level.size)
+            for price, level in self._asks.items():
+                self._depth['sell'].add(price, level.size)
+        if self._top_levels:
+            self._update_top('buy')
+            self._update_top('sell')
+        self._update_best('buy')
+        self._update_best('sell')
+        self._check_bbo()
+        if self._snapshot_waiters or self._snapshot is not None:
+            # replaces the old book's snapshot; otherwise the first reader builds one
+            self.publish_snapshot()
+
+    def save_checkpoint(self, out_file):
+        """ Writes every order and the sequence to the binary file `out_file`, see book_checkpoint. """
+        write_checkpoint(out_file, self._sequence, self._bids.items(), self._asks.items(),
+                         self._product_id, self._increments())
+
+    def load_checkpoint(self, in_file):
+        """ Restores the book from a checkpoint written by save_checkpoint, for the same product and
+        in the same number mode. Messages after its sequence then catch it up, from the feed or a recording. """
+        sequence, levels = check_checkpoint(in_file, self._product_id, self._increments())
+        orders = {}
+        bids, asks = self._checkpoint_levels(levels, orders)
+        with self._feed_lock:
+            self._install_book((sequence, bids, asks, orders))
 
     def on_message(self, message):
+        with self._feed_lock:
+            self._process_message(message)
+
+    def _process_message(self, message):
         sequence = message['sequence']
         if self._sequence == -1:
             logger.error("Expected snapshot before any message")
@@ -70,207 +262,273 @@ class OrderBook(object):
             self._change(message)
 
         self._sequence = sequence
+        self._check_bbo()
+        if self._snapshot_waiters:
+            self.publish_snapshot()
 
     def on_sequence_gap(self, gap_start, gap_end):
         # self.reset_book()
         logger.error('Error: messages missing ({} - {}). ignoring the gap.'.format(
             gap_start, gap_end, self._sequence))
 
-    def get_current_ticker(self):
-        return self._current_ticker
-
-    def get_current_book(self):
-        result = {
-            'sequence': self._sequence,
-            'asks': [],
-            'bids': [],
-        }
-        for ask in self._asks:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_ask = self._asks[ask]
-            except KeyError:
-                continue
-            for order in this_ask:
-                result['asks'].append([order['price'], order['size'], order['id']])
-        for bid in self._bids:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_bid = self._bids[bid]
-            except KeyError:
-                continue
-
-            for order in this_bid:
-                result['bids'].append([order['price'], order['size'], order['id']])
-        return result
-
-    def get_ask(self):
-        return self._asks.min_key()
-
-    def get_asks(self, price):
-        return self._asks.get(price)
-
-    def remove_asks(self, price):
-        self._asks.remove(price)
-
-    def set_asks(self, price, asks):
-        self._asks.insert(price, asks)
-
-    def get_bid(self):
-        return self._bids.max_key()
-
-    def get_bids(self, price):
-        return self._bids.get(price)
-
-    def remove_bids(self, price):
-        self._bids.remove(price)
-
-    def set_bids(self, price, bids):
-        self._bids.insert(price, bids)
-
-    @staticmethod
-    def meet_min_diff_price(low_price, high_price, min_diff_price):
-        if low_price is None or high_price is None or min_diff_price is None:
-            return False
-        return high_price - low_price > min_diff_price
-
-    @staticmethod
-    def meet_max_size(total_size, max_size):
-        if total_size is None or max_size is None:
-            return False
-        return total_size > max_size
+    meet_min_diff_price = staticmethod(meet_min_diff_price)
+    meet_max_size = staticmethod(meet_max_size)
 
     def get_aggr_bids(self, min_diff_price=None, max_size=None):
-        max_bid = self.get_bid()
+        if min_diff_price is not None:
+            min_diff_price = self._to_price(min_diff_price)
+        if max_size is not None:
+            max_size = self._to_size(max_size)
+        max_bid = self._bid_price
         total_size = 0
         aggr_bids = list()
-        for price, bid_orders in reversed(list(self._bids.items())):
+        # Levels are walked lazily from the touch, so a depth-N query costs O(N)
+        for price, level in self._bids.items(reverse=True):
             if (OrderBook.meet_min_diff_price(price, max_bid, min_diff_price) and
                     OrderBook.meet_max_size(total_size, max_size)):
                 break
-            size = sum(bid_order['size'] for bid_order in bid_orders)
-            num_orders = len(bid_orders)
-            aggr_bids.append({'price': price, 'size': size, 'num_orders': num_orders})
+            size = level.size
+            num_orders = len(level)
+            aggr_bids.append({'price': self._from_price(price), 'size': self._from_size(size), 'num_orders': num_orders})
             total_size += size
         return aggr_bids
 
     def get_aggr_asks(self, min_diff_price=None, max_size=None):
-        min_ask = self.get_ask()
+        if min_diff_price is not None:
+            min_diff_price = self._to_price(min_diff_price)
+        if max_size is not None:
+            max_size = self._to_size(max_size)
+        min_ask = self._ask_price
         total_size = 0
         aggr_asks = list()
-        for price, ask_orders in self._asks.items():
+        for price, level in self._asks.items():
             if (OrderBook.meet_min_diff_price(min_ask, price, min_diff_price) and
                     OrderBook.meet_max_size(total_size, max_size)):
                 break
-            size = sum(ask_order['size'] for ask_order in ask_orders)
-            num_orders = len(ask_orders)
-            aggr_asks.append({'price': price, 'size': size, 'num_orders': num_orders})
+            size = level.size
+            num_orders = len(level)
+            aggr_asks.append({'price': self._from_price(price), 'size': self._from_size(size), 'num_orders': num_orders})
             total_size += size
         return aggr_asks
 
+    def get_bids_sweep(self, size):
+        """Returns the proceeds of selling `size` into the bids, or None if they are too thin."""
+        return self._sweep('buy', size)
+
+    def get_asks_sweep(self, size):
+        """Returns the cost of buying `size` from the asks, or None if they are too thin."""
+        return self._sweep('sell', size)
+
+    def get_bids_vwap(self, size):
+        proceeds = self.get_bids_sweep(size)
+        return None if proceeds is None else proceeds / self._from_size(self._to_size(size))
+
+    def get_asks_vwap(self, size):
+        cost = self.get_asks_sweep(size)
+        return None if cost is None else cost / self._from_size(self._to_size(size))
+
+    def get_bids_depth_within(self, price_band):
+        """Returns the bid size resting within `price_band` below the best bid."""
+        if self._bid_price is None:
+            return self._from_size(0)
+        return self._depth_within('buy', self._bid_price - self._to_price(price_band))
+
+    def get_asks_depth_within(self, price_band):
+        """Returns the ask size resting within `price_band` above the best ask."""
+        if self._ask_price is None:
+            return self._from_size(0)
+        return self._depth_within('sell', self._ask_price + self._to_price(price_band))
+
+    def get_imbalance(self):
+        """Returns (bid size - ask size) / (bid size + ask size) over the best `imbalance_levels`
+        levels per side, from -1 (all asks) to 1 (all bids); None for an empty book."""
+        if not self._top_levels:
+            raise ValueError("imbalance queries need imbalance_levels")
+        bids, asks = self._top_size['buy'], self._top_size['sell']
+        if not bids and not asks:
+            return None
+        return float(bids - asks) / float(bids + asks)
+
+    def get_top_depth(self):
+        """Returns (bid size, ask size) resting in the best `imbalance_levels` levels per side."""
+        if not self._top_levels:
+            raise ValueError("imbalance queries need imbalance_levels")
+        return self._from_size(self._top_size['buy']), self._from_size(self._top_size['sell'])
+
+    def get_microprice(self):
+        """Returns the touch prices weighted by the opposite sizes, which leans towards the side
+        about to be taken out; None unless both sides have orders."""
+        if self._bid_level is None or self._ask_level is None:
+            return None
+        bid_size, ask_size = self._bid_level.size, self._ask_level.size
+        if not bid_size + ask_size:
+            return None
+        weighted = Decimal(self._bid_price * ask_size + self._ask_price * bid_size)
+        return self._from_price(weighted / (bid_size + ask_size))
+
+    def get_flow_rates(self):
+        """Returns {side: {event: events per second}} over the last `flow_window` seconds, for the
+        events 'add' (orders opened on the book), 'cancel' and 'trade' (resting orders matched)."""
+        return self._flow_rates(0)
+
+    def get_flow_volumes(self):
+        """Returns {side: {event: size per second}}, as get_flow_rates but weighted by size."""
+        return self._flow_rates(1)
+
+    def _flow_rates(self, index):
+        if self._flow is None:
+            raise ValueError("flow queries need flow_window")
+        totals = self._flow.totals()[index]
+        window = float(self._flow.window)
+        from_size = self._from_size if index else identity
+        return dict((side, dict((event, float(from_size(totals[side, event])) / window)
+                                for event in OrderFlow.EVENTS))
+                    for side in ('buy', 'sell'))
+
+    def _new_depth(self):
+        if not self._depth_index:
+            return None
+        return {'buy': DepthIndex(mirror=True), 'sell': DepthIndex(mirror=False)}
+
+    def _sweep(self, side, size):
+        if not self._depth:
+            raise ValueError("sweep queries need depth_index=True")
+        result = self._depth[side].sweep(self._to_size(size))
+        if result is None:
+            return None
+        # notional is in size units times price ticks, so scale it back by both increments
+        return self._from_size(self._from_price(result[0]))
+
+    def _depth_within(self, side, price):
+        if not self._depth:
+            raise ValueError("depth queries need depth_index=True")
+        return self._from_size(self._depth[side].prefix(price)[0])
+
     # Internal operations
     def _add(self, order):
-        order = {
-            'id': order.get('order_id') or order['id'],
-            'side': order['side'],
-            'price': Decimal(order['price']),
-            'size': Decimal(order.get('size') or order['remaining_size'])
-        }
-        if order['side'] == 'buy':
-            bids = self.get_bids(order['price'])
-            if bids is None:
-                bids = [order]
-            else:
-                bids.append(order)
-            self.set_bids(order['price'], bids)
+        order = Order(
+            order.get('order_id') or order['id'],
+            order['side'],
+            self._to_price(order['price']),
+            self._to_size(order.get('size') or order['remaining_size'])
+        )
+        if order.side == 'buy':
+            level = self.get_bids(order.price)
+            if level is None:
+                level = PriceLevel()
+                self.set_bids(order.price, level)
+                if self._bid_price is None or order.price > self._bid_price:
+                    self._bid_price, self._bid_level = order.price, level
         else:
-            asks = self.get_asks(order['price'])
-            if asks is None:
-                asks = [order]
-            else:
-                asks.append(order)
-            self.set_asks(order['price'], asks)
+            level = self.get_asks(order.price)
+            if level is None:
+                level = PriceLevel()
+                self.set_asks(order.price, level)
+                if self._ask_price is None or order.price < self._ask_price:
+                    self._ask_price, self._ask_level = order.price, level
+        level.orders[order.id] = order
+        level.size += order.size
+        order.level = level
+        self._orders[order.id] = order
+        if self._dirty is not None:
+            self._dirty[order.side].add(order.price)
+        if self._depth:
+            self._depth[order.side].add(order.price, order.size)
+        if self._top_levels:
+            self._top_changed(order.side, order.price, order.size, len(level.orders) == 1)
+        if self._flow is not None:
+            self._flow.record(order.side, 'add', order.size)
 
     def _remove(self, order):
-        price = Decimal(order['price'])
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is not None:
-                bids = [o for o in bids if o['id'] != order['order_id']]
-                if len(bids) > 0:
-                    self.set_bids(price, bids)
-                else:
-                    self.remove_bids(price)
-        else:
-            asks = self.get_asks(price)
-            if asks is not None:
-                asks = [o for o in asks if o['id'] != order['order_id']]
-                if len(asks) > 0:
-                    self.set_asks(price, asks)
-                else:
-                    self.remove_asks(price)
+        order = self._orders.pop(order['order_id'], None)
+        if order is not None:
+            # Filled orders already left the book with their last match, so this is a cancel
+            if self._flow is not None:
+                self._flow.record(order.side, 'cancel', order.size)
+            self._discard(order)
 
     def _match(self, order):
         if self._feed is not None:
             self._feed._match(order)
 
-        size = Decimal(order['size'])
-        price = Decimal(order['price'])
+        maker = self._orders.get(order['maker_order_id'])
+        if maker is None:
+            return
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if not bids:
-                return
-            assert bids[0]['id'] == order['maker_order_id']
-            if bids[0]['size'] == size:
-                self.set_bids(price, bids[1:])
-            else:
-                bids[0]['size'] -= size
-                self.set_bids(price, bids)
+        size = self._to_size(order['size'])
+        if self._flow is not None:
+            self._flow.record(maker.side, 'trade', size)
+        if maker.size == size:
+            del self._orders[maker.id]
+            self._discard(maker)
         else:
-            asks = self.get_asks(price)
-            if not asks:
-                return
-            assert asks[0]['id'] == order['maker_order_id']
-            if asks[0]['size'] == size:
-                self.set_asks(price, asks[1:])
-            else:
-                asks[0]['size'] -= size
-                self.set_asks(price, asks)
+            maker.size -= size
+            maker.level.size -= size
+            if self._dirty is not None:
+                self._dirty[maker.side].add(maker.price)
+            if self._depth:
+                self._depth[maker.side].add(maker.price, -size)
+            if self._top_levels:
+                self._top_changed(maker.side, maker.price, -size, False)
 
     def _change(self, order):
         try:
-            new_size = Decimal(order['new_size'])
+            new_size = self._to_size(order['new_size'])
         except KeyError:
             return
 
-        try:
-            price = Decimal(order['price'])
-        except KeyError:
+        # Orders that never rested on the book (e.g. market orders) are not indexed
+        existing = self._orders.get(order['order_id'])
+        if existing is not None:
+            existing.level.size += new_size - existing.size
+            if self._dirty is not None:
+                self._dirty[existing.side].add(existing.price)
+            if self._depth:
+                self._depth[existing.side].add(existing.price, new_size - existing.size)
+            if self._top_levels:
+                self._top_changed(existing.side, existing.price, new_size - existing.size, False)
+            existing.size = new_size
+
+    def _discard(self, order):
+        """Drops an order from its price level, removing the level once it is empty."""
+        level = order.level
+        del level.orders[order.id]
+        level.size -= order.size
+        if self._dirty is not None:
+            self._dirty[order.side].add(order.price)
+        if self._depth:
+            self._depth[order.side].add(order.price, -order.size)
+        if not level.orders:
+            if order.side == 'buy':
+                self.remove_bids(order.price)
+                if level is self._bid_level:
+                    self._update_best('buy')
+            else:
+                self.remove_asks(order.price)
+                if level is self._ask_level:
+                    self._update_best('sell')
+        if self._top_levels:
+            self._top_changed(order.side, order.price, -order.size, not level.orders)
+
+    def _top_changed(self, side, price, delta, level_added_or_removed):
+        """ Applies a size change at `price` to the best-N total of `side`. Only a level appearing
+        or disappearing within the best N shifts which levels count, and that re-reads them. """
+        edge = self._top_edge[side]
+        if edge is not None and (price < edge if side == 'buy' else price > edge):
             return
-
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is None or not any(o['id'] == order['order_id'] for o in bids):
-                return
-            index = [b['id'] for b in bids].index(order['order_id'])
-            bids[index]['size'] = new_size
-            self.set_bids(price, bids)
+        if level_added_or_removed:
+            self._update_top(side)
         else:
-            asks = self.get_asks(price)
-            if asks is None or not any(o['id'] == order['order_id'] for o in asks):
-                return
-            index = [a['id'] for a in asks].index(order['order_id'])
-            asks[index]['size'] = new_size
-            self.set_asks(price, asks)
+            self._top_size[side] += delta
 
-        tree = self._asks if order['side'] == 'sell' else self._bids
-        node = tree.get(price)
-
-        if node is None or not any(o['id'] == order['order_id'] for o in node):
-            return
+    def _update_top(self, side):
+        """ Re-reads the best-N total and edge price of one side from the tree. """
+        if side == 'buy':
+            levels = list(islice(self._bids.items(reverse=True), self._top_levels))
+        else:
+            levels = list(islice(self._asks.items(), self._top_levels))
+        self._top_size[side] = sum(level.size for price, level in levels)
+        self._top_edge[side] = levels[-1][0] if len(levels) == self._top_levels else None
 
 
 if __name__ == '__main__':
@@ -282,37 +540,12 @@ if __name__ == '__main__':
     class OrderBookConsole(OrderBook):
         ''' Logs real-time changes to the bid-ask spread to the console '''
 
-        def __init__(self, product_id=None):
-            super(OrderBookConsole, self).__init__(product_id=product_id)
-
-            # latest values of bid-ask spread
-            self._bid = None
-            self._ask = None
-            self._bid_depth = None
-            self._ask_depth = None
-
-        def on_message(self, message):
-            super(OrderBookConsole, self).on_message(message)
-
-            # Calculate newest bid-ask spread
-            bid = self.get_bid()
-            bids = self.get_bids(bid)
-            bid_depth = sum([b['size'] for b in bids])
-            ask = self.get_ask()
-            asks = self.get_asks(ask)
-            ask_depth = sum([a['size'] for a in asks])
-
-            if self._bid == bid and self._ask == ask and self._bid_depth == bid_depth and self._ask_depth == ask_depth:
-                # If there are no changes to the bid-ask spread since the last update, no need to print
-                pass
-            else:
-                # If there are differences, update the cache
-                self._bid = bid
-                self._ask = ask
-                self._bid_depth = bid_depth
-                self._ask_depth = ask_depth
-                logger.info('{} bid: {:.3f} @ {:.2f}\task: {:.3f} @ {:.2f}'.format(
-                    self.product_id, bid_depth, bid, ask_depth, ask))
+        def on_bbo_change(self, bid, bid_size, ask, ask_size):
+            # Only called when the bid-ask spread or the sizes at the touch changed
+            if bid is None or ask is None:
+                return
+            logger.info('{} bid: {:.3f} @ {:.2f}\task: {:.3f} @ {:.2f}'.format(
+                self.product_id, bid_size, bid, ask_size, ask))
 
     order_book = OrderBookConsole()
     order_book.start()
@@ -4,73 +4,223 @@
 #
 # Live order book updated from the gdax Websocket Feed
 
-from bintrees import RBTree
-from decimal import Decimal
+from collections import deque
+from threading import Event, Thread, current_thread
 import pickle
+import time
 
+from gdax.book_checkpoint import check_checkpoint, write_checkpoint
+from gdax.book_common import Order, OrderBookMixin, PriceLevel
+from gdax.connection_health import backoff_delay
+from gdax.feed_decoder import FeedDecoder
+from gdax.price_levels import level_backend
 from gdax.public_client import PublicClient
+from gdax.top_of_book import TopOfBookWriter
 from gdax.websocket_client import WebsocketClient
 
 
-class OrderBook(WebsocketClient):
-    def __init__(self, product_id='BTC-USD', log_to=None):
-        super(OrderBook, self).__init__(products=product_id)
-        self._asks = RBTree()
-        self._bids = RBTree()
+class OrderBook(OrderBookMixin, WebsocketClient):
+    def __init__(self, product_id='BTC-USD', log_to=None, fixed_point=False, stream_snapshot=False,
+                 top_of_book_path=None, levels='rbtree', validate_interval=None, buffer_size=None,
+                 skip_received=False, resync_queue_size=100000):
+        ''' With `fixed_point`, prices and sizes are kept as integers in the product's quote/base
+        increments and only converted to Decimal by get_bid/get_ask/get_current_book. The raw
+        price levels (get_bids/get_asks/set_bids/...) are then keyed and sized in those integers.
+
+        With `stream_snapshot`, level-3 snapshots are parsed while they download and loaded into
+        the book row by row, instead of being decoded into lists first.
+
+        With `top_of_book_path`, the BBO, last trade and sequence are published to that file
+        whenever they change, for TopOfBookReader in other processes.
+
+        `levels` picks the price -> level container of each side from price_levels.LEVEL_BACKENDS:
+        'rbtree', 'sorted_list' or 'skip_list'.
+
+        With `validate_interval`, the book is checked against a level-2 REST snapshot that often
+        (in seconds) while connected; see start_validator.
+
+        With `buffer_size`, frames are received into a ring buffer and applied on a separate
+        thread; see WebsocketClient.
+
+        With `skip_received`, 'received' messages are only decoded down to their type, sequence,
+        product_id and time (see FeedDecoder). That is all the book needs of them, but an
+        on_message override gets none of their other fields. `log_to` keeps whole messages.
+
+        While a snapshot is fetched, failed fetches and their retries included, up to
+        `resync_queue_size` messages are queued for replay; beyond that the oldest are dropped,
+        and a snapshot older than the messages left starts another resync. '''
+        skip_types = ('received',) if skip_received and not log_to else ()
+        super(OrderBook, self).__init__(products=[product_id], buffer_size=buffer_size,
+                                        decoder=FeedDecoder(skip_types=skip_types))
         self._client = PublicClient()
-        self._sequence = -1
+        product = None
+        if fixed_point:
+            product = next(p for p in self._client.get_products() if p['id'] == product_id)
+        self._init_book(level_backend(levels), product)
+        # While a snapshot is fetched off the feed thread, messages queue up to be replayed on top of it
+        self._stream_snapshot = stream_snapshot
+        self._resync_thread = None
+        self._resync_snapshot = None
+        self._resync_queue = deque(maxlen=resync_queue_size)
+        # Snapshot requests failed in a row, to space out the retries
+        self._resync_failures = 0
         self._log_to = log_to
         if self._log_to:
             assert hasattr(self._log_to, 'write')
-        self._current_ticker = None
+        # BBO tuple last written to the top-of-book file, to only write when the touch moved
+        self._top_of_book = TopOfBookWriter(top_of_book_path) if top_of_book_path else None
+        self._published_bbo = None
+        # Prices of the levels changed since pop_level_changes, while a level publisher is set
+        self._level_changes = None
+        self._level_publisher = None
+        # Background validation: the fetch thread and its stop event, the feed thread's go-ahead
+        # to fetch, the level-2 snapshot fetched, and the level sizes before every message since
+        # the fetch started, to roll the book back to the snapshot's sequence
+        self._validate_interval = validate_interval
+        self._validator = None
+        self._validation_requested = None
+        self._validation_snapshot = None
+        self._validation_log = None
+        self._validation_start = -1
+        self._validation_stats = {'checks': 0, 'skipped': 0, 'divergences': 0, 'last': None}
 
     @property
     def product_id(self):
         ''' Currently OrderBook only supports a single product even though it is stored as a list of products. '''
         return self.products[0]
 
+    @property
+    def sequence(self):
+        ''' Sequence of the last message applied to the book, -1 before the first snapshot. '''
+        return self._sequence
+
     def on_open(self):
-        self._sequence = -1
+        # A book installed before starting (e.g. by load_checkpoint) is kept: the first message
+        # either continues its sequence or resyncs it through the gap, as after a reconnect
+        if self._validate_interval:
+            self.start_validator(self._validate_interval)
         print("-- Subscribed to OrderBook! --\n")
 
     def on_close(self):
+        self.stop_validator()
         print("\n-- OrderBook Socket Closed! --")
 
-    def reset_book(self):
-        self._asks = RBTree()
-        self._bids = RBTree()
-        res = self._client.get_product_order_book(product_id=self.product_id, level=3)
-        for bid in res['bids']:
-            self.add({
-                'id': bid[2],
-                'side': 'buy',
-                'price': Decimal(bid[0]),
-                'size': Decimal(bid[1])
-            })
-        for ask in res['asks']:
-            self.add({
-                'id': ask[2],
-                'side': 'sell',
-                'price': Decimal(ask[0]),
-                'size': Decimal(ask[1])
-            })
-        self._sequence = res['sequence']
+    def on_reconnect(self):
+        # Messages were lost while disconnected: fetch a snapshot now, while the new subscription
+        # starts, and replay the new connection's messages on top of it
+        self.resync()
+        print("-- OrderBook reconnected, resyncing from a snapshot --\n")
+
+    def reset_book(self, snapshot=None):
+        ''' Rebuilds the book from a level-3 snapshot, fetching one (blocking) if not given. The snapshot
+        may also be the (key, value) pairs of PublicClient.get_product_order_book_stream. '''
+        if snapshot is None:
+            snapshot = self._fetch_snapshot()
+        book = self._build_book(snapshot)
+        with self._feed_lock:
+            self._install_book(book)
+
+    def _fetch_snapshot(self):
+        if self._stream_snapshot:
+            return self._client.get_product_order_book_stream(product_id=self.product_id)
+        return self._client.get_product_order_book(product_id=self.product_id, level=3)
+
+    def _install_book(self, book):
+        if self._level_changes is not None:
+            # Levels of the old book that the new one lacks go out with size 0
+            self._level_changes['buy'].update(self._bids.keys())
+            self._level_changes['sell'].update(self._asks.keys())
+        self._sequence, self._bids, self._asks, self._orders = book
+        # A validation in flight compared against the old book; drop it
+        self._validation_log = None
+        self._validation_snapshot = None
+        if self._level_changes is not None:
+            self._level_changes['buy'].update(self._bids.keys())
+            self._level_changes['sell'].update(self._asks.keys())
+        self._dirty = None
+        self._feed_thread = current_thread()
+        self._update_best('buy')
+        self._update_best('sell')
+        self._check_bbo()
+        if self._top_of_book is not None:
+            self._publish_top_of_book()
+        if self._snapshot_waiters or self._snapshot is not None:
+            # replaces the old book's snapshot; otherwise the first reader builds one
+            self.publish_snapshot()
+
+    def save_checkpoint(self, out_file):
+        ''' Writes every order and the sequence to the binary file `out_file`, see book_checkpoint.
+        Call it from the feed thread, e.g. in on_message. '''
+        write_checkpoint(out_file, self._sequence, self._bids.items(), self._asks.items(),
+                         self.product_id, self._increments())
+
+    def load_checkpoint(self, in_file):
+        ''' Restores the book from a checkpoint written by save_checkpoint, for the same product and
+        in the same number mode. Feed messages after its sequence then catch it up; a gap resyncs
+        as usual. '''
+        sequence, levels = check_checkpoint(in_file, self.product_id, self._increments())
+        orders = {}
+        bids, asks = self._checkpoint_levels(levels, orders)
+        with self._feed_lock:
+            self._install_book((sequence, bids, asks, orders))
+
+    def _message_thread(self):
+        # Once started, messages are applied on the client's message thread, wherever the book was reset
+        return self.message_thread or self._feed_thread
+
+    def resync(self, delay=0):
+        ''' Fetches a level-3 snapshot and builds a book from it on a background thread, after
+        `delay` seconds. Messages received meanwhile are queued, then replayed on top of the new
+        book once it is ready. '''
+        if self._resync_thread is not None:
+            return
+
+        def _fetch():
+            if delay:
+                time.sleep(delay)
+            try:
+                self._resync_snapshot = self._build_book(self._fetch_snapshot())
+            except Exception as e:
+                self._resync_snapshot = e
+
+        self._resync_snapshot = None
+        self._resync_thread = Thread(target=_fetch, name='OrderBookResync')
+        self._resync_thread.daemon = True
+        self._resync_thread.start()
 
     def on_message(self, message):
         if self._log_to:
             pickle.dump(message, self._log_to)
+        with self._feed_lock:
+            self._process_message(message)
+
+    def _process_message(self, message):
+        if self._resync_thread is not None:
+            self._resync_queue.append(message)
+            if self._resync_snapshot is not None:
+                self._finish_resync()
+            elif self._snapshot_waiters:
+                # the old book is still consistent at its own sequence
+                self.publish_snapshot()
+            return
 
         sequence = message['sequence']
         if self._sequence == -1:
-            self.reset_book()
+            self.resync()
+            self._resync_queue.append(message)
             return
         if sequence <= self._sequence:
             # ignore older messages (e.g. before order book initialization from getProductOrderBook)
             return
         elif sequence > self._sequence + 1:
             self.on_sequence_gap(self._sequence, sequence)
+            if self._resync_thread is not None:
+                self._resync_queue.append(message)
             return
 
+        if self._validation_log is not None:
+            self._log_level(message)
+
         msg_type = message['type']
         if msg_type == 'open':
             self.add(message)
@@ -83,206 +233,312 @@ class OrderBook(WebsocketClient):
             self.change(message)
 
         self._sequence = sequence
+        self._check_bbo()
+        if self._top_of_book is not None and (self._bbo is not self._published_bbo or msg_type == 'match'):
+            self._publish_top_of_book()
+        if self._level_publisher is not None:
+            self._level_publisher.on_book_message(self)
+        if self._validation_requested is not None or self._validation_snapshot is not None:
+            self._step_validation()
+        if self._snapshot_waiters:
+            self.publish_snapshot()
+
+    def _finish_resync(self):
+        book = self._resync_snapshot
+        self._resync_thread = None
+        if isinstance(book, Exception):
+            # The queue is kept for the retry: its snapshot may still lag the messages queued so
+            # far, and those up to its sequence are skipped when it is installed
+            delay = backoff_delay(self._resync_failures)
+            self._resync_failures += 1
+            print('Error: snapshot request failed ({}). Retrying in {:.2f} seconds.'.format(book, delay))
+            self.resync(delay)
+            return
 
-    def on_sequence_gap(self, gap_start, gap_end):
-        self.reset_book()
-        print('Error: messages missing ({} - {}). Re-initializing  book at sequence.'.format(
-            gap_start, gap_end, self._sequence))
+        self._resync_failures = 0
+        self._install_book(book)
+        queued = self._resync_queue
+        self._resync_queue = deque(maxlen=queued.maxlen)
+        # Messages up to the snapshot's sequence are skipped; a new gap starts another resync
+        # and the rest of the queue carries over to it
+        for message in queued:
+            self._process_message(message)
+
+    def start_validator(self, interval=60.0):
+        ''' Every `interval` seconds, fetches a level-2 snapshot on a background thread and compares
+        its top 50 levels per side with the book at the snapshot's sequence. The comparison runs on
+        the feed thread at a message boundary, and only a divergence triggers a resync.
+
+        While a fetch is in flight, the size of every level a message touches is logged before
+        the message is applied, so the book can be rolled back to a snapshot that is behind it. '''
+        if self._validator is not None:
+            return
+        stop = Event()
+
+        def _validate():
+            while not stop.wait(interval):
+                if self._resync_thread is not None or self._sequence == -1:
+                    continue
+                # The feed thread starts logging at its next message boundary, then we fetch
+                requested = Event()
+                self._validation_requested = requested
+                if not requested.wait(interval):
+                    continue
+                try:
+                    self._validation_snapshot = self._client.get_product_order_book(
+                        product_id=self.product_id, level=2)
+                except Exception as e:
+                    self._validation_snapshot = e
+
+        thread = Thread(target=_validate, name='OrderBookValidator')
+        thread.daemon = True
+        self._validator = (thread, stop)
+        thread.start()
+
+    def stop_validator(self):
+        if self._validator is None:
+            return
+        thread, stop = self._validator
+        self._validator = None
+        stop.set()
+
+    def get_validation_stats(self):
+        ''' Returns counts of checks, skipped checks and divergences, and the metrics of the last
+        check: its sequence, the number of levels compared and mismatched, and the total absolute
+        size difference over them. '''
+        return dict(self._validation_stats)
+
+    def _log_level(self, message):
+        ''' Logs the size of the level a message is about to change, while a validation is in flight. '''
+        msg_type = message['type']
+        if msg_type == 'open':
+            side, price = message['side'], self._to_price(message['price'])
+        else:
+            order = self._orders.get(message['maker_order_id'] if msg_type == 'match' else message.get('order_id'))
+            if order is None:
+                return
+            side, price = order.side, order.price
+        level = (self._bids if side == 'buy' else self._asks).get(price)
+        self._validation_log.append((message['sequence'], side, price, 0 if level is None else level.size))
+
+    def _step_validation(self):
+        ''' Advances a validation in flight at a message boundary. Feed thread only. '''
+        requested = self._validation_requested
+        if requested is not None:
+            self._validation_requested = None
+            self._validation_log = []
+            self._validation_start = self._sequence
+            requested.set()
+        snapshot = self._validation_snapshot
+        if snapshot is None:
+            return
+        if not isinstance(snapshot, dict) or 'sequence' not in snapshot:
+            # the request failed or returned an error message
+            self._validation_snapshot = self._validation_log = None
+            self._validation_stats['skipped'] += 1
+            return
+        if snapshot['sequence'] > self._sequence:
+            # the book has not caught up with the snapshot yet
+            return
+        log = self._validation_log
+        self._validation_snapshot = self._validation_log = None
+        if snapshot['sequence'] < self._validation_start or log is None:
+            self._validation_stats['skipped'] += 1
+            return
+        self._validate(snapshot, log)
+
+    def _validate(self, snapshot, log):
+        sequence = snapshot['sequence']
+        # Level sizes at the snapshot's sequence, for the levels changed since
+        rollback = {'buy': {}, 'sell': {}}
+        for logged_sequence, side, price, size in reversed(log):
+            if logged_sequence <= sequence:
+                break
+            rollback[side][price] = size
+
+        num_levels = mismatched = 0
+        difference = 0
+        for side, levels, rows in (('buy', self._bids, snapshot['bids']), ('sell', self._asks, snapshot['asks'])):
+            remote = dict((self._to_price(row[0]), self._to_size(row[1])) for row in rows)
+            if not remote:
+                continue
+            # Only levels from the touch to the snapshot's deepest one can be compared
+            if side == 'buy':
+                bound = min(remote)
+                within = lambda price: price >= bound
+                items = levels.items(reverse=True)
+            else:
+                bound = max(remote)
+                within = lambda price: price <= bound
+                items = levels.items()
+            local = {}
+            for price, level in items:
+                if not within(price):
+                    break
+                local[price] = level.size
+            for price, size in rollback[side].items():
+                if within(price):
+                    local[price] = size
+            for price in set(remote) | set(price for price, size in local.items() if size):
+                num_levels += 1
+                local_size = local.get(price, 0)
+                remote_size = remote.get(price, 0)
+                if local_size != remote_size:
+                    mismatched += 1
+                    difference += abs(local_size - remote_size)
+
+        stats = self._validation_stats
+        stats['checks'] += 1
+        stats['last'] = {
+            'sequence': sequence,
+            'levels': num_levels,
+            'mismatched_levels': mismatched,
+            'size_difference': self._from_size(difference),
+        }
+        if mismatched:
+            stats['divergences'] += 1
+            print('Error: book diverged from the level-2 snapshot at sequence {} ({} of {} levels differ). '
+                  'Resyncing.'.format(sequence, mismatched, num_levels))
+            self.resync()
 
+    def on_sequence_gap(self, gap_start, gap_end):
+        self.resync()
+        print('Error: messages missing ({} - {}). Re-initializing book from a snapshot.'.format(
+            gap_start, gap_end))
 
     def add(self, order):
-        order = {
-            'id': order.get('order_id') or order['id'],
-            'side': order['side'],
-            'price': Decimal(order['price']),
-            'size': Decimal(order.get('size') or order['remaining_size'])
-        }
-        if order['side'] == 'buy':
-            bids = self.get_bids(order['price'])
-            if bids is None:
-                bids = [order]
-            else:
-                bids.append(order)
-            self.set_bids(order['price'], bids)
+        order = Order(
+            order.get('order_id') or order['id'],
+            order['side'],
+            self._to_price(order['price']),
+            self._to_size(order.get('size') or order['remaining_size'])
+        )
+        if order.side == 'buy':
+            level = self.get_bids(order.price)
+            if level is None:
+                level = PriceLevel()
+                self.set_bids(order.price, level)
+                if self._bid_price is None or order.price > self._bid_price:
+                    self._bid_price, self._bid_level = order.price, level
         else:
-            asks = self.get_asks(order['price'])
-            if asks is None:
-                asks = [order]
-            else:
-                asks.append(order)
-            self.set_asks(order['price'], asks)
+            level = self.get_asks(order.price)
+            if level is None:
+                level = PriceLevel()
+                self.set_asks(order.price, level)
+                if self._ask_price is None or order.price < self._ask_price:
+                    self._ask_price, self._ask_level = order.price, level
+        level.orders[order.id] = order
+        level.size += order.size
+        order.level = level
+        self._orders[order.id] = order
+        if self._dirty is not None:
+            self._dirty[order.side].add(order.price)
+        if self._level_changes is not None:
+            self._level_changes[order.side].add(order.price)
 
     def remove(self, order):
-        price = Decimal(order['price'])
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is not None:
-                bids = [o for o in bids if o['id'] != order['order_id']]
-                if len(bids) > 0:
-                    self.set_bids(price, bids)
-                else:
-                    self.remove_bids(price)
-        else:
-            asks = self.get_asks(price)
-            if asks is not None:
-                asks = [o for o in asks if o['id'] != order['order_id']]
-                if len(asks) > 0:
-                    self.set_asks(price, asks)
-                else:
-                    self.remove_asks(price)
+        order = self._orders.pop(order['order_id'], None)
+        if order is not None:
+            self._discard(order)
 
     def match(self, order):
-        size = Decimal(order['size'])
-        price = Decimal(order['price'])
+        maker = self._orders.get(order['maker_order_id'])
+        if maker is None:
+            return
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if not bids:
-                return
-            assert bids[0]['id'] == order['maker_order_id']
-            if bids[0]['size'] == size:
-                self.set_bids(price, bids[1:])
-            else:
-                bids[0]['size'] -= size
-                self.set_bids(price, bids)
+        size = self._to_size(order['size'])
+        if maker.size == size:
+            del self._orders[maker.id]
+            self._discard(maker)
         else:
-            asks = self.get_asks(price)
-            if not asks:
-                return
-            assert asks[0]['id'] == order['maker_order_id']
-            if asks[0]['size'] == size:
-                self.set_asks(price, asks[1:])
-            else:
-                asks[0]['size'] -= size
-                self.set_asks(price, asks)
+            maker.size -= size
+            maker.level.size -= size
+            if self._dirty is not None:
+                self._dirty[maker.side].add(maker.price)
+            if self._level_changes is not None:
+                self._level_changes[maker.side].add(maker.price)
 
     def change(self, order):
         try:
-            new_size = Decimal(order['new_size'])
-        except KeyError:
-            return
-
-        try:
-            price = Decimal(order['price'])
+            new_size = self._to_size(order['new_size'])
         except KeyError:
             return
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is None or not any(o['id'] == order['order_id'] for o in bids):
-                return
-            index = [b['id'] for b in bids].index(order['order_id'])
-            bids[index]['size'] = new_size
-            self.set_bids(price, bids)
-        else:
-            asks = self.get_asks(price)
-            if asks is None or not any(o['id'] == order['order_id'] for o in asks):
-                return
-            index = [a['id'] for a in asks].index(order['order_id'])
-            asks[index]['size'] = new_size
-            self.set_asks(price, asks)
-
-        tree = self._asks if order['side'] == 'sell' else self._bids
-        node = tree.get(price)
-
-        if node is None or not any(o['id'] == order['order_id'] for o in node):
-            return
-
-    def get_current_ticker(self):
-        return self._current_ticker
-
-    def get_current_book(self):
-        result = {
-            'sequence': self._sequence,
-            'asks': [],
-            'bids': [],
-        }
-        for ask in self._asks:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_ask = self._asks[ask]
-            except KeyError:
-                continue
-            for order in this_ask:
-                result['asks'].append([order['price'], order['size'], order['id']])
-        for bid in self._bids:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_bid = self._bids[bid]
-            except KeyError:
-                continue
-
-            for order in this_bid:
-                result['bids'].append([order['price'], order['size'], order['id']])
-        return result
-
-    def get_ask(self):
-        return self._asks.min_key()
-
-    def get_asks(self, price):
-        return self._asks.get(price)
-
-    def remove_asks(self, price):
-        self._asks.remove(price)
-
-    def set_asks(self, price, asks):
-        self._asks.insert(price, asks)
-
-    def get_bid(self):
-        return self._bids.max_key()
-
-    def get_bids(self, price):
-        return self._bids.get(price)
-
-    def remove_bids(self, price):
-        self._bids.remove(price)
-
-    def set_bids(self, price, bids):
-        self._bids.insert(price, bids)
+        # Orders that never rested on the book (e.g. market orders) are not indexed
+        existing = self._orders.get(order['order_id'])
+        if existing is not None:
+            existing.level.size += new_size - existing.size
+            if self._dirty is not None:
+                self._dirty[existing.side].add(existing.price)
+            if self._level_changes is not None:
+                self._level_changes[existing.side].add(existing.price)
+            existing.size = new_size
+
+    def _discard(self, order):
+        ''' Drops an order from its price level, removing the level once it is empty. '''
+        level = order.level
+        del level.orders[order.id]
+        level.size -= order.size
+        if self._dirty is not None:
+            self._dirty[order.side].add(order.price)
+        if self._level_changes is not None:
+            self._level_changes[order.side].add(order.price)
+        if not level.orders:
+            if order.side == 'buy':
+                self.remove_bids(order.price)
+                if level is self._bid_level:
+                    self._update_best('buy')
+            else:
+                self.remove_asks(order.price)
+                if level is self._ask_level:
+                    self._update_best('sell')
+
+    def _publish_top_of_book(self):
+        bid, bid_size, ask, ask_size = self.get_bbo()
+        last_price = last_size = None
+        if self._current_ticker is not None:
+            last_price, last_size = self._current_ticker['price'], self._current_ticker['size']
+        self._published_bbo = self._bbo
+        self._top_of_book.publish(self._sequence, bid, bid_size, ask, ask_size, last_price, last_size)
+
+    def set_level_publisher(self, publisher):
+        ''' Tracks the price levels each message changes and calls `publisher.on_book_message(book)`
+        after every message, from the feed thread; see ConflatingPublisher. None stops tracking. '''
+        self._level_publisher = publisher
+        # The first changes bring a new subscriber up to date with every level
+        self._level_changes = None if publisher is None else {'buy': set(self._bids.keys()),
+                                                              'sell': set(self._asks.keys())}
+
+    def pop_level_changes(self):
+        ''' Returns [side, price, size] for every level changed since the previous call, like the
+        changes of a level2 l2update: `size` is the level's new total, 0 once it is gone. '''
+        changes = []
+        if self._level_changes is None:
+            return changes
+        from_price = self._from_price
+        from_size = self._from_size
+        for side, tree in (('buy', self._bids), ('sell', self._asks)):
+            for price in self._level_changes[side]:
+                level = tree.get(price)
+                changes.append([side, from_price(price), from_size(0 if level is None else level.size)])
+        self._level_changes = {'buy': set(), 'sell': set()}
+        return changes
 
 
 if __name__ == '__main__':
     import sys
-    import time
     import datetime as dt
 
 
     class OrderBookConsole(OrderBook):
         ''' Logs real-time changes to the bid-ask spread to the console '''
 
-        def __init__(self, product_id=None):
-            super(OrderBookConsole, self).__init__(product_id=product_id)
-
-            # latest values of bid-ask spread
-            self._bid = None
-            self._ask = None
-            self._bid_depth = None
-            self._ask_depth = None
-
-        def on_message(self, message):
-            super(OrderBookConsole, self).on_message(message)
-
-            # Calculate newest bid-ask spread
-            bid = self.get_bid()
-            bids = self.get_bids(bid)
-            bid_depth = sum([b['size'] for b in bids])
-            ask = self.get_ask()
-            asks = self.get_asks(ask)
-            ask_depth = sum([a['size'] for a in asks])
-
-            if self._bid == bid and self._ask == ask and self._bid_depth == bid_depth and self._ask_depth == ask_depth:
-                # If there are no changes to the bid-ask spread since the last update, no need to print
-                pass
-            else:
-                # If there are differences, update the cache
-                self._bid = bid
-                self._ask = ask
-                self._bid_depth = bid_depth
-                self._ask_depth = ask_depth
-                print('{} {} bid: {:.3f} @ {:.2f}\task: {:.3f} @ {:.2f}'.format(
-                    dt.datetime.now(), self.product_id, bid_depth, bid, ask_depth, ask))
+        def on_bbo_change(self, bid, bid_size, ask, ask_size):
+            # Only called when the bid-ask spread or the sizes at the touch changed
+            if bid is None or ask is None:
+                return
+            print('{} {} bid: {:.3f} @ {:.2f}\task: {:.3f} @ {:.2f}'.format(
+                dt.datetime.now(), self.product_id, bid_size, bid, ask_size, ask))
 
     order_book = OrderBookConsole()
     order_book.start()
@@ -0,0 +1,110 @@
+#
+# gdax/order_book_manager.py
+#
+# Live order books for several products over one gdax Websocket Feed connection
+
+import pickle
+import time
+
+from gdax.feed_decoder import FeedDecoder
+from gdax.order_book import OrderBook
+from gdax.websocket_client import WebsocketClient
+
+
+class OrderBookManager(WebsocketClient):
+    ''' Subscribes the full channel for many products on a single connection and routes each
+    message to that product's OrderBook by `product_id`.
+
+    The books are never started themselves: they only process the messages handed to them,
+    so each keeps its own sequence tracking and resyncs on its own gaps without affecting the
+    other products.
+    '''
+
+    def __init__(self, product_ids=('BTC-USD',), log_to=None, buffer_size=None, skip_received=False,
+                 **book_kwargs):
+        ''' `book_kwargs` (e.g. fixed_point, stream_snapshot) are passed to every OrderBook.
+        `buffer_size` buffers the shared connection, see WebsocketClient. `skip_received` decodes
+        'received' messages only partly, as for OrderBook, unless `log_to` is given. '''
+        product_ids = list(product_ids)
+        skip_types = ('received',) if skip_received and not log_to else ()
+        super(OrderBookManager, self).__init__(products=product_ids, channels=['full'], buffer_size=buffer_size,
+                                               decoder=FeedDecoder(skip_types=skip_types))
+        self._books = dict((product_id, OrderBook(product_id, **book_kwargs)) for product_id in product_ids)
+        # Messages routed per product, and the counts and time of the last get_message_rates call
+        self._message_counts = dict.fromkeys(product_ids, 0)
+        self._rate_counts = dict(self._message_counts)
+        self._rate_time = time.time()
+        self._log_to = log_to
+        if self._log_to:
+            assert hasattr(self._log_to, 'write')
+
+    @property
+    def product_ids(self):
+        return list(self._books)
+
+    def get_book(self, product_id):
+        return self._books[product_id]
+
+    def __getitem__(self, product_id):
+        return self._books[product_id]
+
+    def on_open(self):
+        for book in self._books.values():
+            book.on_open()
+        print("-- Subscribed to OrderBookManager for {}! --\n".format(', '.join(self._books)))
+
+    def on_close(self):
+        # Stops the validators that on_open started
+        for book in self._books.values():
+            book.on_close()
+        print("\n-- OrderBookManager Socket Closed! --")
+
+    def on_reconnect(self):
+        for book in self._books.values():
+            book.on_reconnect()
+
+    def on_message(self, message):
+        if self._log_to:
+            pickle.dump(message, self._log_to)
+
+        book = self._books.get(message.get('product_id'))
+        if book is None:
+            # subscriptions and other messages that belong to no book
+            return
+        self._message_counts[book.product_id] += 1
+        book.on_message(message)
+
+    def get_message_counts(self):
+        ''' Returns the number of messages routed to each product since the manager was created. '''
+        return dict(self._message_counts)
+
+    def get_message_rates(self):
+        ''' Returns each product's messages per second since the previous call (or since creation). '''
+        now = time.time()
+        counts = dict(self._message_counts)
+        elapsed = max(now - self._rate_time, 1e-9)
+        rates = dict((product_id, (count - self._rate_counts.get(product_id, 0)) / elapsed)
+                     for product_id, count in counts.items())
+        self._rate_counts = counts
+        self._rate_time = now
+        return rates
+
+
+if __name__ == '__main__':
+    import sys
+
+    manager = OrderBookManager(['BTC-USD', 'ETH-USD', 'LTC-USD'])
+    manager.start()
+    try:
+        while True:
+            time.sleep(10)
+            for product_id, rate in sorted(manager.get_message_rates().items()):
+                book = manager[product_id]
+                print('{} bid: {} ask: {} {:.1f} msgs/sec'.format(product_id, book.get_bid(), book.get_ask(), rate))
+    except KeyboardInterrupt:
+        manager.close()
+
+    if manager.error:
+        sys.exit(1)
+    else:
+        sys.exit(0)
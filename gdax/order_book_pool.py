@@ -0,0 +1,137 @@
+#
+# gdax/order_book_pool.py
+#
+# Order books for many products spread over worker processes, one connection per worker
+
+from multiprocessing import Pipe, Process
+from threading import Lock
+
+from gdax.order_book_manager import OrderBookManager
+
+
+def _run_shard(product_ids, conn, book_kwargs):
+    ''' Worker process: runs an OrderBookManager for `product_ids` and answers queries on `conn`
+    until asked to close or the parent goes away. '''
+    manager = OrderBookManager(product_ids, **book_kwargs)
+    manager.start()
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            query = request[0]
+            if query == 'close':
+                break
+            try:
+                if query == 'bbo':
+                    response = manager[request[1]].get_bbo()
+                elif query == 'depth':
+                    # Query from the snapshot, as the feed thread keeps changing the trees
+                    snapshot = manager[request[1]].get_snapshot()
+                    depth = request[2]
+                    response = {
+                        'sequence': -1 if snapshot is None else snapshot.sequence,
+                        'bids': [] if snapshot is None else snapshot.bids_top(depth),
+                        'asks': [] if snapshot is None else snapshot.asks_top(depth),
+                    }
+                elif query == 'rates':
+                    response = manager.get_message_rates()
+                else:
+                    raise ValueError('Unknown query {!r}'.format(query))
+            except Exception as e:
+                response = e
+            conn.send(response)
+    finally:
+        manager.close()
+        conn.close()
+
+
+class OrderBookPool(object):
+    ''' Spreads products over `num_workers` processes, each with its own websocket connection
+    and OrderBookManager, so book maintenance is not limited to the one core the GIL allows.
+
+    The parent keeps a pipe to every worker for BBO and depth queries. Queries are answered
+    between the worker's messages and copy only the requested levels across.
+    '''
+
+    def __init__(self, product_ids, num_workers=2, **book_kwargs):
+        ''' `book_kwargs` (e.g. fixed_point) are passed to every OrderBook. '''
+        product_ids = list(product_ids)
+        num_workers = max(1, min(num_workers, len(product_ids)))
+        self._shards = [product_ids[i::num_workers] for i in range(num_workers)]
+        self._book_kwargs = book_kwargs
+        self._workers = []
+        # product_id -> (connection, lock) of the worker that owns it
+        self._routes = {}
+
+    def start(self):
+        for product_ids in self._shards:
+            parent_conn, child_conn = Pipe()
+            worker = Process(target=_run_shard, args=(product_ids, child_conn, self._book_kwargs),
+                             name='OrderBookShard-{}'.format(len(self._workers)))
+            worker.daemon = True
+            worker.start()
+            child_conn.close()
+            route = (parent_conn, Lock())
+            self._workers.append((worker, route))
+            for product_id in product_ids:
+                self._routes[product_id] = route
+
+    def close(self, timeout=10):
+        for worker, (conn, lock) in self._workers:
+            with lock:
+                try:
+                    conn.send(('close',))
+                except (EOFError, IOError):
+                    pass
+        for worker, (conn, lock) in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+            conn.close()
+        self._workers = []
+        self._routes = {}
+
+    def _query(self, route, request):
+        conn, lock = route
+        with lock:
+            conn.send(request)
+            response = conn.recv()
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def get_bbo(self, product_id):
+        ''' Returns (bid, bid_size, ask, ask_size) of a product; None for an empty side. '''
+        return self._query(self._routes[product_id], ('bbo', product_id))
+
+    def get_depth(self, product_id, depth=10):
+        ''' Returns {'sequence', 'bids', 'asks'} with (price, size, num_orders) for the best `depth`
+        levels per side, best first. '''
+        return self._query(self._routes[product_id], ('depth', product_id, depth))
+
+    def get_message_rates(self):
+        ''' Returns each product's messages per second since the previous call. '''
+        rates = {}
+        for worker, route in self._workers:
+            rates.update(self._query(route, ('rates',)))
+        return rates
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    pool = OrderBookPool(['BTC-USD', 'ETH-USD', 'LTC-USD', 'BCH-USD'], num_workers=2)
+    pool.start()
+    try:
+        while True:
+            time.sleep(10)
+            rates = pool.get_message_rates()
+            for product_id in sorted(rates):
+                bid, bid_size, ask, ask_size = pool.get_bbo(product_id)
+                print('{} bid: {} ask: {} {:.1f} msgs/sec'.format(product_id, bid, ask, rates[product_id]))
+    except KeyboardInterrupt:
+        pool.close()
+    sys.exit(0)
@@ -0,0 +1,289 @@
+#
+# gdax/price_levels.py
+#
+# Ordered price -> level containers the order books can be built on
+
+from bisect import bisect_left, bisect_right, insort
+import random
+
+from bintrees import RBTree
+
+
+class SortedLevels(object):
+    ''' Price levels as a sorted price list next to a dict.
+
+    Lookups by price are a dict access. Adding or removing a level is a bisect plus a list
+    memmove, which for the few thousand levels of a book is cheaper than rebalancing a tree
+    in pure Python. Neighbour queries are a bisect.
+    '''
+    __slots__ = ('_keys', '_values')
+
+    def __init__(self, items=None):
+        self._values = dict(items) if items is not None else {}
+        self._keys = sorted(self._values)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def insert(self, key, value):
+        if key not in self._values:
+            insort(self._keys, key)
+        self._values[key] = value
+
+    def remove(self, key):
+        del self._values[key]
+        del self._keys[bisect_left(self._keys, key)]
+
+    def discard(self, key):
+        if key in self._values:
+            self.remove(key)
+
+    def keys(self, reverse=False):
+        return reversed(self._keys) if reverse else iter(self._keys)
+
+    def items(self, reverse=False):
+        values = self._values
+        for key in self.keys(reverse):
+            yield key, values[key]
+
+    def min_item(self):
+        if not self._keys:
+            raise ValueError('Levels are empty')
+        key = self._keys[0]
+        return key, self._values[key]
+
+    def max_item(self):
+        if not self._keys:
+            raise ValueError('Levels are empty')
+        key = self._keys[-1]
+        return key, self._values[key]
+
+    def floor_item(self, key):
+        ''' Returns the item with the greatest price <= `key`; KeyError if there is none. '''
+        i = bisect_right(self._keys, key)
+        if i == 0:
+            raise KeyError(key)
+        key = self._keys[i - 1]
+        return key, self._values[key]
+
+    def ceiling_item(self, key):
+        ''' Returns the item with the smallest price >= `key`; KeyError if there is none. '''
+        i = bisect_left(self._keys, key)
+        if i == len(self._keys):
+            raise KeyError(key)
+        key = self._keys[i]
+        return key, self._values[key]
+
+    def prev_item(self, key):
+        ''' Returns the item with the greatest price < `key`; KeyError if there is none. '''
+        i = bisect_left(self._keys, key)
+        if i == 0:
+            raise KeyError(key)
+        key = self._keys[i - 1]
+        return key, self._values[key]
+
+    def succ_item(self, key):
+        ''' Returns the item with the smallest price > `key`; KeyError if there is none. '''
+        i = bisect_right(self._keys, key)
+        if i == len(self._keys):
+            raise KeyError(key)
+        key = self._keys[i]
+        return key, self._values[key]
+
+
+class _SkipNode(object):
+    __slots__ = ('key', 'value', 'next', 'prev')
+
+    def __init__(self, key, value, height):
+        self.key = key
+        self.value = value
+        self.next = [None] * height
+        self.prev = None
+
+
+class SkipListLevels(object):
+    ''' Price levels in a skip list, with a dict from price to node for O(1) lookups and
+    neighbour steps.
+
+    Inserting or removing a level costs O(log n) pointer updates with no rebalancing, and
+    the lowest lane is doubly linked so walking down from the best bid is as cheap as
+    walking up from the best ask.
+    '''
+    __slots__ = ('_head', '_tail', '_height', '_nodes', '_random')
+
+    MAX_HEIGHT = 16
+    # Each lane skips about 1 / P nodes of the lane below
+    P = 0.25
+
+    def __init__(self, items=None):
+        self._head = _SkipNode(None, None, self.MAX_HEIGHT)
+        self._tail = None
+        self._height = 1
+        self._nodes = {}
+        self._random = random.Random(0).random
+        if items is not None:
+            # Link the sorted items lane by lane in one pass
+            items = dict(items)
+            last = [self._head] * self.MAX_HEIGHT
+            for key in sorted(items):
+                node = _SkipNode(key, items[key], self._random_height())
+                for i in range(len(node.next)):
+                    last[i].next[i] = node
+                    last[i] = node
+                self._height = max(self._height, len(node.next))
+                node.prev = self._tail
+                self._tail = node
+                self._nodes[key] = node
+
+    def _random_height(self):
+        height = 1
+        while height < self.MAX_HEIGHT and self._random() < self.P:
+            height += 1
+        return height
+
+    def _predecessors(self, key):
+        ''' Returns, for every lane, the last node with a price < `key` (the head if none). '''
+        update = [self._head] * self.MAX_HEIGHT
+        node = self._head
+        for i in range(self._height - 1, -1, -1):
+            successor = node.next[i]
+            while successor is not None and successor.key < key:
+                node = successor
+                successor = node.next[i]
+            update[i] = node
+        return update
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def get(self, key, default=None):
+        node = self._nodes.get(key)
+        return default if node is None else node.value
+
+    def insert(self, key, value):
+        node = self._nodes.get(key)
+        if node is not None:
+            node.value = value
+            return
+        update = self._predecessors(key)
+        node = _SkipNode(key, value, self._random_height())
+        for i in range(len(node.next)):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+        self._height = max(self._height, len(node.next))
+        node.prev = None if update[0] is self._head else update[0]
+        successor = node.next[0]
+        if successor is None:
+            self._tail = node
+        else:
+            successor.prev = node
+        self._nodes[key] = node
+
+    def remove(self, key):
+        node = self._nodes.pop(key)
+        update = self._predecessors(key)
+        for i in range(len(node.next)):
+            update[i].next[i] = node.next[i]
+        successor = node.next[0]
+        if successor is None:
+            self._tail = node.prev
+        else:
+            successor.prev = node.prev
+        while self._height > 1 and self._head.next[self._height - 1] is None:
+            self._height -= 1
+
+    def discard(self, key):
+        if key in self._nodes:
+            self.remove(key)
+
+    def keys(self, reverse=False):
+        for key, value in self.items(reverse):
+            yield key
+
+    def items(self, reverse=False):
+        if reverse:
+            node = self._tail
+            while node is not None:
+                yield node.key, node.value
+                node = node.prev
+        else:
+            node = self._head.next[0]
+            while node is not None:
+                yield node.key, node.value
+                node = node.next[0]
+
+    def min_item(self):
+        node = self._head.next[0]
+        if node is None:
+            raise ValueError('Levels are empty')
+        return node.key, node.value
+
+    def max_item(self):
+        node = self._tail
+        if node is None:
+            raise ValueError('Levels are empty')
+        return node.key, node.value
+
+    def floor_item(self, key):
+        ''' Returns the item with the greatest price <= `key`; KeyError if there is none. '''
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._predecessors(key)[0]
+            if node is self._head:
+                raise KeyError(key)
+        return node.key, node.value
+
+    def ceiling_item(self, key):
+        ''' Returns the item with the smallest price >= `key`; KeyError if there is none. '''
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._predecessors(key)[0].next[0]
+            if node is None:
+                raise KeyError(key)
+        return node.key, node.value
+
+    def prev_item(self, key):
+        ''' Returns the item with the greatest price < `key`; KeyError if there is none. '''
+        node = self._nodes.get(key)
+        node = self._predecessors(key)[0] if node is None else node.prev
+        if node is None or node is self._head:
+            raise KeyError(key)
+        return node.key, node.value
+
+    def succ_item(self, key):
+        ''' Returns the item with the smallest price > `key`; KeyError if there is none. '''
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._predecessors(key)[0]
+        node = node.next[0]
+        if node is None:
+            raise KeyError(key)
+        return node.key, node.value
+
+
+# Backends selectable with the `levels` argument of the order books. Each supports get/insert/
+# remove/discard, len, keys/items(reverse), min/max_item and floor/ceiling/prev/succ_item, and
+# can be built from a dict of price -> level.
+LEVEL_BACKENDS = {
+    'rbtree': RBTree,
+    'sorted_list': SortedLevels,
+    'skip_list': SkipListLevels,
+}
+
+
+def level_backend(name):
+    ''' Returns the level container class registered as `name`. '''
+    try:
+        return LEVEL_BACKENDS[name]
+    except KeyError:
+        raise ValueError('Unknown level backend {!r}, expected one of {}'.format(
+            name, ', '.join(sorted(LEVEL_BACKENDS))))
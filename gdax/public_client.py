@@ -4,9 +4,117 @@
 #
 # For public requests to the GDAX exchange
 
+import codecs
+import json
+import re
+
 import requests
 
 
+# A level-3 book row, e.g. ["6500.15", "0.25", "a1b2..."], with its leading comma if any
+_BOOK_ROW = re.compile(r'\s*,?\s*\[\s*"([^"]*)"\s*,\s*"([^"]*)"\s*,\s*"([^"]*)"\s*\]')
+_WHITESPACE = re.compile(r'\s*')
+_decoder = json.JSONDecoder()
+
+
+class BookStream(object):
+    """Incremental parser for an order book response arriving in chunks.
+
+    Iterating yields `(key, value)` pairs in the order the keys appear in the
+    response. The 'bids' and 'asks' values are iterators over
+    `[price, size, order_id]` rows that are parsed as they are consumed, so
+    neither the response body nor the decoded lists are ever held in full.
+    Like `itertools.groupby`, a rows iterator is only valid until the next
+    pair is taken.
+
+    Args:
+        chunks (iterable): Byte strings of the response body, e.g.
+            `response.iter_content(chunk_size)`.
+
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+        self._buf = ''
+        self._pos = 0
+
+    def __iter__(self):
+        self._expect('{')
+        if self._next_char() == '}':
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key in ('bids', 'asks'):
+                rows = self._rows()
+                yield key, rows
+                # Skip whatever the caller left unread
+                for _ in rows:
+                    pass
+            else:
+                yield key, self._value()
+            if self._expect(',}') == '}':
+                return
+
+    def _fill(self):
+        for chunk in self._chunks:
+            if chunk:
+                self._buf = self._buf[self._pos:] + self._decode(chunk)
+                self._pos = 0
+                return
+        raise ValueError('Order book response ended early')
+
+    def _next_char(self):
+        """Skip whitespace and return the next character without consuming it"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            self._fill()
+
+    def _expect(self, chars):
+        char = self._next_char()
+        if char not in chars:
+            raise ValueError('Unexpected {!r} in order book response'.format(char))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._next_char()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                end = len(self._buf)
+            # A value running up to the end of the buffer may continue in the next chunk
+            if end < len(self._buf):
+                self._pos = end
+                return value
+            self._fill()
+
+    def _rows(self):
+        self._expect('[')
+        match = _BOOK_ROW.match
+        buf, pos = self._buf, self._pos
+        while True:
+            row = match(buf, pos)
+            while row is not None:
+                yield row.groups()
+                pos = row.end()
+                row = match(buf, pos)
+            self._pos = pos
+            char = self._next_char()
+            if char == ']':
+                self._pos += 1
+                return
+            # A row split across chunks, or in an unexpected format
+            if char == ',':
+                self._pos += 1
+            yield self._value()
+            buf, pos = self._buf, self._pos
+
+
 class PublicClient(object):
     """GDAX public client API.
 
@@ -118,6 +226,36 @@ class PublicClient(object):
         """
         return self._get('/products/{}/ticker'.format(str(product_id)))
 
+    def get_product_order_book_stream(self, product_id, chunk_size=1 << 16):
+        """Stream the full (level 3) order book for a product.
+
+        Unlike `get_product_order_book(product_id, level=3)`, the response
+        is parsed while it downloads, so a book can be built from it without
+        first holding the whole response and its decoded lists in memory.
+
+        Args:
+            product_id (str): Product
+            chunk_size (Optional[int]): Bytes read from the response at a
+                time. Default is 64KB.
+
+        Yields:
+            tuple: `(key, value)` pairs of the order book, in response order.
+            'bids' and 'asks' come with an iterator over
+            `[price, size, order_id]` rows, valid until the next pair is
+            taken. Example::
+                ('sequence', 3)
+                ('bids', <rows>)
+                ('asks', <rows>)
+
+        """
+        r = requests.get(self.url + '/products/{}/book'.format(str(product_id)),
+                         params={'level': 3}, timeout=30, stream=True)
+        try:
+            for item in BookStream(r.iter_content(chunk_size)):
+                yield item
+        finally:
+            r.close()
+
     def get_product_trades(self, product_id):
         """List the latest trades for a product.
 
@@ -12,7 +12,9 @@ import json
 import time
 from threading import Thread
 from websocket import create_connection, WebSocketConnectionClosedException
+from connection_health import ConnectionHealth, backoff_delay
 from gdax_auth import get_auth_headers
+from feed_decoder import FeedDecoder
 import queue
 import logging
 
@@ -27,7 +29,7 @@ class Scheduler(object):
                  should_print=True,
                  auth=False, api_key="", api_secret="", api_passphrase="",
                  out_filename=None,
-                 order_book=None, trader=None):
+                 order_book=None, trader=None, ping_interval=30, stall_timeout=60, skip_received=False):
         if products is None or len(products) != 1:
             logger.error("it only supports one product_id")
             sys.eixt()
@@ -49,7 +51,8 @@ class Scheduler(object):
         self.api_passphrase = api_passphrase
         self.user_msg_queue = queue.Queue()
 
-        self.last_hb_time = 0
+        # Pings on its own timer, measures the feed and logs stalls; see get_health_stats
+        self.health = ConnectionHealth(ping_interval, stall_timeout, self._on_stall)
 
         if out_filename is not None:
             self.out_file = open(out_filename, 'w')
@@ -58,6 +61,9 @@ class Scheduler(object):
 
         self.order_book = order_book
         self.trader = trader
+        # With skip_received, 'received' messages reach the book and trader with only their type,
+        # sequence, product_id and time; the recorder always keeps whole messages
+        self.decoder = FeedDecoder(skip_types=('received',) if skip_received and trader else ())
 
     def _connect(self):
         logger.critical("Connecting...")
@@ -79,7 +85,7 @@ class Scheduler(object):
             message = timestamp + 'GET' + '/users/self'
             sub_params.update(get_auth_headers(timestamp, message, self.api_key,  self.api_secret, self.api_passphrase))
 
-        self.ws = create_connection(self.url)
+        self.ws = create_connection(self.url, enable_multithread=True)
         self.ws.send(json.dumps(sub_params))
 
         if self.type == "heartbeat":
@@ -87,17 +93,19 @@ class Scheduler(object):
         else:
             sub_params = {"type": "heartbeat", "on": False}
         self.ws.send(json.dumps(sub_params))
+        self.health.start(self.ws)
 
-    def _init_hb(self):
-        self.last_hb_time = 0
+    def _on_stall(self, silence):
+        logger.error("No market data for %.1f secs: health=%s" % (silence, self.health.get_stats()))
+        # The connection may be dead without knowing it: fail the read so that it reconnects
+        try:
+            self.ws.shutdown()
+        except Exception:
+            pass
 
-    def _check_hb(self, now):
-        int_now_sec = int(now.timestamp())
-        if (self.last_hb_time != int_now_sec) and (int_now_sec % 30 == 0 or int_now_sec - self.last_hb_time >= 30):
-            # Set a 30 second ping to keep connection alive
-            self.ws.ping("keepalive")
-            logger.debug("Send keepalive HB: last_hb_time=%s epoch_now_sec=%s" % (self.last_hb_time, int_now_sec))
-            self.last_hb_time = int_now_sec
+    def get_health_stats(self):
+        """Ping round trips, feed latency and stalls of the connection, see ConnectionHealth.get_stats"""
+        return self.health.get_stats()
 
     def _check_user_msg(self):
         if self.user_msg_queue.empty():
@@ -116,18 +124,17 @@ class Scheduler(object):
         snapshot = PublicClient().get_product_order_book(product_id=self.products[0], level=3)
         self._record_msg(ss_now, "snapshot", snapshot)
 
-        self._init_hb()
         # Avoid string comparison
         self.running_code = None
         while self.running_code is None:
             try:
                 now = datetime.datetime.now()
-                self._check_hb(now)
 
                 for i in range(10):
                     # TODO: this is a sync call, make it async
-                    data = self.ws.recv()
-                    mkt_msg = json.loads(data)
+                    data = self.health.recv(self.ws)
+                    mkt_msg = self.decoder(data)
+                    self.health.on_message(mkt_msg)
                     self._record_msg(now, "update", mkt_msg)
 
                 self._check_user_msg()
@@ -140,20 +147,25 @@ class Scheduler(object):
 
     def _listen_trader(self):
         from public_client import PublicClient
-        snapshot = PublicClient().get_product_order_book(product_id=self.products[0], level=3)
-        self.order_book.reset_book(snapshot)
+        # Load the book while the snapshot downloads rather than decoding it all first
+        try:
+            snapshot = PublicClient().get_product_order_book_stream(product_id=self.products[0])
+            self.order_book.reset_book(snapshot)
+        except Exception as e:
+            # e.g. a rate-limited snapshot request: reconnect and fetch another after the backoff
+            self._on_error(e)
+            return
 
-        self._init_hb()
         # Avoid string comparison
         self.running_code = None
         while self.running_code is None:
             try:
                 now = datetime.datetime.now()
-                self._check_hb(now)
 
                 for i in range(10):
-                    data = self.ws.recv()
-                    mkt_msg = json.loads(data)
+                    data = self.health.recv(self.ws)
+                    mkt_msg = self.decoder(data)
+                    self.health.on_message(mkt_msg)
                     self.order_book.on_message(mkt_msg)
                     if mkt_msg['type'] == 'match':
                         self.trader.on_mkt_trade(now, mkt_msg)
@@ -169,6 +181,7 @@ class Scheduler(object):
 
     def _disconnect(self):
         logger.critical("Disconnecting...")
+        self.health.stop()
         if self.type == "heartbeat":
             self.ws.send(json.dumps({"type": "heartbeat", "on": False}))
         try:
@@ -196,19 +209,31 @@ class Scheduler(object):
 
     def start(self):
         def _go():
-            connected = False
+            attempt = None
             while self.running_code != "stop":
-                if connected:
-                    wait_time_sec = 3
-                    logger.info("Reconnecting in %s secs: running_code=%s" % (wait_time_sec, self.running_code))
+                if attempt is not None:
+                    # Jittered exponential backoff, from 0.1 sec up to 30 secs
+                    wait_time_sec = backoff_delay(attempt)
+                    attempt += 1
+                    logger.info("Reconnecting in %.2f secs: running_code=%s" % (wait_time_sec, self.running_code))
                     time.sleep(wait_time_sec)
-                self._connect()
+                else:
+                    attempt = 0
+                connected = time.time()
+                try:
+                    self._connect()
+                except Exception as e:
+                    self._on_error(e)
+                    self._check_user_msg()
+                    continue
                 if self.trader:
                     self._listen_trader()
                 else:
                     self._listen_recorder()
                 self._disconnect()
-                connected = True
+                if time.time() - connected >= 30:
+                    # It was up for a while: start over from the shortest wait
+                    attempt = 0
 
         self.running_code = None
         self.thread = Thread(target=_go)
@@ -2,6 +2,7 @@
 # original author: Jian
 #
 
+import ast
 import datetime
 import time
 import logging
@@ -35,7 +36,7 @@ class SimScheduler(object):
 
     def _read_from_file(self):
         for l in self._in_file:
-            event = eval(l)
+            event = ast.literal_eval(l)
             recv_time = event['recv_time']
             msg_type = event['msg_type']
             recv_msg = event['recv_msg']
@@ -0,0 +1,89 @@
+#
+# gdax/top_of_book.py
+#
+# Best bid/ask, last trade and sequence of a book in a small memory-mapped file that
+# any number of processes can read without talking to the feed process
+
+from collections import namedtuple
+import mmap
+import os
+import struct
+import time
+
+
+TopOfBook = namedtuple('TopOfBook', ['sequence', 'bid', 'bid_size', 'ask', 'ask_size',
+                                     'last_price', 'last_size', 'time'])
+
+# version counter, then sequence and the float fields of TopOfBook; None is stored as NaN
+_VERSION = struct.Struct('<Q')
+_PAYLOAD = struct.Struct('<q7d')
+_SIZE = _VERSION.size + _PAYLOAD.size
+
+
+class TopOfBookWriter(object):
+    ''' Publishes TopOfBook records into a fixed-layout memory-mapped file.
+
+    Writes follow a seqlock: the version counter is odd while the record is being written and
+    bumped to the next even value once it is complete, so readers never see a torn record.
+    There must be only one writer per file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, _SIZE)
+            self._map = mmap.mmap(fd, _SIZE)
+        finally:
+            os.close(fd)
+        self._version = _VERSION.unpack_from(self._map, 0)[0]
+        if self._version % 2:
+            # a previous writer died mid-write
+            self._version += 1
+
+    def publish(self, sequence, bid, bid_size, ask, ask_size, last_price=None, last_size=None):
+        nan = float('nan')
+        payload = [float(value) if value is not None else nan
+                   for value in (bid, bid_size, ask, ask_size, last_price, last_size)]
+        payload.append(time.time())
+        self._version += 1
+        _VERSION.pack_into(self._map, 0, self._version)
+        _PAYLOAD.pack_into(self._map, _VERSION.size, sequence, *payload)
+        self._version += 1
+        _VERSION.pack_into(self._map, 0, self._version)
+
+    def close(self):
+        self._map.close()
+
+
+class TopOfBookReader(object):
+    ''' Maps a file written by TopOfBookWriter, read-only. '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), _SIZE, access=mmap.ACCESS_READ)
+
+    def version(self):
+        ''' Returns the version counter, which changes with every published record. '''
+        return _VERSION.unpack_from(self._map, 0)[0]
+
+    def read(self):
+        ''' Returns the latest TopOfBook, or None if nothing was published yet. '''
+        spins = 0
+        while True:
+            before = _VERSION.unpack_from(self._map, 0)[0]
+            if before % 2 == 0:
+                record = _PAYLOAD.unpack_from(self._map, _VERSION.size)
+                if _VERSION.unpack_from(self._map, 0)[0] == before:
+                    break
+            spins += 1
+            if spins % 100 == 0:
+                # the writer was descheduled mid-write; let it run
+                time.sleep(0)
+        if before == 0:
+            return None
+        return TopOfBook(record[0], *[None if value != value else value for value in record[1:]])
+
+    def close(self):
+        self._map.close()
@@ -11,15 +11,37 @@ import base64
 import hmac
 import hashlib
 import time
-from threading import Thread
-from websocket import create_connection, WebSocketConnectionClosedException
+from collections import deque
+from threading import Event, Thread, current_thread
+from websocket import create_connection
 from pymongo import MongoClient
+from gdax.connection_health import ConnectionHealth, backoff_delay
 from gdax.gdax_auth import get_auth_headers
+from gdax.feed_decoder import FeedDecoder
 
 
 class WebsocketClient(object):
     def __init__(self, url="wss://ws-feed.gdax.com", products=None, message_type="subscribe", mongo_collection=None,
-                 should_print=True, auth=False, api_key="", api_secret="", api_passphrase="", channels=None):
+                 should_print=True, auth=False, api_key="", api_secret="", api_passphrase="", channels=None,
+                 buffer_size=None, decoder=None, ping_interval=30, stall_timeout=None, reconnect=True,
+                 reconnect_delay=0.1, reconnect_max_delay=30):
+        ''' `decoder` turns frames into messages, by default a FeedDecoder with the fastest JSON
+        parser installed.
+
+        With `reconnect`, a connection that fails (or stalls, given `stall_timeout`) is replaced by
+        a new one subscribed to the same products and channels. Attempts are spaced by a random
+        delay of up to `reconnect_delay` seconds, doubling after each failed attempt up to
+        `reconnect_max_delay`, and on_reconnect is called once a new connection is subscribed.
+        Only close(), or setting `stop` from a hook, ends the client.
+
+        A ConnectionHealth pings every `ping_interval` seconds on its own thread, keeps histograms
+        of ping round trips and exchange-to-receive latency, and calls on_stall when no frame
+        arrived for `stall_timeout` seconds; see get_health_stats.
+
+        With `buffer_size`, a receive thread only reads frames into a ring buffer of that many
+        frames, and a processing thread decodes them and calls on_message, so a slow on_message
+        never backs up the socket. When the buffer is full the oldest frame is dropped; an
+        OrderBook sees the sequence gap and resyncs. See get_buffer_stats for its metrics. '''
         self.url = url
         self.products = products
         self.channels = channels
@@ -34,18 +56,79 @@ class WebsocketClient(object):
         self.api_passphrase = api_passphrase
         self.should_print = should_print
         self.mongo_collection = mongo_collection
+        # Thread that calls on_message: the processing thread when buffered, else the receive thread
+        self.message_thread = None
+        self.decoder = decoder or FeedDecoder()
+        self.health = ConnectionHealth(ping_interval, stall_timeout, self._on_stall)
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnects = 0
+        # Set by close(), which also cuts short the wait before a reconnect
+        self._closing = Event()
+        self.buffer_size = buffer_size
+        # (receive time, frame) pairs between the two threads, and the event the processing thread
+        # waits on while the buffer is empty
+        self._buffer = None
+        self._buffer_ready = Event()
+        self._processor = None
+        self._buffer_stats = None
 
     def start(self):
         def _go():
-            self._connect()
-            self._listen()
-            self._disconnect()
+            attempt = 0
+            while True:
+                self.error = None
+                connected = time.time()
+                try:
+                    self._connect()
+                except Exception as e:
+                    self.on_error(e)
+                else:
+                    if attempt and not self._closing.is_set():
+                        self.reconnects += 1
+                        self.on_reconnect()
+                    self._run_connection()
+                self._disconnect()
+                if self._closing.is_set() or not self.reconnect or self.error is None:
+                    # closed, or stopped from a hook rather than by an error
+                    break
+                if time.time() - connected >= self.reconnect_max_delay:
+                    # the connection was up for a while: start over from the shortest delay
+                    attempt = 0
+                delay = backoff_delay(attempt, self.reconnect_delay, self.reconnect_max_delay)
+                attempt += 1
+                if self.should_print:
+                    print('-- Reconnecting in {:.2f} seconds --'.format(delay))
+                if self._closing.wait(delay):
+                    break
+                self.stop = False
+            self.on_close()
 
         self.stop = False
+        self._closing.clear()
         self.on_open()
+        if self.buffer_size:
+            self._buffer = deque(maxlen=self.buffer_size)
+            self._buffer_stats = {'received': 0, 'processed': 0, 'overflows': 0, 'max_depth': 0,
+                                  'lag': 0.0, 'max_lag': 0.0}
         self.thread = Thread(target=_go)
         self.thread.start()
 
+    def _run_connection(self):
+        if self._buffer is None:
+            self.message_thread = current_thread()
+            self._listen()
+        else:
+            # frames left over from the previous connection are processed first
+            self._buffer_ready.clear()
+            self._processor = Thread(target=self._process, name='WebsocketProcessor')
+            self.message_thread = self._processor
+            self._processor.start()
+            self._receive()
+            self._buffer_ready.set()
+            self._processor.join()
+
     def _connect(self):
         if self.products is None:
             self.products = ["BTC-USD"]
@@ -65,7 +148,7 @@ class WebsocketClient(object):
             message = timestamp + 'GET' + '/users/self'
             sub_params.update(get_auth_headers(timestamp, message, self.api_key,  self.api_secret, self.api_passphrase))
 
-        self.ws = create_connection(self.url)
+        self.ws = create_connection(self.url, enable_multithread=True)
         self.ws.send(json.dumps(sub_params))
 
         if self.type == "heartbeat":
@@ -73,35 +156,119 @@ class WebsocketClient(object):
         else:
             sub_params = {"type": "heartbeat", "on": False}
         self.ws.send(json.dumps(sub_params))
+        self.health.start(self.ws)
 
     def _listen(self):
+        health = self.health
         while not self.stop:
             try:
-                if int(time.time() % 30) == 0:
-                    # Set a 30 second ping to keep connection alive
-                    self.ws.ping("keepalive")
-                data = self.ws.recv()
-                msg = json.loads(data)
+                data = health.recv(self.ws)
+                msg = self.decoder(data)
             except ValueError as e:
                 self.on_error(e)
             except Exception as e:
+                if self.stop:
+                    # shut down by close()
+                    break
                 self.on_error(e)
             else:
+                try:
+                    health.on_message(msg)
+                    self.on_message(msg)
+                except Exception as e:
+                    # a failing handler ends the connection through on_error rather than the thread
+                    self.on_error(e, data)
+
+    def _receive(self):
+        ''' Receive stage of the buffered mode: reads frames into the ring buffer, nothing else. '''
+        buffer = self._buffer
+        ready = self._buffer_ready
+        stats = self._buffer_stats
+        health = self.health
+        while not self.stop:
+            try:
+                data = health.recv(self.ws)
+            except Exception as e:
+                if self.stop:
+                    # shut down by close()
+                    break
+                self.on_error(e)
+            else:
+                if len(buffer) == buffer.maxlen:
+                    # appending drops the oldest frame
+                    stats['overflows'] += 1
+                buffer.append((health.last_receive, data))
+                stats['received'] += 1
+                if len(buffer) > stats['max_depth']:
+                    stats['max_depth'] = len(buffer)
+                if not ready.is_set():
+                    ready.set()
+
+    def _process(self):
+        ''' Processing stage of the buffered mode: decodes buffered frames and calls on_message. '''
+        buffer = self._buffer
+        ready = self._buffer_ready
+        stats = self._buffer_stats
+        health = self.health
+        while not self.stop:
+            try:
+                received, data = buffer.popleft()
+            except IndexError:
+                ready.clear()
+                # the receive thread may have appended before the clear
+                if not buffer:
+                    ready.wait(1.0)
+                continue
+            lag = time.time() - received
+            stats['lag'] = lag
+            if lag > stats['max_lag']:
+                stats['max_lag'] = lag
+            try:
+                msg = self.decoder(data)
+                health.on_message(msg, received)
                 self.on_message(msg)
+            except Exception as e:
+                # a bad frame or a failing handler ends the connection through on_error rather
+                # than the thread, which would leave the receive thread filling the buffer
+                self.on_error(e, data)
+            stats['processed'] += 1
+
+    def get_buffer_stats(self):
+        ''' Returns the ring buffer's metrics, or None when not buffered: its capacity and current
+        depth, the frames received, processed and dropped on overflow so far, the receive-to-processing
+        lag (seconds) of the last frame processed, and the largest depth and lag since the previous call. '''
+        stats = self._buffer_stats
+        if stats is None:
+            return None
+        result = dict(stats, capacity=self._buffer.maxlen, depth=len(self._buffer))
+        stats['max_depth'] = result['depth']
+        stats['max_lag'] = 0.0
+        return result
+
+    def get_health_stats(self):
+        ''' Returns the connection's health metrics, see ConnectionHealth.get_stats. '''
+        return self.health.get_stats()
 
     def _disconnect(self):
-        if self.type == "heartbeat":
-            self.ws.send(json.dumps({"type": "heartbeat", "on": False}))
+        self.health.stop()
         try:
             if self.ws:
+                if self.type == "heartbeat":
+                    self.ws.send(json.dumps({"type": "heartbeat", "on": False}))
                 self.ws.close()
-        except WebSocketConnectionClosedException as e:
+        except Exception as e:
+            # a connection that failed can fail again on the way out
             pass
 
-        self.on_close()
-
     def close(self):
+        self._closing.set()
         self.stop = True
+        if self.ws:
+            # The receive thread has nothing else to wake it from a quiet socket
+            try:
+                self.ws.shutdown()
+            except Exception:
+                pass
         self.thread.join()
 
     def on_open(self):
@@ -123,6 +290,25 @@ class WebsocketClient(object):
         self.stop = True
         print('{} - data: {}'.format(e, data))
 
+    def on_stall(self, silence):
+        ''' Called from the health monitor's thread when nothing was received for `silence` seconds. '''
+        print('-- No messages for {:.1f} seconds --'.format(silence))
+
+    def on_reconnect(self):
+        ''' Called on the client thread once a replacement connection is subscribed, before its
+        first message. Messages sent while disconnected are lost; see OrderBook.on_reconnect. '''
+        if self.should_print:
+            print("-- Reconnected! --\n")
+
+    def _on_stall(self, silence):
+        self.on_stall(silence)
+        if self.reconnect and self.ws:
+            # a silent connection may be dead without knowing it: fail the read to replace it
+            try:
+                self.ws.shutdown()
+            except Exception:
+                pass
+
 
 if __name__ == "__main__":
     import sys
@@ -14,6 +14,13 @@ tests_require = [
     'pytest',
     ]
 
+extras_require = {
+    # AsyncWebsocketClient
+    'async': ['websockets'],
+    # FeedDecoder picks up a faster JSON parser when installed
+    'fast': ['orjson'],
+}
+
 setup(
     name='gdax',
     version='1.0.6',
@@ -24,6 +31,7 @@ setup(
     packages=find_packages(),
     install_requires=install_requires,
     tests_require=tests_require,
+    extras_require=extras_require,
     description='The unofficial Python client for the GDAX API',
     download_url='https://github.com/danpaquin/gdax-Python/archive/master.zip',
     keywords=['gdax', 'gdax-api', 'orderbook', 'trade', 'bitcoin', 'ethereum', 'BTC', 'ETH', 'client', 'api', 'wrapper', 'exchange', 'crypto', 'currency', 'trading', 'trading-api', 'coinbase'],
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import pytest
+
+from gdax.async_websocket_client import AsyncWebsocketClient
+
+websockets = pytest.importorskip('websockets')
+
+
+class RecordingClient(AsyncWebsocketClient):
+
+    def on_open(self):
+        self.messages = []
+        self.ticks = 0
+        self.call_every(0.01, self.tick)
+
+    def tick(self):
+        self.ticks += 1
+
+    def on_message(self, msg):
+        self.messages.append(msg)
+        if msg['type'] == 'done':
+            self.close()
+
+
+async def serve(messages, received):
+    async def handler(ws):
+        received.append(json.loads(await ws.recv()))
+        received.append(json.loads(await ws.recv()))
+        for msg in messages:
+            await ws.send(json.dumps(msg))
+        # Let the client's timer run while no market data arrives
+        await asyncio.sleep(0.1)
+        await ws.send(json.dumps({'type': 'done'}))
+        await ws.wait_closed()
+
+    return await websockets.serve(handler, '127.0.0.1', 0)
+
+
+class TestAsyncWebsocketClient(object):
+
+    def test_subscribe_dispatch_and_timers(self):
+        messages = [{'type': 'open', 'sequence': i} for i in range(5)]
+        received = []
+
+        async def session():
+            server = await serve(messages, received)
+            port = list(server.sockets)[0].getsockname()[1]
+            client = RecordingClient(url='ws://127.0.0.1:{}/'.format(port), products='BTC-USD',
+                                     channels=['full'], should_print=False)
+            await asyncio.wait_for(client.run(), 5)
+            server.close()
+            return client
+
+        client = asyncio.new_event_loop().run_until_complete(session())
+
+        assert received == [{'type': 'subscribe', 'product_ids': ['BTC-USD'], 'channels': ['full']},
+                            {'type': 'heartbeat', 'on': False}]
+        assert client.messages == messages + [{'type': 'done'}]
+        assert client.ticks >= 3
+        assert client.error is None
@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from gdax.book_publisher import ConflatingPublisher
+from gdax.level2_order_book import Level2OrderBook
+from gdax.order_book import OrderBook
+from gdax.public_client import PublicClient
+
+
+SNAPSHOT = {
+    'sequence': 100,
+    'bids': [['99.99', '1.0', 'b1'], ['99.99', '2.0', 'b2'], ['99.98', '3.0', 'b3']],
+    'asks': [['100.01', '1.5', 'a1'], ['100.02', '2.5', 'a2']],
+}
+
+
+def message(sequence, msg_type, **kwargs):
+    kwargs.update({'sequence': sequence, 'type': msg_type})
+    return kwargs
+
+
+class TestConflatingPublisher(object):
+
+    def test_conflates_by_message_count(self, monkeypatch):
+        monkeypatch.setattr(PublicClient, 'get_product_order_book', lambda self, product_id, level: SNAPSHOT)
+        book = OrderBook()
+        book.reset_book()
+        updates = []
+        publisher = ConflatingPublisher(book, updates.append, interval=60, max_messages=3)
+
+        book.on_message(message(101, 'open', side='buy', price='100.00', order_id='b4', remaining_size='0.5'))
+        book.on_message(message(102, 'done', side='buy', price='100.00', order_id='b4', reason='canceled'))
+        assert updates == []
+        book.on_message(message(103, 'match', side='sell', price='100.01', size='0.5',
+                                maker_order_id='a1', taker_order_id='t1'))
+        # the first flush brings a subscriber up to date with every level
+        assert updates[0]['sequence'] == 103
+        assert sorted(updates[0]['changes']) == [
+            ['buy', Decimal('99.98'), Decimal('3.0')],
+            ['buy', Decimal('99.99'), Decimal('3.0')],
+            ['buy', Decimal('100.00'), Decimal('0')],
+            ['sell', Decimal('100.01'), Decimal('1.0')],
+            ['sell', Decimal('100.02'), Decimal('2.5')],
+        ]
+
+        level2 = Level2OrderBook()
+        level2.on_message(dict(updates[0], type='snapshot', bids=[], asks=[]))
+        level2.on_message(updates[0])
+        for i, new_size in enumerate(['2.0', '1.0', '0.5']):
+            book.on_message(message(104 + i, 'change', side='sell', price='100.02', order_id='a2',
+                                    new_size=new_size))
+        assert updates[1]['changes'] == [['sell', Decimal('100.02'), Decimal('0.5')]]
+        level2.on_message(updates[1])
+        assert level2.get_asks_top(5) == [(Decimal('100.01'), Decimal('1.0')), (Decimal('100.02'), Decimal('0.5'))]
+
+        publisher.close()
+        book.on_message(message(107, 'done', side='buy', price='99.98', order_id='b3', reason='canceled'))
+        assert len(updates) == 2
@@ -0,0 +1,96 @@
+import calendar
+import threading
+import time
+
+import pytest
+from websocket import ABNF, WebSocketConnectionClosedException
+
+from gdax.connection_health import ConnectionHealth, LatencyHistogram, backoff_delay
+
+
+class FakeSocket(object):
+
+    def __init__(self, frames=()):
+        self.frames = list(frames)
+        self.pings = []
+
+    def recv_data(self, control_frame=False):
+        return self.frames.pop(0)
+
+    def ping(self, payload):
+        self.pings.append(payload)
+
+
+def test_backoff_delay():
+    for attempt in range(12):
+        delay = backoff_delay(attempt, initial=0.1, maximum=30)
+        assert 0 <= delay <= min(30, 0.1 * 2 ** attempt)
+    assert backoff_delay(1000, maximum=30) <= 30
+
+
+class TestLatencyHistogram(object):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        assert histogram.percentile(50) is None
+        for i in range(90):
+            histogram.record(0.001)
+        for i in range(10):
+            histogram.record(0.1)
+        summary = histogram.summary()
+        assert summary['count'] == 100
+        assert summary['min'] == 0.001 and summary['max'] == 0.1
+        assert 0.001 <= summary['p50'] < 0.0013
+        assert summary['p99'] == 0.1
+        assert summary['mean'] == pytest.approx(0.0109)
+
+    def test_clock_skew_goes_to_the_lowest_bucket(self):
+        histogram = LatencyHistogram()
+        histogram.record(-0.002)
+        assert histogram.counts[0] == 1
+        assert histogram.min == -0.002
+
+
+class TestConnectionHealth(object):
+
+    def test_recv_records_pongs_and_latency(self):
+        health = ConnectionHealth(ping_interval=None)
+        sent = time.time() - 0.05
+        ws = FakeSocket([(ABNF.OPCODE_PONG, '{:.6f}'.format(sent).encode()),
+                         (ABNF.OPCODE_PONG, b'keepalive'),
+                         (ABNF.OPCODE_TEXT, b'{"type":"heartbeat"}'),
+                         (ABNF.OPCODE_CLOSE, b'')])
+        assert health.recv(ws) == '{"type":"heartbeat"}'
+        assert health.rtt.count == 1
+        assert 0.05 <= health.last_rtt < 1
+        with pytest.raises(WebSocketConnectionClosedException):
+            health.recv(ws)
+
+        exchange_time = calendar.timegm((2017, 11, 21, 12, 34, 56, 0, 0, 0)) + 0.25
+        health.on_message({'type': 'open', 'time': '2017-11-21T12:34:56.25Z'}, exchange_time + 0.01)
+        health.on_message({'type': 'heartbeat'}, exchange_time)
+        assert health.latency.count == 1
+        assert health.latency.max == pytest.approx(0.01)
+        assert health.parse_time('2017-11-21T12:34:57Z') == exchange_time + 0.75
+
+    def test_pings_and_stalls(self):
+        stalls = []
+        stalled = threading.Event()
+
+        def on_stall(silence):
+            stalls.append(silence)
+            stalled.set()
+
+        health = ConnectionHealth(ping_interval=0.02, stall_timeout=0.1, on_stall=on_stall)
+        ws = FakeSocket()
+        health.start(ws)
+        try:
+            assert stalled.wait(5)
+            time.sleep(0.1)
+            # one call per stall, however long it lasts
+            assert len(stalls) == 1 and stalls[0] >= 0.1
+            assert health.get_stats()['stalls'] == 1
+            assert len(ws.pings) >= 2
+            float(ws.pings[0])
+        finally:
+            health.stop()
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from gdax.feed_decoder import FeedDecoder, PARSERS, json_parser
+
+
+RECEIVED = ('{"type":"received","order_id":"d50ec984-77a8-460a-b958-66f114b0de9b","order_type":"limit",'
+            '"size":"1.34","price":"502.1","side":"buy","product_id":"BTC-USD","sequence":10,'
+            '"time":"2014-11-07T08:19:27.028459Z"}')
+OPEN = ('{"type":"open","time":"2014-11-07T08:19:27.028459Z","product_id":"BTC-USD","sequence":11,'
+        '"order_id":"d50ec984-77a8-460a-b958-66f114b0de9b","price":"200.2","remaining_size":"1.00","side":"sell"}')
+
+
+class TestFeedDecoder(object):
+
+    @pytest.mark.parametrize('parser', [name for name, loads in PARSERS])
+    def test_parsers_decode_alike(self, parser):
+        decoder = FeedDecoder(parser)
+        assert decoder.parser == parser
+        assert decoder(OPEN) == json.loads(OPEN)
+        with pytest.raises(ValueError):
+            decoder('{"type":')
+
+    def test_unknown_parser(self):
+        with pytest.raises(ValueError):
+            json_parser('simplejson')
+
+    def test_skipped_types_keep_the_header(self):
+        decoder = FeedDecoder('json', skip_types=('received',))
+        assert decoder(RECEIVED) == {'type': 'received', 'sequence': 10, 'product_id': 'BTC-USD',
+                                     'time': '2014-11-07T08:19:27.028459Z'}
+        assert decoder(OPEN) == json.loads(OPEN)
+        # not the feed's compact layout: decoded in full
+        spaced = json.dumps(json.loads(RECEIVED))
+        assert decoder(spaced) == json.loads(RECEIVED)
+
+    def test_sequence_last(self):
+        decoder = FeedDecoder('json', skip_types=('received',))
+        assert decoder('{"type":"received","side":"buy","sequence":12}') == {'type': 'received', 'sequence': 12}
@@ -0,0 +1,57 @@
+import pytest
+from decimal import Decimal
+
+from gdax.level2_order_book import Level2OrderBook
+from gdax.public_client import PublicClient
+
+
+SNAPSHOT = {
+    'type': 'snapshot',
+    'product_id': 'BTC-USD',
+    'bids': [['99.99', '3.0'], ['99.98', '3.0']],
+    'asks': [['100.01', '1.5'], ['100.02', '2.5']],
+}
+
+
+PRODUCTS = [
+    {'id': 'BTC-USD', 'quote_increment': '0.01', 'base_increment': '0.00000001'},
+]
+
+
+@pytest.fixture(params=[False, True], ids=['decimal', 'fixed_point'])
+def book(request, monkeypatch):
+    monkeypatch.setattr(PublicClient, 'get_products', lambda self: PRODUCTS)
+    order_book = Level2OrderBook(fixed_point=request.param)
+    order_book.on_message(SNAPSHOT)
+    return order_book
+
+
+def l2update(*changes):
+    return {'type': 'l2update', 'product_id': 'BTC-USD', 'changes': [list(change) for change in changes]}
+
+
+class TestLevel2OrderBook(object):
+
+    def test_snapshot(self, book):
+        assert book.get_bbo() == (Decimal('99.99'), Decimal('3.0'), Decimal('100.01'), Decimal('1.5'))
+        assert book.get_current_book(depth=1) == {'bids': [[Decimal('99.99'), Decimal('3.0')]],
+                                                  'asks': [[Decimal('100.01'), Decimal('1.5')]]}
+
+    def test_l2update(self, book):
+        changes = []
+        book.on_bbo_change = lambda *bbo: changes.append(bbo)
+
+        book.on_message(l2update(('sell', '100.05', '1.0')))
+        assert changes == []
+
+        book.on_message(l2update(('buy', '100.00', '0.5'), ('sell', '100.01', '0')))
+        assert changes == [(Decimal('100.00'), Decimal('0.5'), Decimal('100.02'), Decimal('2.5'))]
+
+        book.on_message(l2update(('buy', '100.00', '0.00000000')))
+        assert book.get_bid() == Decimal('99.99')
+        assert book.get_asks_top(5) == [(Decimal('100.02'), Decimal('2.5')), (Decimal('100.05'), Decimal('1.0'))]
+
+    def test_aggr(self, book):
+        assert book.get_aggr_bids() == [{'price': Decimal('99.99'), 'size': Decimal('3.0')},
+                                        {'price': Decimal('99.98'), 'size': Decimal('3.0')}]
+        assert book.get_aggr_asks(Decimal('0'), Decimal('1.0')) == [{'price': Decimal('100.01'), 'size': Decimal('1.5')}]
@@ -0,0 +1,353 @@
+from decimal import Decimal
+import random
+import threading
+
+import pytest
+
+from my.my_order_book import OrderBook
+
+
+SNAPSHOT = {
+    'sequence': 100,
+    'bids': [
+        ['99.99', '1.0', 'b1'],
+        ['99.99', '2.0', 'b2'],
+        ['99.98', '3.0', 'b3'],
+        ['99.95', '1.0', 'b4'],
+        ['99.90', '4.0', 'b5'],
+    ],
+    'asks': [
+        ['100.01', '1.5', 'a1'],
+        ['100.02', '2.5', 'a2'],
+        ['100.05', '1.0', 'a3'],
+        ['100.10', '2.0', 'a4'],
+    ],
+}
+
+PRODUCT = {'id': 'BTC-USD', 'quote_increment': '0.01', 'base_increment': '0.00000001'}
+
+
+@pytest.fixture(params=[None, PRODUCT], ids=['decimal', 'fixed_point'])
+def book(request):
+    order_book = OrderBook(product=request.param)
+    order_book.reset_book(SNAPSHOT)
+    return order_book
+
+
+def message(sequence, msg_type, **kwargs):
+    kwargs.update({'sequence': sequence, 'type': msg_type})
+    return kwargs
+
+
+def levels(aggr):
+    return [(level['price'], level['size'], level['num_orders']) for level in aggr]
+
+
+def random_messages(book, rng, count, sequence):
+    ''' Yields `count` open/done/match/change messages on the orders resting in `book`. '''
+    resting = dict((order_id, side) for side in ('bids', 'asks')
+                   for price, size, order_id in book.get_current_book()[side])
+    for i in range(count):
+        sequence += 1
+        kind = rng.random()
+        if kind < 0.4 or len(resting) < 4:
+            side = rng.choice(('buy', 'sell'))
+            cents = rng.randint(9950, 9999) if side == 'buy' else rng.randint(10001, 10050)
+            order_id = 'o{}'.format(sequence)
+            resting[order_id] = side
+            yield message(sequence, 'open', side=side, price='{:.2f}'.format(cents / 100.0), order_id=order_id,
+                          remaining_size='{:.3f}'.format(rng.randint(1, 3000) / 1000.0))
+            continue
+        order_id = rng.choice(sorted(resting))
+        order = book._orders[order_id]
+        if kind < 0.6:
+            del resting[order_id]
+            yield message(sequence, 'done', price=str(book._from_price(order.price)), order_id=order_id,
+                          reason='canceled')
+        elif kind < 0.8:
+            size = book._from_size(order.size)
+            take = size if rng.random() < 0.5 else (size / 2).quantize(Decimal('0.00000001'))
+            if take == size:
+                del resting[order_id]
+            yield message(sequence, 'match', size=str(take), maker_order_id=order_id)
+        else:
+            yield message(sequence, 'change', order_id=order_id,
+                          new_size='{:.3f}'.format(rng.randint(1, 3000) / 1000.0))
+
+
+def brute_sweep(side_levels, size):
+    ''' Cost of taking `size` from (price, size, num_orders) levels, best first, or None if too thin. '''
+    remaining = Decimal(size)
+    cost = 0
+    for price, level_size, num_orders in side_levels:
+        take = min(remaining, level_size)
+        cost += take * price
+        remaining -= take
+        if not remaining:
+            return cost
+    return None
+
+
+class TestSnapshots(object):
+
+    def test_reader_gets_the_installed_book_without_messages(self, book, tmpdir):
+        def read():
+            snapshots.append(book.get_snapshot(timeout=0.01))
+
+        snapshots = []
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        assert snapshots[0].sequence == 100
+        assert len(snapshots[0].asks) == 4
+
+        path = str(tmpdir.join('book.ckpt'))
+        with open(path, 'wb') as out_file:
+            book.save_checkpoint(out_file)
+        book.reset_book({'sequence': 1, 'bids': [], 'asks': []})
+        with open(path, 'rb') as in_file:
+            book.load_checkpoint(in_file)
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        assert (snapshots[1].sequence, snapshots[1].bids, snapshots[1].asks) == \
+            (snapshots[0].sequence, snapshots[0].bids, snapshots[0].asks)
+
+    def test_checkpoint_is_checked(self, tmpdir):
+        path = str(tmpdir.join('book.ckpt'))
+        with open(path, 'wb') as out_file:
+            book = OrderBook(product=PRODUCT)
+            book.reset_book(SNAPSHOT)
+            book.save_checkpoint(out_file)
+        for other in (OrderBook(), OrderBook('ETH-USD', product=dict(PRODUCT, id='ETH-USD')),
+                      OrderBook(product=dict(PRODUCT, base_increment='0.001'))):
+            with open(path, 'rb') as in_file:
+                with pytest.raises(ValueError):
+                    other.load_checkpoint(in_file)
+        restored = OrderBook(product=dict(PRODUCT, quote_increment='0.010'))
+        with open(path, 'rb') as in_file:
+            restored.load_checkpoint(in_file)
+        assert restored.get_bbo() == book.get_bbo()
+
+    def test_error_body_is_not_a_snapshot(self, book):
+        before = book.get_current_book()
+        with pytest.raises(ValueError, match='Rate limit exceeded'):
+            book.reset_book({'message': 'Rate limit exceeded'})
+        # a stream cut short before the asks
+        with pytest.raises(ValueError):
+            book.reset_book(iter([('sequence', 200), ('bids', SNAPSHOT['bids'])]))
+        assert book.get_current_book() == before
+
+
+class TestAggregatedLevels(object):
+
+    def test_no_cut_off_returns_every_level(self, book):
+        assert levels(book.get_aggr_bids()) == [
+            (Decimal('99.99'), Decimal('3.0'), 2),
+            (Decimal('99.98'), Decimal('3.0'), 1),
+            (Decimal('99.95'), Decimal('1.0'), 1),
+            (Decimal('99.90'), Decimal('4.0'), 1),
+        ]
+        assert [level['price'] for level in book.get_aggr_asks()] == [
+            Decimal('100.01'), Decimal('100.02'), Decimal('100.05'), Decimal('100.10')]
+
+    def test_stops_once_past_both_price_and_size(self, book):
+        # 99.95 is more than 0.02 from the touch and 6 > 3 rests before it
+        assert [level['price'] for level in book.get_aggr_bids('0.02', '3')] == [Decimal('99.99'), Decimal('99.98')]
+        # only 7 rests before 99.90, not past 10
+        assert len(book.get_aggr_bids('0.02', '10')) == 4
+        # a price distance alone, or a size alone, does not cut off
+        assert len(book.get_aggr_bids('0.02')) == 4
+        assert len(book.get_aggr_bids(max_size='1')) == 4
+        assert [level['price'] for level in book.get_aggr_asks('0.01', '1')] == [Decimal('100.01'), Decimal('100.02')]
+        assert len(book.get_aggr_asks('0.10', '1')) == 4
+
+    def test_totals_follow_match_change_and_done(self, book):
+        book.on_message(message(101, 'match', side='buy', price='99.99', size='0.4',
+                                maker_order_id='b1', taker_order_id='t1'))
+        book.on_message(message(102, 'change', side='buy', price='99.98', order_id='b3',
+                                new_size='1.0', old_size='3.0'))
+        book.on_message(message(103, 'done', side='sell', price='100.01', order_id='a1',
+                                reason='canceled', remaining_size='1.5'))
+        book.on_message(message(104, 'match', side='sell', price='100.02', size='2.5',
+                                maker_order_id='a2', taker_order_id='t2'))
+        book.on_message(message(105, 'done', side='sell', price='100.02', order_id='a2',
+                                reason='filled', remaining_size='0'))
+        assert levels(book.get_aggr_bids('0.02', '3')) == [
+            (Decimal('99.99'), Decimal('2.6'), 2),
+            (Decimal('99.98'), Decimal('1.0'), 1),
+        ]
+        # 3.6 rests before 99.95 instead of 6, and 4.6 before 99.90 instead of 7
+        assert len(book.get_aggr_bids('0.02', '3.5')) == 2
+        assert len(book.get_aggr_bids('0.02', '4')) == 3
+        assert len(book.get_aggr_bids('0.02', '4.6')) == 4
+        assert levels(book.get_aggr_asks()) == [
+            (Decimal('100.05'), Decimal('1.0'), 1),
+            (Decimal('100.10'), Decimal('2.0'), 1),
+        ]
+        # the distance is now measured from the new best ask
+        assert len(book.get_aggr_asks('0.04', '0.5')) == 1
+
+
+@pytest.fixture
+def indexed_book():
+    order_book = OrderBook(product=PRODUCT, depth_index=True)
+    order_book.reset_book(SNAPSHOT)
+    return order_book
+
+
+class TestDepthIndex(object):
+
+    def check(self, book):
+        bids = book.get_bids_top(1000)
+        asks = book.get_asks_top(1000)
+        total_bids = sum(level[1] for level in bids)
+        total_asks = sum(level[1] for level in asks)
+        for size in ('0.5', '1', '2.75', '7.123', str(total_bids), str(total_asks), '1000'):
+            assert book.get_bids_sweep(size) == brute_sweep(bids, size)
+            assert book.get_asks_sweep(size) == brute_sweep(asks, size)
+            expected = brute_sweep(asks, size)
+            assert book.get_asks_vwap(size) == (None if expected is None else expected / Decimal(size))
+            expected = brute_sweep(bids, size)
+            assert book.get_bids_vwap(size) == (None if expected is None else expected / Decimal(size))
+        for band in ('0', '0.01', '0.05', '0.2', '10'):
+            if bids:
+                assert book.get_bids_depth_within(band) == sum(
+                    level[1] for level in bids if level[0] >= bids[0][0] - Decimal(band))
+            if asks:
+                assert book.get_asks_depth_within(band) == sum(
+                    level[1] for level in asks if level[0] <= asks[0][0] + Decimal(band))
+
+    def test_snapshot(self, indexed_book):
+        self.check(indexed_book)
+        assert indexed_book.get_asks_sweep('2') == Decimal('1.5') * Decimal('100.01') + Decimal('0.5') * Decimal('100.02')
+        assert indexed_book.get_bids_depth_within('0.01') == Decimal('6')
+
+    def test_thin_sides(self, indexed_book):
+        # 11 bid and 7 ask units rest in the snapshot
+        assert indexed_book.get_bids_sweep('11') is not None
+        assert indexed_book.get_bids_sweep('11.00000001') is None
+        assert indexed_book.get_asks_vwap('7.5') is None
+        indexed_book.reset_book({'sequence': 1, 'bids': [], 'asks': [['100.01', '1.0', 'a1']]})
+        assert indexed_book.get_bids_sweep('0.1') is None
+        assert indexed_book.get_bids_depth_within('1') == 0
+        assert indexed_book.get_asks_sweep('1') == Decimal('100.01')
+
+    @pytest.mark.parametrize('seed', range(5))
+    def test_random_messages_match_brute_force(self, indexed_book, seed):
+        rng = random.Random(seed)
+        sequence = 100
+        for round in range(10):
+            for msg in random_messages(indexed_book, rng, 50, sequence):
+                indexed_book.on_message(msg)
+                sequence = msg['sequence']
+            self.check(indexed_book)
+
+    def test_reset_rebuilds_the_index(self, indexed_book):
+        rng = random.Random(7)
+        for msg in random_messages(indexed_book, rng, 200, 100):
+            indexed_book.on_message(msg)
+        # queries net the pending updates; a reset must drop them along with the old levels
+        indexed_book.get_asks_sweep('1')
+        for msg in random_messages(indexed_book, rng, 20, 300):
+            indexed_book.on_message(msg)
+        indexed_book.reset_book(dict(SNAPSHOT, sequence=1000))
+        self.check(indexed_book)
+        assert indexed_book.get_bids_depth_within('10') == Decimal('11')
+        for msg in random_messages(indexed_book, rng, 200, 1000):
+            indexed_book.on_message(msg)
+        self.check(indexed_book)
+
+    def test_needs_fixed_point(self):
+        with pytest.raises(ValueError):
+            OrderBook(depth_index=True)
+        with pytest.raises(ValueError):
+            OrderBook(product=PRODUCT).get_asks_sweep('1')
+
+
+class TestOrderFlowAnalytics(object):
+
+    def top_depth(self, book, levels):
+        return (sum(level[1] for level in book.get_bids_top(levels)),
+                sum(level[1] for level in book.get_asks_top(levels)))
+
+    @pytest.mark.parametrize('product', [None, PRODUCT], ids=['decimal', 'fixed_point'])
+    def test_imbalance_at_the_window_edge(self, product):
+        book = OrderBook(product=product, imbalance_levels=2)
+        book.reset_book(SNAPSHOT)
+        assert book.get_top_depth() == (Decimal('6.0'), Decimal('4.0'))
+        assert book.get_imbalance() == pytest.approx(0.2)
+        # a better level pushes the edge level 99.98 out of the window
+        book.on_message(message(101, 'open', side='buy', price='100.00', order_id='b6', remaining_size='1.0'))
+        assert book.get_top_depth() == (Decimal('4.0'), Decimal('4.0'))
+        assert book.get_imbalance() == 0
+        # sizes change at the edge count, beyond it they do not
+        book.on_message(message(102, 'open', side='buy', price='99.99', order_id='b7', remaining_size='0.5'))
+        book.on_message(message(103, 'open', side='buy', price='99.98', order_id='b8', remaining_size='9.0'))
+        assert book.get_top_depth()[0] == Decimal('4.5')
+        # removing a level inside the window pulls 99.98 back in
+        book.on_message(message(104, 'done', side='buy', price='100.00', order_id='b6', reason='canceled'))
+        assert book.get_top_depth()[0] == Decimal('15.5')
+        # and removing the edge level itself brings in the next one
+        book.on_message(message(105, 'done', side='buy', price='99.98', order_id='b3', reason='canceled'))
+        book.on_message(message(106, 'done', side='buy', price='99.98', order_id='b8', reason='canceled'))
+        assert book.get_top_depth()[0] == Decimal('4.5')
+        # emptying the asks down to one level counts every level that is left
+        book.on_message(message(107, 'match', size='1.5', maker_order_id='a1'))
+        book.on_message(message(108, 'done', side='sell', price='100.05', order_id='a3', reason='canceled'))
+        book.on_message(message(109, 'done', side='sell', price='100.10', order_id='a4', reason='canceled'))
+        assert book.get_top_depth() == (Decimal('4.5'), Decimal('2.5'))
+        assert book.get_top_depth() == self.top_depth(book, 2)
+
+    @pytest.mark.parametrize('seed', range(5))
+    def test_imbalance_matches_brute_force(self, seed):
+        book = OrderBook(product=PRODUCT, imbalance_levels=3)
+        book.reset_book(SNAPSHOT)
+        rng = random.Random(seed)
+        for msg in random_messages(book, rng, 500, 100):
+            book.on_message(msg)
+            assert book.get_top_depth() == self.top_depth(book, 3)
+
+    @pytest.mark.parametrize('product', [None, PRODUCT], ids=['decimal', 'fixed_point'])
+    def test_microprice(self, product):
+        book = OrderBook(product=product)
+        book.reset_book(SNAPSHOT)
+        # the touch prices weighted by the opposite sizes: 99.99 x 1.5 and 100.01 x 3
+        assert float(book.get_microprice()) == pytest.approx((99.99 * 1.5 + 100.01 * 3.0) / 4.5)
+        book.on_message(message(101, 'match', size='1.5', maker_order_id='a1'))
+        assert float(book.get_microprice()) == pytest.approx((99.99 * 2.5 + 100.02 * 3.0) / 5.5)
+        book.reset_book({'sequence': 1, 'bids': SNAPSHOT['bids'], 'asks': []})
+        assert book.get_microprice() is None
+
+    def test_flow_window_expiry(self):
+        now = [0.0]
+        book = OrderBook(flow_window=10, flow_clock=lambda: now[0])
+        book.reset_book(SNAPSHOT)
+        assert book.get_flow_rates()['buy'] == {'add': 0, 'cancel': 0, 'trade': 0}
+
+        book.on_message(message(101, 'open', side='buy', price='99.97', order_id='b6', remaining_size='1.0'))
+        book.on_message(message(102, 'done', side='buy', price='99.99', order_id='b1', reason='canceled'))
+        book.on_message(message(103, 'match', size='0.5', maker_order_id='a1'))
+        rates = book.get_flow_rates()
+        assert rates['buy'] == {'add': pytest.approx(0.1), 'cancel': pytest.approx(0.1), 'trade': 0}
+        assert rates['sell'] == {'add': 0, 'cancel': 0, 'trade': pytest.approx(0.1)}
+        assert book.get_flow_volumes()['sell']['trade'] == pytest.approx(0.05)
+
+        now[0] = 5.0
+        book.on_message(message(104, 'open', side='sell', price='100.03', order_id='a6', remaining_size='2.0'))
+        assert book.get_flow_rates()['buy']['add'] == pytest.approx(0.1)
+        assert book.get_flow_volumes()['sell']['add'] == pytest.approx(0.2)
+
+        # the events at 0s leave the window, those at 5s stay
+        now[0] = 10.2
+        rates = book.get_flow_rates()
+        assert rates['buy'] == {'add': 0, 'cancel': 0, 'trade': 0}
+        assert rates['sell'] == {'add': pytest.approx(0.1), 'cancel': 0, 'trade': 0}
+        now[0] = 15.2
+        assert book.get_flow_volumes()['sell']['add'] == 0
+
+    def test_queries_need_their_option(self, book):
+        with pytest.raises(ValueError):
+            book.get_imbalance()
+        with pytest.raises(ValueError):
+            book.get_flow_rates()
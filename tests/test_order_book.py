@@ -0,0 +1,449 @@
+import io
+import json
+import pytest
+import threading
+import time
+from decimal import Decimal
+
+from websocket import ABNF
+
+from gdax import feed_decoder
+from gdax.order_book import OrderBook
+from gdax.public_client import BookStream, PublicClient
+
+
+SNAPSHOT = {
+    'sequence': 100,
+    'bids': [
+        ['99.99', '1.0', 'b1'],
+        ['99.99', '2.0', 'b2'],
+        ['99.98', '3.0', 'b3'],
+    ],
+    'asks': [
+        ['100.01', '1.5', 'a1'],
+        ['100.02', '2.5', 'a2'],
+    ],
+}
+
+
+PRODUCTS = [
+    {'id': 'BTC-USD', 'quote_increment': '0.01', 'base_increment': '0.00000001'},
+    {'id': 'ETH-USD', 'quote_increment': '0.01', 'base_increment': '0.00000001'},
+    {'id': 'LTC-USD', 'quote_increment': '0.001', 'base_increment': '0.00000001'},
+]
+
+
+@pytest.fixture(params=[(False, 'rbtree'), (True, 'rbtree'), (False, 'sorted_list'), (True, 'skip_list')],
+                ids=['decimal', 'fixed_point', 'sorted_list', 'skip_list'])
+def book(request, monkeypatch):
+    monkeypatch.setattr(PublicClient, 'get_products', lambda self: PRODUCTS)
+    monkeypatch.setattr(PublicClient, 'get_product_order_book', lambda self, product_id, level: SNAPSHOT)
+    fixed_point, levels = request.param
+    order_book = OrderBook(fixed_point=fixed_point, levels=levels)
+    order_book.reset_book()
+    return order_book
+
+
+class FeedSocket(object):
+    ''' Hands out the messages as text frames, then blocks like a quiet feed until closed. '''
+
+    def __init__(self, messages):
+        self.frames = [json.dumps(msg) for msg in messages]
+        self.closed = threading.Event()
+
+    def recv_data(self, control_frame=False):
+        if self.frames:
+            return ABNF.OPCODE_TEXT, self.frames.pop(0)
+        self.closed.wait()
+        raise IOError('closed')
+
+    def ping(self, payload):
+        pass
+
+    def send(self, data):
+        pass
+
+    def close(self):
+        self.closed.set()
+
+    shutdown = close
+
+
+def orders(book, side):
+    return dict((order_id, size) for price, size, order_id in book.get_current_book()[side])
+
+
+def message(sequence, msg_type, **kwargs):
+    kwargs.update({'sequence': sequence, 'type': msg_type})
+    return kwargs
+
+
+class TestOrderBook(object):
+
+    def test_reset_book(self, book):
+        assert book.get_bid() == Decimal('99.99')
+        assert book.get_ask() == Decimal('100.01')
+        assert book.get_current_book()['sequence'] == 100
+        assert [Decimal('99.99'), Decimal('1.0'), 'b1'] in book.get_current_book()['bids']
+
+    def test_reset_book_from_stream(self, book):
+        body = json.dumps(dict(SNAPSHOT, sequence=200)).encode('utf-8')
+        book.reset_book(BookStream(body[i:i + 7] for i in range(0, len(body), 7)))
+        assert book.get_current_book()['sequence'] == 200
+        assert book.get_bbo() == (Decimal('99.99'), Decimal('3.0'), Decimal('100.01'), Decimal('1.5'))
+        assert sorted(orders(book, 'bids')) == ['b1', 'b2', 'b3']
+
+    def test_open_and_done(self, book):
+        book.on_message(message(101, 'open', side='buy', price='100.00', order_id='b4', remaining_size='0.5'))
+        assert book.get_bid() == Decimal('100.00')
+
+        book.on_message(message(102, 'done', side='buy', price='100.00', order_id='b4', reason='canceled'))
+        assert book.get_bid() == Decimal('99.99')
+        assert 'b4' not in orders(book, 'bids')
+
+    def test_done_without_price_is_ignored(self, book):
+        book.on_message(message(101, 'done', side='sell', order_id='a1', reason='filled'))
+        assert book.get_ask() == Decimal('100.01')
+
+    def test_match(self, book):
+        book.on_message(message(101, 'match', side='buy', price='99.99', size='0.4',
+                                maker_order_id='b1', taker_order_id='t1'))
+        assert orders(book, 'bids')['b1'] == Decimal('0.6')
+
+        book.on_message(message(102, 'match', side='buy', price='99.99', size='0.6',
+                                maker_order_id='b1', taker_order_id='t2'))
+        assert sorted(orders(book, 'bids')) == ['b2', 'b3']
+        assert book.get_current_ticker()['sequence'] == 102
+
+    def test_change(self, book):
+        book.on_message(message(101, 'change', side='sell', price='100.02', order_id='a2',
+                                old_size='2.5', new_size='1.0'))
+        assert orders(book, 'asks')['a2'] == Decimal('1.0')
+
+        # market orders are not on the book
+        book.on_message(message(102, 'change', side='sell', order_id='m1', new_funds='5.0'))
+        assert len(book.get_current_book()['asks']) == 2
+
+    def test_old_messages_are_ignored(self, book):
+        book.on_message(message(100, 'done', side='buy', price='99.98', order_id='b3', reason='canceled'))
+        assert 'b3' in orders(book, 'bids')
+
+    def test_bbo_change(self, book):
+        changes = []
+        book.on_bbo_change = lambda *bbo: changes.append(bbo)
+
+        # away from the touch
+        book.on_message(message(101, 'open', side='sell', price='100.05', order_id='a3', remaining_size='1.0'))
+        assert changes == []
+
+        book.on_message(message(102, 'match', side='sell', price='100.01', size='0.5',
+                                maker_order_id='a1', taker_order_id='t1'))
+        assert changes[-1] == (Decimal('99.99'), Decimal('3.0'), Decimal('100.01'), Decimal('1.0'))
+
+        book.on_message(message(103, 'done', side='sell', price='100.01', order_id='a1', reason='canceled'))
+        assert changes[-1] == (Decimal('99.99'), Decimal('3.0'), Decimal('100.02'), Decimal('2.5'))
+        assert book.get_bbo() == changes[-1]
+        assert len(changes) == 2
+
+    def test_bbo_is_not_torn_mid_message(self, book):
+        # a message half-applied on the feed thread: the best bid emptied, not yet removed
+        book.remove({'order_id': 'b1'})
+        book._bid_level.size = 0
+        assert book.get_bbo() == (Decimal('99.99'), Decimal('3.0'), Decimal('100.01'), Decimal('1.5'))
+
+    def test_gap_resyncs_in_background(self, book, monkeypatch):
+        release = threading.Event()
+
+        def get_product_order_book(self, product_id, level):
+            release.wait(5)
+            return dict(SNAPSHOT, sequence=103)
+
+        monkeypatch.setattr(PublicClient, 'get_product_order_book', get_product_order_book)
+        book.on_message(message(102, 'open', side='buy', price='99.90', order_id='b4', remaining_size='1.0'))
+        book.on_message(message(103, 'open', side='buy', price='99.91', order_id='b5', remaining_size='1.0'))
+        book.on_message(message(104, 'open', side='buy', price='100.00', order_id='b6', remaining_size='1.0'))
+        # the old book stays readable while the snapshot is in flight
+        assert book.get_bid() == Decimal('99.99')
+
+        release.set()
+        book._resync_thread.join()
+        book.on_message(message(105, 'open', side='sell', price='100.03', order_id='a3', remaining_size='1.0'))
+        assert book.get_bid() == Decimal('100.00')
+        assert sorted(orders(book, 'bids')) == ['b1', 'b2', 'b3', 'b6']
+        assert 'a3' in orders(book, 'asks')
+        assert book.get_current_book()['sequence'] == 105
+
+    def test_failed_snapshot_retries_with_backoff(self, book, monkeypatch):
+        from gdax import order_book
+        responses = [IOError('rate limited'), IOError('rate limited'), dict(SNAPSHOT, sequence=110)]
+        fetched = []
+        delays = []
+
+        def get_product_order_book(self, product_id, level):
+            fetched.append(time.time())
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        def backoff_delay(attempt):
+            delays.append(attempt)
+            return 0.05
+
+        monkeypatch.setattr(PublicClient, 'get_product_order_book', get_product_order_book)
+        monkeypatch.setattr(order_book, 'backoff_delay', backoff_delay)
+        sequence = 102
+        book.on_message(message(sequence, 'open', side='buy', price='99.90', order_id='b4', remaining_size='1.0'))
+        while responses:
+            book._resync_thread.join()
+            sequence += 1
+            book.on_message(message(sequence, 'open', side='buy', price='99.90', order_id='o%d' % sequence,
+                                    remaining_size='1.0'))
+            if book._resync_thread is not None:
+                # every message so far is kept for the retry
+                assert len(book._resync_queue) == sequence - 101
+        book.on_message(message(111, 'open', side='sell', price='100.03', order_id='a3', remaining_size='1.0'))
+        assert delays == [0, 1]
+        assert fetched[1] - fetched[0] >= 0.05 and fetched[2] - fetched[1] >= 0.05
+        assert book._resync_failures == 0
+        assert book.get_current_book()['sequence'] == 111
+        assert 'a3' in orders(book, 'asks')
+
+    def test_retry_snapshot_behind_the_queue(self, book, monkeypatch):
+        from gdax import order_book
+        responses = [IOError('rate limited'), dict(SNAPSHOT, sequence=102)]
+        monkeypatch.setattr(PublicClient, 'get_product_order_book', lambda self, product_id, level: responses.pop(0))
+        monkeypatch.setattr(order_book, 'backoff_delay', lambda attempt: 0)
+        book.on_message(message(102, 'open', side='buy', price='99.90', order_id='b4', remaining_size='1.0'))
+        book._resync_thread.join()
+        # the failure is noticed here; the retry's snapshot is still behind this message
+        book.on_message(message(103, 'open', side='buy', price='99.91', order_id='b5', remaining_size='1.0'))
+        book._resync_thread.join()
+        book.on_message(message(104, 'open', side='buy', price='99.92', order_id='b6', remaining_size='1.0'))
+        assert not responses
+        assert book._resync_thread is None
+        assert book.sequence == 104
+        assert {'b5', 'b6'} <= set(orders(book, 'bids'))
+
+        # the queue is capped, dropping the oldest messages
+        capped = OrderBook(resync_queue_size=2)
+        for sequence in range(1, 5):
+            capped._resync_queue.append(message(sequence, 'open'))
+        assert [msg['sequence'] for msg in capped._resync_queue] == [3, 4]
+
+    def test_error_body_is_not_a_snapshot(self, book, monkeypatch):
+        with pytest.raises(ValueError):
+            book.reset_book({'message': 'Rate limit exceeded'})
+        with pytest.raises(ValueError):
+            book.reset_book({'sequence': 200, 'bids': []})
+        assert book.get_current_book()['sequence'] == 100
+
+        # in a resync, the error counts as a failed request and the book is retried, not replaced
+        responses = [{'message': 'Rate limit exceeded'}, dict(SNAPSHOT, sequence=103)]
+        monkeypatch.setattr(PublicClient, 'get_product_order_book', lambda self, product_id, level: responses.pop(0))
+        book.on_message(message(102, 'open', side='buy', price='99.90', order_id='b4', remaining_size='1.0'))
+        book._resync_thread.join()
+        book.on_message(message(103, 'open', side='buy', price='99.91', order_id='b5', remaining_size='1.0'))
+        assert book.get_bid() == Decimal('99.99')
+        book._resync_thread.join()
+        book.on_message(message(104, 'open', side='buy', price='100.00', order_id='b6', remaining_size='1.0'))
+        assert not responses
+        assert book.get_current_book()['sequence'] == 104
+        assert book.get_bid() == Decimal('100.00')
+
+    def test_snapshot_for_reader_thread(self, book):
+        snapshots = []
+        reader = threading.Thread(target=lambda: snapshots.append(book.get_snapshot(timeout=5)))
+        # the feed thread is in the middle of a message: the reader waits for its end
+        with book._feed_lock:
+            reader.start()
+            while not book._snapshot_waiters:
+                time.sleep(0.001)
+            book._process_message(message(101, 'open', side='buy', price='100.00', order_id='b4',
+                                          remaining_size='0.5'))
+            reader.join()
+        snapshot = snapshots[0]
+        assert snapshot.sequence == 101
+        assert snapshot.bid_prices()[:2] == [Decimal('100.00'), Decimal('99.99')]
+        assert snapshot.bids[Decimal('100.00')] == ((Decimal('100.00'), Decimal('0.5'), 'b4'),)
+
+        # later changes go into a new snapshot and leave this one alone
+        book.on_message(message(102, 'done', side='buy', price='100.00', order_id='b4', reason='canceled'))
+        assert Decimal('100.00') not in book.get_snapshot().bids
+        assert Decimal('100.00') in snapshot.bids
+
+    def test_reader_gets_the_installed_book_without_messages(self, book):
+        # nothing is copied until a reader asks
+        assert book._snapshot is None and book._dirty is None
+        snapshots = []
+        reader = threading.Thread(target=lambda: snapshots.append(book.get_snapshot(timeout=0.01)))
+        reader.start()
+        reader.join()
+        assert snapshots[0].sequence == 100
+        assert sorted(order[2] for level in snapshots[0].bids.values() for order in level) == ['b1', 'b2', 'b3']
+
+    @pytest.mark.parametrize('buffer_size', [None, 4], ids=['unbuffered', 'buffered'])
+    def test_reader_is_not_held_up_by_a_quiet_feed(self, book, monkeypatch, buffer_size):
+        book.buffer_size = buffer_size
+        socket = FeedSocket([message(101, 'open', side='buy', price='100.00', order_id='b4', remaining_size='0.5'),
+                             message(102, 'open', side='buy', price='99.97', order_id='b5', remaining_size='1.0')])
+        monkeypatch.setattr(book, '_connect', lambda: setattr(book, 'ws', socket))
+        book.start()
+        try:
+            while book.sequence < 102:
+                time.sleep(0.001)
+            for _ in range(2):
+                started = time.time()
+                current_book = book.get_current_book()
+                assert time.time() - started < 0.5
+                assert current_book['sequence'] == 102
+                assert sorted(order[2] for order in current_book['bids']) == ['b1', 'b2', 'b3', 'b4', 'b5']
+        finally:
+            book.close()
+        # and once the feed thread is gone
+        started = time.time()
+        assert book.get_current_book()['sequence'] == 102
+        assert time.time() - started < 0.5
+
+    def test_top_and_range_queries(self, book):
+        assert book.get_bids_top(1) == [(Decimal('99.99'), Decimal('3.0'), 2)]
+        assert book.get_asks_top(5) == [(Decimal('100.01'), Decimal('1.5'), 1), (Decimal('100.02'), Decimal('2.5'), 1)]
+        assert book.get_bids_in_range(Decimal('99.98'), Decimal('99.985')) == [(Decimal('99.98'), Decimal('3.0'), 1)]
+        assert book.get_bids_in_range(Decimal('99.00'), Decimal('101.00')) == book.get_bids_top(2)
+        assert book.get_asks_in_range(Decimal('100.02'), Decimal('100.02')) == [(Decimal('100.02'), Decimal('2.5'), 1)]
+        assert book.get_asks_in_range(Decimal('101.00'), Decimal('102.00')) == []
+
+    def test_queries_from_a_reader_thread(self, book):
+        book.on_message(message(101, 'open', side='buy', price='100.00', order_id='b4', remaining_size='0.5'))
+
+        def query():
+            return [book.get_bids_top(2), book.get_asks_top(5), book.get_bids_in_range('99.98', '99.995'),
+                    book.get_asks_in_range(Decimal('100.015'), Decimal('101'))]
+        results = []
+        reader = threading.Thread(target=lambda: results.extend(query()))
+        reader.start()
+        reader.join()
+        # answered from a snapshot rather than the trees the feed thread changes
+        assert book._snapshot is not None
+        assert results == query()
+        assert results[2] == [(Decimal('99.99'), Decimal('3.0'), 2), (Decimal('99.98'), Decimal('3.0'), 1)]
+        assert results[3] == [(Decimal('100.02'), Decimal('2.5'), 1)]
+
+    def test_current_book_depth(self, book):
+        current_book = book.get_current_book(depth=1)
+        assert current_book['asks'] == [[Decimal('100.01'), Decimal('1.5'), 'a1']]
+        assert sorted(order[2] for order in current_book['bids']) == ['b1', 'b2']
+
+    def test_reset_book_merges_repeated_prices(self, book):
+        book.reset_book(dict(SNAPSHOT, bids=[['99.99', '1.0', 'b1'], ['99.98', '3.0', 'b3'], ['99.99', '2.0', 'b2']]))
+        assert book.get_bids_top(2) == [(Decimal('99.99'), Decimal('3.0'), 2), (Decimal('99.98'), Decimal('3.0'), 1)]
+        assert book.get_bbo() == (Decimal('99.99'), Decimal('3.0'), Decimal('100.01'), Decimal('1.5'))
+
+    def test_validation_rolls_back_to_snapshot_sequence(self, book, monkeypatch):
+        resyncs = []
+        monkeypatch.setattr(book, 'resync', lambda: resyncs.append(book.sequence))
+
+        def validate(level2, messages):
+            book._validation_requested = threading.Event()
+            for msg in messages:
+                book.on_message(msg)
+            book._validation_snapshot = level2
+            book.on_message(message(messages[-1]['sequence'] + 1, 'change', side='buy', order_id='b3', new_size='2.0'))
+            return book.get_validation_stats()['last']
+
+        # the snapshot is taken after 102; 103 and 104 change the book again before it arrives
+        level2 = {'sequence': 102, 'bids': [['100.00', '0.5', 1], ['99.99', '3.0', 2], ['99.98', '3.0', 1]],
+                  'asks': [['100.02', '2.5', 1]]}
+        last = validate(level2, [
+            message(101, 'open', side='buy', price='100.00', order_id='b4', remaining_size='0.5'),
+            message(102, 'done', side='sell', price='100.01', order_id='a1', reason='canceled'),
+            message(103, 'done', side='buy', price='100.00', order_id='b4', reason='canceled'),
+        ])
+        assert last == {'sequence': 102, 'levels': 4, 'mismatched_levels': 0, 'size_difference': 0}
+        assert resyncs == []
+
+        level2 = {'sequence': 106, 'bids': [['99.99', '3.0', 2], ['99.98', '1.0', 1]], 'asks': [['100.02', '2.5', 1]]}
+        last = validate(level2, [message(105, 'open', side='sell', price='100.03', order_id='a3', remaining_size='1.0'),
+                                 message(106, 'open', side='buy', price='99.90', order_id='b5', remaining_size='1.0')])
+        assert (last['mismatched_levels'], last['size_difference']) == (1, Decimal('1.0'))
+        assert resyncs == [107]
+        assert book.get_validation_stats()['divergences'] == 1
+
+    def test_received_messages_are_skipped_on_request(self, monkeypatch):
+        # skipping only applies with the stdlib parser
+        monkeypatch.setattr(feed_decoder, 'PARSERS', [('json', json.loads)])
+        monkeypatch.setattr(PublicClient, 'get_products', lambda self: PRODUCTS)
+        received = message(101, 'received', product_id='BTC-USD', time='2017-11-01T00:00:00.000000Z',
+                           side='buy', price='99.97', size='1.0', order_id='b9', order_type='limit')
+        frame = json.dumps(dict([('type', 'received')] + sorted(received.items())), separators=(',', ':'))
+        assert OrderBook().decoder(frame) == received
+        assert OrderBook(skip_received=True, log_to=io.StringIO()).decoder(frame) == received
+        assert OrderBook(skip_received=True).decoder(frame) == {
+            'type': 'received', 'sequence': 101, 'product_id': 'BTC-USD', 'time': '2017-11-01T00:00:00.000000Z'}
+
+    def test_checkpoint(self, book):
+        book.on_message(message(101, 'open', side='buy', price='100.00', order_id='b4', remaining_size='0.5'))
+        checkpoint = io.BytesIO()
+        book.save_checkpoint(checkpoint)
+
+        restored = OrderBook(fixed_point=book._to_price is not Decimal)
+        restored.load_checkpoint(io.BytesIO(checkpoint.getvalue()))
+        assert restored.get_current_book() == book.get_current_book()
+        assert restored.get_bbo() == (Decimal('100.00'), Decimal('0.5'), Decimal('100.01'), Decimal('1.5'))
+
+        # catches up from the next message
+        restored.on_message(message(102, 'done', side='buy', price='99.99', order_id='b1', reason='canceled'))
+        assert sorted(orders(restored, 'bids')) == ['b2', 'b3', 'b4']
+        assert restored.sequence == 102
+
+    def test_checkpoint_is_checked(self, book):
+        checkpoint = io.BytesIO()
+        book.save_checkpoint(checkpoint)
+        data = checkpoint.getvalue()
+        with pytest.raises(ValueError):
+            book.load_checkpoint(io.BytesIO(data[:-1] + b'x'))
+        with pytest.raises(ValueError):
+            OrderBook(fixed_point=book._to_price is Decimal).load_checkpoint(io.BytesIO(data))
+        fixed_point = book._to_price is not Decimal
+        with pytest.raises(ValueError):
+            OrderBook('ETH-USD', fixed_point=fixed_point).load_checkpoint(io.BytesIO(data))
+        if fixed_point:
+            # another quote increment would read the integer prices as other prices
+            book._product = dict(book._product, quote_increment='0.001')
+            with pytest.raises(ValueError):
+                book.load_checkpoint(io.BytesIO(data))
+
+    def test_checkpoint_survives_start(self, book, monkeypatch):
+        checkpoint = io.BytesIO()
+        book.save_checkpoint(checkpoint)
+        fetches = []
+        monkeypatch.setattr(PublicClient, 'get_product_order_book',
+                            lambda self, product_id, level: fetches.append(product_id) or SNAPSHOT)
+
+        restored = OrderBook(fixed_point=book._to_price is not Decimal)
+        restored.load_checkpoint(io.BytesIO(checkpoint.getvalue()))
+        restored.on_open()
+        restored.on_message(message(101, 'open', side='buy', price='100.00', order_id='b4', remaining_size='0.5'))
+        assert restored.sequence == 101
+
+        # and through a connection
+        restored = OrderBook(fixed_point=book._to_price is not Decimal)
+        restored.load_checkpoint(io.BytesIO(checkpoint.getvalue()))
+        received = threading.Event()
+        on_message = restored.on_message
+
+        def recv_message(msg):
+            on_message(msg)
+            received.set()
+
+        restored.on_message = recv_message
+        socket = FeedSocket([message(101, 'done', side='buy', price='99.99', order_id='b1', reason='canceled')])
+        monkeypatch.setattr(restored, '_connect', lambda: setattr(restored, 'ws', socket))
+        restored.start()
+        try:
+            assert received.wait(5)
+        finally:
+            restored.close()
+        assert restored.sequence == 101
+        assert restored.get_bids_top(1) == [(Decimal('99.99'), Decimal('2.0'), 1)]
+        assert fetches == []
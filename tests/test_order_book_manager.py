@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from gdax.order_book_manager import OrderBookManager
+from gdax.public_client import PublicClient
+
+
+SNAPSHOTS = {
+    'BTC-USD': {'sequence': 100, 'bids': [['99.99', '1.0', 'b1']], 'asks': [['100.01', '1.5', 'a1']]},
+    'ETH-USD': {'sequence': 500, 'bids': [['9.99', '2.0', 'e1']], 'asks': [['10.01', '2.5', 'e2']]},
+}
+
+
+def message(product_id, sequence, msg_type, **kwargs):
+    kwargs.update({'product_id': product_id, 'sequence': sequence, 'type': msg_type})
+    return kwargs
+
+
+class TestOrderBookManager(object):
+
+    def test_routes_by_product(self, monkeypatch):
+        monkeypatch.setattr(PublicClient, 'get_product_order_book',
+                            lambda self, product_id, level: SNAPSHOTS[product_id])
+        manager = OrderBookManager(['BTC-USD', 'ETH-USD'])
+        for product_id in manager.product_ids:
+            manager[product_id].reset_book()
+
+        manager.on_message({'type': 'subscriptions', 'channels': []})
+        manager.on_message(message('BTC-USD', 101, 'open', side='buy', price='100.00', order_id='b2', remaining_size='1.0'))
+        manager.on_message(message('ETH-USD', 501, 'done', side='sell', price='10.01', order_id='e2', reason='canceled'))
+        manager.on_message(message('ETH-USD', 502, 'open', side='sell', price='10.02', order_id='e3', remaining_size='1.0'))
+
+        assert manager['BTC-USD'].get_bid() == Decimal('100.00')
+        assert manager['ETH-USD'].get_ask() == Decimal('10.02')
+        assert manager['ETH-USD'].get_current_book()['sequence'] == 502
+        assert manager.get_message_counts() == {'BTC-USD': 1, 'ETH-USD': 2}
+        assert set(manager.get_message_rates()) == {'BTC-USD', 'ETH-USD'}
+
+    def test_close_stops_validators(self):
+        manager = OrderBookManager(['BTC-USD', 'ETH-USD'], validate_interval=60)
+        manager.on_open()
+        validators = [manager[product_id]._validator[0] for product_id in manager.product_ids]
+        manager.on_close()
+        for product_id, thread in zip(manager.product_ids, validators):
+            assert manager[product_id]._validator is None
+            thread.join(5)
+            assert not thread.is_alive()
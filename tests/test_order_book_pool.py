@@ -0,0 +1,43 @@
+import threading
+from decimal import Decimal
+from multiprocessing import Pipe
+
+from gdax import order_book_pool
+from gdax.order_book_manager import OrderBookManager
+from gdax.public_client import PublicClient
+
+
+SNAPSHOT = {
+    'sequence': 100,
+    'bids': [['99.99', '1.0', 'b1'], ['99.99', '2.0', 'b2'], ['99.98', '3.0', 'b3']],
+    'asks': [['100.01', '1.5', 'a1']],
+}
+
+
+def test_shard_answers_queries(monkeypatch):
+    monkeypatch.setattr(PublicClient, 'get_product_order_book', lambda self, product_id, level: SNAPSHOT)
+    # Load the books instead of connecting
+    monkeypatch.setattr(OrderBookManager, 'start',
+                        lambda self: [self[product_id].reset_book() for product_id in self.product_ids])
+    monkeypatch.setattr(OrderBookManager, 'close', lambda self: None)
+
+    conn, child_conn = Pipe()
+    shard = threading.Thread(target=order_book_pool._run_shard, args=(['BTC-USD', 'ETH-USD'], child_conn, {}))
+    shard.start()
+    pool = order_book_pool.OrderBookPool(['BTC-USD', 'ETH-USD'], num_workers=1)
+    route = (conn, threading.Lock())
+    pool._workers = [(shard, route)]
+    pool._routes = {'BTC-USD': route, 'ETH-USD': route}
+
+    assert pool.get_bbo('ETH-USD') == (Decimal('99.99'), Decimal('3.0'), Decimal('100.01'), Decimal('1.5'))
+    assert pool.get_depth('BTC-USD', 1) == {'sequence': 100,
+                                            'bids': [(Decimal('99.99'), Decimal('3.0'), 2)],
+                                            'asks': [(Decimal('100.01'), Decimal('1.5'), 1)]}
+    assert set(pool.get_message_rates()) == {'BTC-USD', 'ETH-USD'}
+    pool.close()
+    assert not shard.is_alive()
+
+
+def test_shards_are_balanced():
+    pool = order_book_pool.OrderBookPool(['BTC-USD', 'ETH-USD', 'LTC-USD'], num_workers=2)
+    assert pool._shards == [['BTC-USD', 'LTC-USD'], ['ETH-USD']]
@@ -0,0 +1,42 @@
+import pytest
+import random
+
+from gdax.price_levels import LEVEL_BACKENDS, level_backend
+
+
+def call(levels, method, *args):
+    try:
+        return getattr(levels, method)(*args)
+    except (KeyError, ValueError) as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('name', ['sorted_list', 'skip_list'])
+def test_matches_rbtree(name):
+    rnd = random.Random(1)
+    initial = dict((rnd.randrange(500), i) for i in range(100))
+    expected, levels = LEVEL_BACKENDS['rbtree'](initial), level_backend(name)(initial)
+    for step in range(5000):
+        price = rnd.randrange(500)
+        if rnd.random() < 0.5:
+            expected.insert(price, step)
+            levels.insert(price, step)
+        else:
+            expected.discard(price)
+            levels.discard(price)
+        assert len(levels) == len(expected)
+        assert levels.get(price) == expected.get(price)
+        for method in ('min_item', 'max_item'):
+            assert call(levels, method) == call(expected, method)
+        for method in ('floor_item', 'ceiling_item'):
+            assert call(levels, method, price) == call(expected, method, price)
+        if price in expected:
+            for method in ('prev_item', 'succ_item'):
+                assert call(levels, method, price) == call(expected, method, price)
+    assert list(levels.items(reverse=True)) == list(expected.items(reverse=True))
+    assert list(levels.keys()) == list(expected.keys())
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        level_backend('btree')
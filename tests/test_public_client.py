@@ -35,6 +35,13 @@ class TestPublicClient(object):
         if level is 2 and (len(r['asks']) < 50 or len(r['bids']) < 50):
             pytest.fail('Fail: Level 3 should return the full order book')
 
+    def test_get_product_order_book_stream(self, client):
+        r = dict((key, list(value) if key in ('bids', 'asks') else value)
+                 for key, value in client.get_product_order_book_stream('BTC-USD'))
+        assert 'sequence' in r
+        assert len(r['bids'][0]) == 3
+        assert len(r['asks'][0]) == 3
+
     def test_get_product_ticker(self, client):
         r = client.get_product_ticker('BTC-USD')
         assert type(r) is dict
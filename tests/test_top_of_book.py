@@ -0,0 +1,46 @@
+from gdax.order_book import OrderBook
+from gdax.public_client import PublicClient
+from gdax.top_of_book import TopOfBookReader, TopOfBookWriter
+
+
+SNAPSHOT = {
+    'sequence': 100,
+    'bids': [['99.99', '1.0', 'b1'], ['99.99', '2.0', 'b2']],
+    'asks': [['100.01', '1.5', 'a1']],
+}
+
+
+class TestTopOfBook(object):
+
+    def test_publish_and_read(self, tmpdir):
+        path = str(tmpdir.join('btc-usd.tob'))
+        writer = TopOfBookWriter(path)
+        reader = TopOfBookReader(path)
+        assert reader.read() is None
+
+        writer.publish(7, '99.5', '1.25', None, None)
+        top = reader.read()
+        assert (top.sequence, top.bid, top.bid_size, top.ask, top.last_price) == (7, 99.5, 1.25, None, None)
+        assert reader.version() == 2
+
+        # a restarted writer carries on from the last version
+        TopOfBookWriter(path).publish(8, 1, 1, 2, 2, 1.5, 0.1)
+        assert reader.read()[:7] == (8, 1.0, 1.0, 2.0, 2.0, 1.5, 0.1)
+        assert reader.version() == 4
+
+    def test_order_book_publishes(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(PublicClient, 'get_product_order_book', lambda self, product_id, level: SNAPSHOT)
+        path = str(tmpdir.join('btc-usd.tob'))
+        book = OrderBook(top_of_book_path=path)
+        book.reset_book()
+        reader = TopOfBookReader(path)
+        assert reader.read()[:5] == (100, 99.99, 3.0, 100.01, 1.5)
+
+        book.on_message({'sequence': 101, 'type': 'open', 'side': 'sell', 'price': '100.05',
+                         'order_id': 'a2', 'remaining_size': '1.0'})
+        # away from the touch, nothing to publish
+        assert reader.read().sequence == 100
+
+        book.on_message({'sequence': 102, 'type': 'match', 'side': 'sell', 'price': '100.01', 'size': '0.5',
+                         'maker_order_id': 'a1', 'taker_order_id': 't1'})
+        assert reader.read()[:7] == (102, 99.99, 3.0, 100.01, 1.0, 100.01, 0.5)
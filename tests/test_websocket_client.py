@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+
+import pytest
+from websocket import ABNF
+
+from gdax.websocket_client import WebsocketClient
+
+
+class FakeSocket(object):
+    ''' Hands out the first frame, the rest once `gate` is set, then blocks until closed like a quiet feed. '''
+
+    def __init__(self, frames, gate):
+        self.frames = list(frames)
+        self.gate = gate
+        self.closed = threading.Event()
+        self.sent = 0
+
+    def recv_data(self, control_frame=False):
+        if self.sent:
+            self.gate.wait()
+        if self.frames:
+            self.sent += 1
+            return ABNF.OPCODE_TEXT, self.frames.pop(0)
+        self.closed.wait()
+        raise IOError('closed')
+
+    def ping(self, payload):
+        pass
+
+    def send(self, data):
+        pass
+
+    def close(self):
+        self.closed.set()
+
+    shutdown = close
+
+
+class SlowClient(WebsocketClient):
+    ''' Holds up the first message until released, so the receive stage runs ahead. '''
+
+    def __init__(self, **kwargs):
+        super(SlowClient, self).__init__(**kwargs)
+        self.messages = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.done = threading.Event()
+
+    def on_message(self, msg):
+        self.entered.set()
+        self.release.wait()
+        self.messages.append(msg)
+        if msg['sequence'] == 9:
+            self.done.set()
+
+    def on_open(self):
+        pass
+
+    def on_close(self):
+        pass
+
+
+class FlakyClient(WebsocketClient):
+    ''' Counts connections, reconnects and closes; done once sequence 2 arrives. '''
+
+    def __init__(self, **kwargs):
+        super(FlakyClient, self).__init__(**kwargs)
+        self.connects = 0
+        self.reconnected = 0
+        self.closes = 0
+        self.stop_at = None
+        self.done = threading.Event()
+
+    def on_message(self, msg):
+        if msg['sequence'] == self.stop_at:
+            self.stop = True
+        if msg['sequence'] == 2:
+            self.done.set()
+
+    def on_error(self, e, data=None):
+        self.error = e
+        self.stop = True
+
+    def on_reconnect(self):
+        self.reconnected += 1
+
+    def on_open(self):
+        pass
+
+    def on_close(self):
+        self.closes += 1
+
+
+class FailingClient(WebsocketClient):
+    ''' Raises from on_message and records what on_error is handed. '''
+
+    def __init__(self, **kwargs):
+        super(FailingClient, self).__init__(**kwargs)
+        self.errors = []
+        self.failed = threading.Event()
+
+    def on_message(self, msg):
+        raise KeyError('price')
+
+    def on_error(self, e, data=None):
+        self.error = e
+        self.stop = True
+        self.errors.append((e, data))
+        self.failed.set()
+
+    def on_open(self):
+        pass
+
+    def on_close(self):
+        pass
+
+
+class TestWebsocketClient(object):
+
+    def test_buffered_receive_absorbs_slow_consumer(self, monkeypatch):
+        frames = [json.dumps({'type': 'open', 'sequence': i}) for i in range(10)]
+        client = SlowClient(buffer_size=4, should_print=False)
+        socket = FakeSocket(frames, client.entered)
+        monkeypatch.setattr(client, '_connect', lambda: setattr(client, 'ws', socket))
+        client.start()
+        try:
+            # the processing thread holds the first frame; the buffer keeps only the last 4 of the rest
+            while client.get_buffer_stats()['received'] < 10:
+                time.sleep(0.001)
+            stats = client.get_buffer_stats()
+            assert stats['capacity'] == 4
+            assert stats['depth'] == 4
+            assert stats['overflows'] == 5
+            assert client.message_thread is not client.thread
+
+            client.release.set()
+            assert client.done.wait(5)
+            assert [msg['sequence'] for msg in client.messages] == [0, 6, 7, 8, 9]
+            stats = client.get_buffer_stats()
+            assert stats['processed'] == 5
+            assert stats['depth'] == 0
+            assert stats['max_lag'] > 0
+        finally:
+            client.release.set()
+            client.close()
+
+    def test_reconnects_after_an_error(self, monkeypatch):
+        client = FlakyClient(should_print=False, reconnect_delay=0.01)
+        gate = threading.Event()
+        gate.set()
+        # the first two connections fail on a malformed frame
+        sockets = [FakeSocket([json.dumps({'type': 'open', 'sequence': i}), 'not json'], gate) for i in range(2)]
+        sockets.append(FakeSocket([json.dumps({'type': 'open', 'sequence': 2})], gate))
+
+        def connect():
+            client.ws = sockets[client.connects]
+            client.connects += 1
+        monkeypatch.setattr(client, '_connect', connect)
+        client.start()
+        try:
+            assert client.done.wait(5)
+            assert client.connects == 3
+            assert client.reconnects == 2
+            assert client.reconnected == 2
+            assert client.error is None
+        finally:
+            client.close()
+        assert not client.thread.is_alive()
+        assert client.connects == 3
+        assert client.closes == 1
+
+    def test_stop_from_a_hook_does_not_reconnect(self, monkeypatch):
+        client = FlakyClient(should_print=False)
+        client.stop_at = 0
+        socket = FakeSocket([json.dumps({'type': 'open', 'sequence': 0})], threading.Event())
+        monkeypatch.setattr(client, '_connect', lambda: setattr(client, 'ws', socket))
+        client.start()
+        client.thread.join(5)
+        assert not client.thread.is_alive()
+        assert client.reconnects == 0
+        assert client.closes == 1
+
+    def test_unbuffered_has_no_stats(self):
+        assert WebsocketClient(should_print=False).get_buffer_stats() is None
+
+    @pytest.mark.parametrize('buffer_size', [None, 4], ids=['unbuffered', 'buffered'])
+    def test_failing_on_message_goes_to_on_error(self, monkeypatch, buffer_size):
+        client = FailingClient(should_print=False, reconnect=False, buffer_size=buffer_size)
+        frame = json.dumps({'type': 'open', 'sequence': 0})
+        gate = threading.Event()
+        gate.set()
+        socket = FakeSocket([frame], gate)
+        monkeypatch.setattr(client, '_connect', lambda: setattr(client, 'ws', socket))
+        client.start()
+        try:
+            assert client.failed.wait(5)
+            [(error, data)] = client.errors
+            assert isinstance(error, KeyError)
+            assert data == frame
+            assert client.stop
+        finally:
+            client.close()
+        assert not client.thread.is_alive()